@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the plate recognition pipeline.
+
+Feeds recorded video files or image folders through prepare_frame and
+PlateRecognitionEngine.detect, the calls the camera loops make (detect ->
+crop quality and tracking -> OCR), then the gate decision, without MongoDB
+or door controllers. Stage timings come from the engine's trace, and the
+engine runs on video time so cooldown and tracking behave as on a camera.
+Prints a JSON report with throughput, per-stage latency percentiles,
+CPU/RSS usage and plate accuracy.
+
+Each still image in a folder is treated as a separate car seen once.
+
+Usage:
+    python benchmark.py recordings/gate1.mp4 recordings/night_images/ \\
+        --truth truth.csv --plates plates.json --output results/build-123.json
+
+Ground truth CSV columns: source,frame,plate
+    source  file name of the video or image (no directory)
+    frame   frame index inside a video; informational only
+    plate   expected plate text, e.g. 34ABC123
+
+Accuracy is scored per source: an expected plate counts as found when the
+engine read it anywhere in that source, and any other read is a false read.
+"""
+
+import argparse
+import csv
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+# server.py reads these at import time; the benchmark never talks to MongoDB.
+# Gate decisions come from the in-memory access policy loaded from --plates.
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+import cv2
+import numpy as np
+import psutil
+
+import server
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+STAGES = ["capture", "resize", "detect", "quality", "ocr", "inference", "lookup", "total"]
+
+
+# ==================== HELPERS ====================
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """Latency summary in milliseconds."""
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+    }
+
+
+def score_reads(truth: Dict[str, Set[str]], reads: List[Dict[str, Any]]) -> Dict[str, Any]:
+    expected = sum(len(plates) for plates in truth.values())
+    found: Set[Tuple[str, str]] = set()
+    false_reads = repeat_reads = 0
+    for read in reads:
+        key = (read["source"], read["plate"])
+        if read["plate"] not in truth.get(read["source"], ()):
+            false_reads += 1
+        elif key in found:
+            repeat_reads += 1
+        else:
+            found.add(key)
+    return {
+        "expected_plates": expected,
+        "found": len(found),
+        "accuracy": round(len(found) / expected, 4) if expected else None,
+        "false_reads": false_reads,
+        "repeat_reads": repeat_reads,  # the same car read more than once
+    }
+
+
+def load_truth(path: Optional[str]) -> Dict[str, Set[str]]:
+    """Expected plates per source. The frame column is informational: the engine
+    reads each car once, on the frame with its best crop, so reads are matched
+    per source rather than per labelled frame."""
+    truth: Dict[str, Set[str]] = {}
+    if not path:
+        return truth
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            truth.setdefault(row["source"].strip(), set()).add(row["plate"].replace(" ", "").upper())
+    return truth
+
+
+def load_plates(path: Optional[str]) -> List[Dict[str, Any]]:
+    """Registered plates for the access policy, as exported by /api/plates/export?format=ndjson."""
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".ndjson"):
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def iter_frames(source: Path) -> Iterator[Tuple[str, Optional[int], Optional[np.ndarray], float, float]]:
+    """Yield (source name, frame index, frame, capture seconds, media time) for a video or image folder."""
+    if source.is_dir():
+        for image_path in sorted(source.iterdir()):
+            if image_path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            started = time.perf_counter()
+            frame = cv2.imread(str(image_path))
+            yield image_path.name, None, frame, time.perf_counter() - started, 0.0
+        return
+
+    cap = cv2.VideoCapture(str(source))
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {source}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    index = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            ret, frame = cap.read()
+            elapsed = time.perf_counter() - started
+            if not ret:
+                break
+            yield source.name, index, frame, elapsed, index / fps
+            index += 1
+    finally:
+        cap.release()
+
+
+class MediaClock:
+    """Engine clock that follows the recording instead of the wall.
+
+    Cooldown, crop deferral and track timeouts are defined in seconds of
+    camera time; the benchmark runs faster or slower than real time, so the
+    engine reads this instead of time.time(). Sources are laid out one
+    after another with a gap longer than any of those timers, so nothing
+    carries over from one recording (or still image) to the next.
+    """
+
+    def __init__(self, gap: float):
+        self.gap = gap
+        self.base = 0.0
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def seek(self, media_time: float):
+        self.now = self.base + media_time
+
+    def next_source(self):
+        self.base = self.now + self.gap
+        self.now = self.base
+
+
+# ==================== BENCHMARK ====================
+
+def run_benchmark(args) -> Dict[str, Any]:
+    records = load_plates(args.plates)
+    if args.door is None:
+        # No door to evaluate at: door restrictions would turn every restricted plate into door_not_permitted
+        records = [dict(record, door_ids=None) for record in records]
+    server.auth_snapshot.load(records, [], [])
+    server.CROP_QUALITY_ENABLED = args.quality
+    engine = server.plate_engine
+    engine.initialize()
+    if not engine.initialized:
+        raise SystemExit("Plate model could not be loaded (see log above)")
+    if args.cooldown is not None:
+        engine.detection_cooldown = args.cooldown
+    clock = engine.clock = MediaClock(gap=engine.detection_cooldown + server.PLATE_TRACK_TIMEOUT
+                                      + server.CROP_DEFER_SECONDS + 1.0)
+
+    truth = load_truth(args.truth)
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    process = psutil.Process()
+    rss_peak = process.memory_info().rss
+    cpu_start = process.cpu_times()
+    wall_start = time.perf_counter()
+
+    frames = processed = 0
+    statuses = {"allowed": 0, "blocked": 0, "unknown": 0}
+    crop_decisions = {"accept": 0, "defer": 0, "reject": 0}
+    results = []
+
+    def record(name: str, index: Optional[int], detection: Optional[Dict[str, Any]]):
+        if not detection:
+            return
+        started = time.perf_counter()
+        status = server.auth_snapshot.decide(detection["plate"], door_id=args.door)["status"]
+        timings["lookup"].append(time.perf_counter() - started)
+        statuses[status] += 1
+        results.append({"source": name, "frame": index, "plate": detection["plate"], "status": status})
+
+    def finish(name: Optional[str]):
+        # The car has left: the engine reads a deferred crop, as the camera loop would on the next frame
+        if name is not None:
+            record(name, None, engine.end_track(name))
+            clock.next_source()
+
+    # Runs engine.detect exactly as the camera loops call it; only the clock and sampling differ
+    current = None
+    for source in args.sources:
+        for name, index, frame, capture_time, media_time in iter_frames(Path(source)):
+            if args.max_frames and frames >= args.max_frames:
+                break
+            if name != current or index is None:
+                finish(current)
+                current = name
+            clock.seek(media_time)
+            frames += 1
+            if frame is None:
+                continue
+            frame_start = time.perf_counter() - capture_time
+            timings["capture"].append(capture_time)
+
+            started = time.perf_counter()
+            frame = server.prepare_frame(frame)
+            timings["resize"].append(time.perf_counter() - started)
+
+            if index is not None and index % args.every != 0:
+                continue
+            processed += 1
+
+            trace: Dict[str, Any] = {}
+            detection = engine.detect(frame, name, trace)
+            for stage, key in (("detect", "locate"), ("quality", "quality"), ("ocr", "ocr"), ("inference", "inference")):
+                if key in trace:
+                    timings[stage].append(trace[key])
+            if "decision" in trace:
+                crop_decisions[trace["decision"]] += 1
+            record(name, index, detection)
+
+            timings["total"].append(time.perf_counter() - frame_start)
+            rss_peak = max(rss_peak, process.memory_info().rss)
+    finish(current)
+
+    wall = time.perf_counter() - wall_start
+    cpu_end = process.cpu_times()
+    cpu_seconds = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "label": args.label,
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "cpu_count": psutil.cpu_count(),
+        },
+        "config": {
+            "sources": args.sources,
+            "every": args.every,
+            "cooldown": engine.detection_cooldown,
+            "door": args.door,
+            "quality": args.quality,
+            "engine": engine.current_engine,
+            "compute_mode": engine.compute_mode,
+        },
+        "frames": frames,
+        "frames_processed": processed,
+        "plates_recognised": len(results),
+        "statuses": statuses,
+        "crop_decisions": crop_decisions,
+        "wall_seconds": round(wall, 3),
+        "fps": round(frames / wall, 2) if wall else 0.0,
+        "inference_fps": round(processed / wall, 2) if wall else 0.0,
+        "stages": {stage: summarize(values) for stage, values in timings.items()},
+        "resources": {
+            "cpu_seconds": round(cpu_seconds, 3),
+            "cpu_percent": round(cpu_seconds / wall * 100, 1) if wall else 0.0,
+            "rss_peak_mb": round(rss_peak / (1024 ** 2), 1),
+        },
+    }
+    if truth:
+        report["accuracy"] = score_reads(truth, results)
+    if args.include_reads:
+        report["reads"] = results
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the plate recognition pipeline on recorded media")
+    parser.add_argument("sources", nargs="+", help="Video files or folders of images")
+    parser.add_argument("--truth", help="Ground truth CSV (source,frame,plate)")
+    parser.add_argument("--plates", help="JSON list or NDJSON export of plate records for gate decisions")
+    parser.add_argument("--door", help="Door id the recorded camera opens; decides door_ids rules. "
+                                           "Without it door restrictions are ignored")
+    parser.add_argument("--every", type=int, default=5, help="Run detection on every Nth frame (the camera loops adapt this per camera, see SAMPLING_*)")
+    parser.add_argument("--cooldown", type=float, help="Override the engine's detection cooldown (seconds of video)")
+    parser.add_argument("--no-quality", dest="quality", action="store_false",
+                        help="Send every crop to OCR, skipping quality scoring, rectification and upscaling")
+    parser.add_argument("--max-frames", type=int, default=0, help="Stop after this many frames")
+    parser.add_argument("--label", default="", help="Free-form build label stored in the report")
+    parser.add_argument("--include-reads", action="store_true", help="Include every plate read in the report")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+    args.every = max(1, args.every)
+
+    report = run_benchmark(args)
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        sys.stdout.write(payload + "\n")
+
+
+if __name__ == "__main__":
+    main()
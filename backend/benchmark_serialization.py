@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for the list endpoints.
+
+Builds synthetic plates, cameras and detections shaped like the stored
+documents and times how long it takes to turn them into a response body:
+
+    response_model  what FastAPI does for a handler returning raw dicts with
+                    response_model=List[...]: validate every document into
+                    the model, serialize it back to JSON-able Python, then
+                    encode with the standard json module (JSONResponse)
+    fast_json       the same list handed to FastJSONResponse (the /api
+                    default; orjson when installed)
+    stream          stream_json_array as used by GET /plates and /detections:
+                    no validation, documents encoded one by one from the cursor
+
+Reports per-endpoint latency percentiles and body size as JSON, reusing the
+helpers of benchmark.py. No MongoDB is needed.
+
+Usage:
+    python benchmark_serialization.py --count 1000 --image-kb 40 --repeat 20 \\
+        --output results/serialization.json
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from benchmark import summarize  # also sets the MongoDB defaults server.py needs at import
+
+import server
+
+VARIANTS = ["response_model", "fast_json", "stream"]
+
+
+# ==================== FIXTURES ====================
+
+def make_plates(count: int) -> List[Dict[str, Any]]:
+    docs = []
+    for i in range(count):
+        plate = server.Plate(
+            site_id="site-1",
+            block_name=f"{chr(65 + i % 6)} Blok",
+            apartment_number=str(i % 40 + 1),
+            owner_name=f"Sakin {i}",
+            plates=[f"34ABC{i:03d}"[:8], f"06XY{i:04d}"[:8]][: 1 + i % 2],
+            valid_until="2030-12-31",
+            status="allowed" if i % 10 else "blocked",
+            schedule=[server.AccessWindow(days=[0, 1, 2, 3, 4], start="07:00", end="22:00")] if i % 3 == 0 else None,
+        )
+        docs.append(plate.model_dump())
+    return docs
+
+
+def make_cameras(count: int) -> List[Dict[str, Any]]:
+    return [
+        server.Camera(name=f"Kamera {i}", type="rtsp", url=f"rtsp://10.0.0.{i % 250}/stream", door_id="door-1",
+                      position=i % 4).model_dump()
+        for i in range(count)
+    ]
+
+
+def make_detections(count: int, image_kb: int) -> List[Dict[str, Any]]:
+    # Random bytes do not compress, like a real JPEG
+    image = base64.b64encode(os.urandom(image_kb * 1024)).decode("ascii") if image_kb else None
+    now = datetime.now(timezone.utc)
+    statuses = ["allowed", "blocked", "unknown"]
+    return [
+        server.Detection(
+            camera_id=f"camera-{i % 4}",
+            plate=f"34ABC{i % 1000:03d}",
+            status=statuses[i % 3],
+            confidence=round(random.uniform(0.5, 0.99), 3),
+            timestamp=now - timedelta(seconds=i * 7),
+            image_base64=image,
+            owner_info={"owner_name": f"Sakin {i}", "apartment": str(i % 40)} if i % 3 == 0 else None,
+            reason="registered" if i % 3 == 0 else "not registered",
+            visit_id=str(uuid.uuid4()),
+        ).model_dump()
+        for i in range(count)
+    ]
+
+
+# ==================== VARIANTS ====================
+
+def response_model_body(adapter: TypeAdapter, docs: List[Dict[str, Any]]) -> bytes:
+    # FastAPI's serialize_response: validate, dump in JSON mode, then JSONResponse encodes
+    content = adapter.dump_python(adapter.validate_python(docs), mode="json")
+    return JSONResponse(content).body
+
+
+def fast_json_body(docs: List[Dict[str, Any]]) -> bytes:
+    return server.FastJSONResponse(docs).body
+
+
+async def stream_body(docs: List[Dict[str, Any]]) -> bytes:
+    async def cursor():
+        for doc in docs:
+            yield doc
+    return b"".join([chunk async for chunk in server.stream_json_array(cursor())])
+
+
+def measure(fn: Callable[[], bytes], repeat: int) -> Dict[str, Any]:
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn())
+        timings.append(time.perf_counter() - started)
+    return {**summarize(timings), "bytes": size}
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    endpoints = {
+        "plates": (server.Plate, make_plates(args.count)),
+        "cameras": (server.Camera, make_cameras(min(args.count, 64))),
+        "detections": (server.Detection, make_detections(args.count, args.image_kb)),
+    }
+    results = {}
+    # One loop for every stream run: asyncio.run would time loop setup and teardown too,
+    # which a server with a running loop never pays per response
+    loop = asyncio.new_event_loop()
+    try:
+        for name, (model, docs) in endpoints.items():
+            adapter = TypeAdapter(List[model])
+            # Same documents, same JSON values: only the encoding path differs
+            assert json.loads(fast_json_body(docs)) == json.loads(loop.run_until_complete(stream_body(docs)))
+            variants = {
+                "response_model": measure(lambda: response_model_body(adapter, docs), args.repeat),
+                "fast_json": measure(lambda: fast_json_body(docs), args.repeat),
+                "stream": measure(lambda: loop.run_until_complete(stream_body(docs)), args.repeat),
+            }
+            baseline = variants["response_model"]["mean_ms"]
+            for variant in variants.values():
+                variant["speedup"] = round(baseline / variant["mean_ms"], 2) if variant["mean_ms"] else None
+            results[name] = {"documents": len(docs), "variants": variants}
+    finally:
+        loop.close()
+
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "label": args.label,
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "orjson": server.orjson is not None,
+        },
+        "config": {"count": args.count, "image_kb": args.image_kb, "repeat": args.repeat},
+        "endpoints": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark response serialization of the list endpoints")
+    parser.add_argument("--count", type=int, default=1000, help="Documents per list (cameras are capped at 64)")
+    parser.add_argument("--image-kb", type=int, default=40, help="Size of each detection's embedded JPEG; 0 for none")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per endpoint and variant")
+    parser.add_argument("--label", default="", help="Free-form build label stored in the report")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+    args.repeat = max(1, args.repeat)
+
+    report = run_benchmark(args)
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        sys.stdout.write(payload + "\n")
+
+
+if __name__ == "__main__":
+    main()
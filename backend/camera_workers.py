@@ -0,0 +1,493 @@
+"""
+Process-based camera workers.
+
+With CAMERA_WORKER_MODE=process every camera gets its own capture process and
+plate inference runs in a small pool of inference processes, so decoding,
+YOLO and OCR spread across cores instead of sharing the API process' GIL.
+Each camera always feeds the same inference process, which holds its
+plate track and detection cooldown.
+
+    capture process --frame--> FrameRing (shared memory) --slot/seq--> inference process
+          |                                                                  |
+          +------ preview JPEGs ------> result queue <------ plate reads -----+
+
+Frames never go through pickle: a capture process writes each frame into its
+own ring of shared-memory slots and only the sequence number travels over the
+inference queue. Each slot starts with the sequence of the frame it holds,
+written after the pixels, so a reader can tell when the slot was overwritten
+while it was copying and drop the stale frame.
+
+This module is what the child processes import, so it stays free of the API
+server and its dependencies; only the inference processes load server.py,
+for the plate engine.
+"""
+
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_SHAPE = (480, 640, 3)  # processing resolution, see prepare_frame
+RING_IDLE_SECONDS = 30  # inference processes detach from rings unused this long
+
+# ==================== CAPTURE ====================
+
+# Per-camera capture settings (see the Camera model); copied into the camera state
+CAPTURE_OPTIONS = ("decoder", "pipeline", "substream_url", "decode_width", "decode_height",
+                   "frame_skip", "keyframes_only", "hw_accel")
+
+CAPTURE_BACKENDS = {"auto": cv2.CAP_ANY, "ffmpeg": cv2.CAP_FFMPEG, "gstreamer": cv2.CAP_GSTREAMER}
+
+def gstreamer_pipeline(url: str, width: Optional[int] = None, height: Optional[int] = None,
+                       keyframes_only: bool = False) -> str:
+    """GStreamer pipeline ending in a BGR appsink, for cv2.CAP_GSTREAMER.
+
+    Scaling happens right after the decoder, before the BGR conversion, and
+    keyframes_only drops delta frames before they reach the decoder at all.
+    decodebin picks a hardware decoder when one is installed.
+    """
+    if url.startswith("rtsp://"):
+        source = f'rtspsrc location="{url}" latency=100 protocols=tcp'
+    elif url.startswith(("http://", "https://")):
+        source = f'souphttpsrc location="{url}" is-live=true'
+    else:
+        source = f'filesrc location="{url}"'
+    stages = [source, "parsebin"]
+    if keyframes_only:
+        stages.append("identity drop-buffer-flags=delta-unit")
+    stages += ["decodebin", "videoconvert", "videoscale"]
+    caps = "video/x-raw,format=BGR"
+    if width and height:
+        caps += f",width={width},height={height}"
+    stages += [caps, "appsink drop=true max-buffers=1 sync=false"]
+    return " ! ".join(stages)
+
+_ffmpeg_options_lock = threading.Lock()
+
+def open_ffmpeg_capture(url: str, options: Optional[str], hw_accel: bool) -> cv2.VideoCapture:
+    """Open through FFmpeg, with per-camera demuxer options such as "rtsp_transport;tcp|fflags;nobuffer"."""
+    params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY] if hw_accel else []
+    if not options:
+        return cv2.VideoCapture(url, cv2.CAP_FFMPEG, params)
+    # OpenCV only reads FFmpeg options from this process-wide variable, at open time
+    with _ffmpeg_options_lock:
+        previous = os.environ.get("OPENCV_FFMPEG_CAPTURE_OPTIONS")
+        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = options
+        try:
+            return cv2.VideoCapture(url, cv2.CAP_FFMPEG, params)
+        finally:
+            if previous is None:
+                os.environ.pop("OPENCV_FFMPEG_CAPTURE_OPTIONS", None)
+            else:
+                os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = previous
+
+def open_camera_capture(camera_id: str, camera: Dict[str, Any]) -> Optional[cv2.VideoCapture]:
+    """Open a camera source with its capture options, returning None when it is not reachable."""
+    cap = None
+    camera_type = camera["type"]
+    # Processing runs at 640x480, so a camera's low resolution substream is enough
+    camera_url = camera.get("substream_url") or camera["url"]
+    decoder = camera.get("decoder") or "auto"
+    width, height = camera.get("decode_width"), camera.get("decode_height")
+    try:
+        if camera_type == "webcam":
+            # Try to parse as int for webcam index
+            try:
+                cam_index = int(camera_url)
+                cap = cv2.VideoCapture(cam_index)
+            except:
+                cap = cv2.VideoCapture(camera_url)
+            if cap.isOpened() and width and height:
+                # Let the device deliver the smaller frames instead of scaling them here
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        elif camera_type == "synthetic":
+            cap = SyntheticCapture(camera_id, camera)
+        elif camera_type in ["rtsp", "http"]:
+            if decoder == "gstreamer":
+                pipeline = camera.get("pipeline") or gstreamer_pipeline(
+                    camera_url, width, height, camera.get("keyframes_only", False)
+                )
+                cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+            elif decoder == "ffmpeg":
+                cap = open_ffmpeg_capture(camera_url, camera.get("pipeline"), camera.get("hw_accel", False))
+            else:
+                params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY] if camera.get("hw_accel") else []
+                cap = cv2.VideoCapture(camera_url, CAPTURE_BACKENDS["auto"], params)
+            if cap.isOpened():
+                # Keep the backend from queueing frames we would only read late
+                cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        if cap and cap.isOpened():
+            logger.info(f"Camera {camera_id} connected successfully ({decoder} decoder)")
+            return cap
+        
+        logger.warning(f"Camera {camera_id} connection failed, using demo mode")
+        if cap:
+            cap.release()
+    except Exception as e:
+        logger.error(f"Camera {camera_id} error during initialization: {e}")
+    return None
+
+def read_frame(cap: cv2.VideoCapture, frame_skip: int = 0) -> Tuple[bool, Optional[np.ndarray]]:
+    """Read the next frame, first discarding frame_skip frames with grab().
+
+    grab() skips the BGR conversion and copy of frames that would be thrown
+    away; with keyframes_only on GStreamer the skipped frames are never
+    decoded at all.
+    """
+    for _ in range(frame_skip):
+        if not cap.grab():
+            return False, None
+    return cap.read()
+
+def render_demo_frame(camera_id: str, camera_data: Dict[str, Any]) -> np.ndarray:
+    """Paint the placeholder frame shown while a camera is unreachable."""
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    color = (
+        hash(camera_id) % 100 + 50,
+        (hash(camera_id) * 2) % 100 + 50,
+        (hash(camera_id) * 3) % 100 + 50
+    )
+    frame[:] = color
+    cv2.putText(frame, f"DEMO MODE - {camera_data['name']}", (10, 30),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(frame, f"Camera not accessible", (10, 60),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+    cv2.putText(frame, f"URL: {camera_data['url']}", (10, 90),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
+    return frame
+
+def prepare_frame(frame: np.ndarray) -> np.ndarray:
+    """Resize a captured frame to the processing resolution."""
+    if frame is not None and frame.shape[0] > 0 and frame.shape[:2] != (480, 640):
+        frame = cv2.resize(frame, (640, 480))
+    return frame
+
+# ==================== SAMPLING ====================
+
+ACTIVITY_SIZE = (80, 60)  # frames are compared at this size; enough to see a car, cheap to diff
+ACTIVITY_PIXEL_DELTA = 20  # grey levels a pixel must change by to count as motion
+ACTIVITY_FULL_SCALE = 0.02  # share of moving pixels that counts as full activity
+
+def measure_activity(frame: np.ndarray, previous: Optional[np.ndarray]) -> Tuple[float, np.ndarray]:
+    """Scene activity in [0, 1] from the difference to the previous frame, plus this frame's thumbnail."""
+    small = cv2.GaussianBlur(cv2.cvtColor(cv2.resize(frame, ACTIVITY_SIZE, interpolation=cv2.INTER_AREA),
+                                          cv2.COLOR_BGR2GRAY), (3, 3), 0)
+    if previous is None:
+        return 0.0, small
+    moving = float((cv2.absdiff(small, previous) > ACTIVITY_PIXEL_DELTA).mean())
+    return min(1.0, moving / ACTIVITY_FULL_SCALE), small
+
+class Deadline:
+    """Fixed-rate schedule for a frame loop.
+
+    Each wait is measured from the previous deadline, not from the end of
+    the work, so processing time does not stretch the period and the real
+    frame rate is the configured one. A loop that falls more than a period
+    behind skips the missed slots instead of bursting to catch up.
+    """
+
+    def __init__(self):
+        self.next = time.monotonic()
+
+    def advance(self, interval: float) -> float:
+        """Move to the next slot and return the seconds to wait for it."""
+        now = time.monotonic()
+        self.next += interval
+        if self.next < now - interval:
+            self.next = now
+        return max(0.0, self.next - now)
+
+# ==================== SYNTHETIC CAMERA ====================
+
+SYNTHETIC_DEFAULTS = {"width": 1280, "height": 720, "rate": 6.0, "dwell": 4.0, "plate_count": 50}
+PLATE_LETTERS = "ABCDEFGHJKLMNPRSTUVYZ"
+
+def random_plate(rng: random.Random) -> str:
+    """A Turkish style plate: province code, 1-3 letters, 2-4 digits."""
+    letters = "".join(rng.choice(PLATE_LETTERS) for _ in range(rng.randint(1, 3)))
+    digits = str(rng.randint(10 ** (4 - len(letters)), 10 ** (5 - len(letters)) - 1))
+    return f"{rng.randint(1, 81):02d}{letters}{digits}"
+
+class SyntheticCapture:
+    """Stand-in for cv2.VideoCapture that renders cars with plates, for load tests.
+
+    Configured through the camera URL, e.g.
+    synthetic://?plates=34ABC123,06XY4567&width=1920&height=1080&rate=10&dwell=4
+    plates  comma separated list; otherwise plate_count random plates
+    rate    cars per minute (Poisson arrivals); 0 sends one car after another
+    dwell   seconds each car stays in view
+    seed    makes the plate list and arrivals repeatable
+
+    Frames follow the wall clock, so what a camera sees does not depend on
+    how fast it is read; the camera's fps setting paces the reads as usual.
+    """
+
+    def __init__(self, camera_id: str, camera: Dict[str, Any]):
+        params = {key: values[-1] for key, values in parse_qs(urlparse(camera["url"]).query).items()}
+        options = {**SYNTHETIC_DEFAULTS, **params}
+        self.width = int(options["width"])
+        self.height = int(options["height"])
+        self.rate = float(options["rate"])
+        self.dwell = float(options["dwell"])
+        self.fps = camera.get("fps", 15)
+        self.rng = random.Random(options.get("seed", camera_id))
+        if params.get("plates"):
+            self.plates = [plate.strip().upper() for plate in params["plates"].split(",") if plate.strip()]
+        else:
+            self.plates = [random_plate(self.rng) for _ in range(int(options["plate_count"]))]
+        self.background = self._render_background()
+        self.opened = True
+        self.vehicles = 0
+        self.car: Optional[Tuple[str, float, float]] = None  # plate, arrived, leaves
+        self.next_arrival = time.monotonic() + self._gap()
+
+    def _gap(self) -> float:
+        return self.rng.expovariate(self.rate / 60.0) if self.rate > 0 else 0.0
+
+    def _render_background(self) -> np.ndarray:
+        # Road-grey gradient with fixed sensor noise, rendered once
+        gradient = np.linspace(90, 150, self.height, dtype=np.float32)[:, None, None]
+        frame = np.repeat(np.repeat(gradient, self.width, axis=1), 3, axis=2)
+        noise = np.random.default_rng(0).normal(0, 6, frame.shape).astype(np.float32)
+        return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+    def _draw_car(self, frame: np.ndarray, plate: str, progress: float):
+        # The car drives towards the camera: it grows and moves down the frame
+        scale = 0.7 + 0.3 * progress
+        plate_w = int(self.width * 0.2 * scale)
+        plate_h = int(plate_w / 4.7)
+        cx = self.width // 2
+        cy = int(self.height * (0.45 + 0.25 * progress))
+        body_w, body_h = int(plate_w * 2.6), int(plate_h * 6)
+        cv2.rectangle(frame, (cx - body_w // 2, cy - body_h // 2), (cx + body_w // 2, cy + body_h // 2),
+                      (40, 40, 60), -1)
+        x1, y1 = cx - plate_w // 2, cy - plate_h // 2
+        x2, y2 = x1 + plate_w, y1 + plate_h
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 255, 255), -1)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 0), max(1, plate_h // 20))
+        strip = plate_w // 12
+        cv2.rectangle(frame, (x1, y1), (x1 + strip, y2), (160, 60, 0), -1)
+        cv2.putText(frame, "TR", (x1 + 2, y2 - plate_h // 6), cv2.FONT_HERSHEY_SIMPLEX,
+                    plate_h / 110, (255, 255, 255), max(1, plate_h // 40))
+        text = f"{plate[:2]} {plate[2:].rstrip('0123456789')} {plate[2:].lstrip(PLATE_LETTERS)}"
+        font_scale = plate_h / 38
+        thickness = max(1, plate_h // 12)
+        (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        available = plate_w - strip - plate_w // 20
+        if text_w > available:
+            font_scale *= available / text_w
+            (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        origin = (x1 + strip + (plate_w - strip - text_w) // 2, cy + text_h // 2)
+        cv2.putText(frame, text, origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness, cv2.LINE_AA)
+
+    def isOpened(self) -> bool:
+        return self.opened
+
+    def grab(self) -> bool:
+        return self.opened
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.opened:
+            return False, None
+        now = time.monotonic()
+        if self.car and now >= self.car[2]:
+            self.car = None
+            self.next_arrival = now + self._gap()
+        if self.car is None and now >= self.next_arrival:
+            self.car = (self.rng.choice(self.plates), now, now + self.dwell)
+            self.vehicles += 1
+        frame = self.background.copy()
+        if self.car:
+            plate, arrived, leaves = self.car
+            self._draw_car(frame, plate, (now - arrived) / max(leaves - arrived, 1e-6))
+        return True, frame
+
+    def set(self, prop: int, value: float) -> bool:
+        return False
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def release(self):
+        self.opened = False
+
+# ==================== FRAME RING ====================
+
+class FrameRing:
+    """Fixed-size ring of frames in a shared memory block.
+
+    Layout: one int64 sequence per slot, then the slots' pixels. The creating
+    process owns the block and unlinks it on close; others attach by name.
+    """
+
+    def __init__(self, name: Optional[str] = None, slots: int = 8, shape=FRAME_SHAPE):
+        self.slots = slots
+        self.shape = tuple(shape)
+        header = 8 * slots
+        size = header + slots * int(np.prod(self.shape))
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.sequences = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=header)
+        if self.owner:
+            self.sequences[:] = -1
+
+    def write(self, sequence: int, frame: np.ndarray):
+        slot = sequence % self.slots
+        self.sequences[slot] = -1  # readers treat the slot as busy until the pixels are in
+        self.frames[slot] = frame
+        self.sequences[slot] = sequence
+
+    def read(self, sequence: int) -> Optional[np.ndarray]:
+        """Copy of the frame with this sequence, or None once it has been overwritten."""
+        slot = sequence % self.slots
+        if self.sequences[slot] != sequence:
+            return None
+        frame = self.frames[slot].copy()
+        if self.sequences[slot] != sequence:
+            return None
+        return frame
+
+    def close(self):
+        # The numpy views hold buffer exports; drop them before closing the block
+        self.sequences = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+# ==================== WORKER PROCESSES ====================
+
+def _configure_logging():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def capture_worker_main(camera_id: str, camera: Dict[str, Any], ring_name: str, ring_slots: int,
+                        infer_queue, result_queue, stop_event, controls):
+    """Capture process: read, resize and publish frames for one camera until stop_event is set.
+
+    controls is a shared array [capture interval, inference interval] in
+    seconds, written by the sampling controller in the API process.
+    """
+    _configure_logging()
+    ring = FrameRing(ring_name, ring_slots)
+    cap = open_camera_capture(camera_id, camera)
+    frame_skip = camera.get("frame_skip") or 0
+    sequence = 0
+    skipped = 0
+    cpu_last = time.process_time()
+    deadline = Deadline()
+    next_inference = 0.0
+    previous = None
+    try:
+        while not stop_event.is_set():
+            frame = None
+            if cap is not None and cap.isOpened():
+                ret, frame = read_frame(cap, frame_skip)
+                if not ret:
+                    logger.error(f"Camera {camera_id} failed to read frame, switching to demo mode")
+                    cap.release()
+                    cap = None
+                    frame = None
+            if frame is None:
+                frame = render_demo_frame(camera_id, camera)
+            frame = prepare_frame(frame)
+
+            ring.write(sequence, frame)
+            activity, previous = measure_activity(frame, previous)
+            now = time.monotonic()
+            if now >= next_inference:
+                next_inference = now + controls[1]
+                try:
+                    infer_queue.put_nowait((camera_id, ring_name, ring_slots, sequence))
+                except queue.Full:
+                    # Inference is behind; newer frames are worth more than this one
+                    skipped += 1
+            try:
+                backlog = infer_queue.qsize()
+            except NotImplementedError:  # macOS
+                backlog = None
+
+            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
+            cpu_now = time.process_time()
+            try:
+                result_queue.put_nowait(("frame", camera_id, {
+                    "jpeg": buffer.tobytes(),
+                    "cpu_seconds": cpu_now - cpu_last,
+                    "demo_mode": cap is None,
+                    "inference_skipped": skipped,
+                    "activity": activity,
+                    "backlog": backlog,
+                }))
+            except queue.Full:
+                pass
+            cpu_last = cpu_now
+            sequence += 1
+            stop_event.wait(deadline.advance(controls[0]))
+    finally:
+        if cap is not None:
+            cap.release()
+        ring.close()
+
+def inference_worker_main(infer_queue, result_queue):
+    """Inference process: run the plate engine on frames named by the capture processes."""
+    import server  # the plate engine and its settings; heavy, so only loaded here
+
+    engine = server.plate_engine
+    engine.initialize()
+    rings: Dict[str, list] = {}  # name -> [FrameRing, last used]
+    while True:
+        item = infer_queue.get()
+        if item is None:
+            break
+        camera_id, ring_name, ring_slots, sequence = item
+        now = time.monotonic()
+        entry = rings.get(ring_name)
+        if entry is None:
+            try:
+                entry = rings[ring_name] = [FrameRing(ring_name, ring_slots), now]
+            except FileNotFoundError:
+                continue  # the camera stopped after queueing this frame
+        entry[1] = now
+        frame = entry[0].read(sequence)
+
+        payload: Dict[str, Any] = {"stale": frame is None}
+        if frame is not None:
+            cpu_started = time.thread_time()
+            trace: Dict[str, Any] = {}
+            result = engine.detect(frame, camera_id, trace)
+            payload["detect_seconds"] = trace.get("inference")  # None when skipped for the cooldown
+            payload["tracking"] = engine.tracking(camera_id)
+            if result:
+                _, buffer = cv2.imencode('.jpg', frame)
+                payload.update(result, image=buffer.tobytes())
+            payload["cpu_seconds"] = time.thread_time() - cpu_started
+        result_queue.put(("inference", camera_id, payload))
+
+        for name, (ring, last_used) in list(rings.items()):
+            if now - last_used > RING_IDLE_SECONDS:
+                ring.close()
+                del rings[name]
+
+    for ring, _ in rings.values():
+        ring.close()
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Load test: how many gates can one server handle?
+
+Starts the API server against a throwaway MongoDB database, adds N synthetic
+cameras (see camera_workers.SyntheticCapture) rendering plates at the given
+resolution, frame rate and traffic, registers part of those plates, and
+connects M WebSocket dashboards and K MJPEG viewers. A local stub door
+controller counts gate openings. After a warm-up it measures a steady
+window and prints a JSON report with:
+
+    recognitions  sustained plate reads per second (lpr_detections_total)
+    gate latency  lpr_plate_lookup_seconds percentiles from /metrics
+    inference     lpr_inference_seconds percentiles
+    event loop    lag percentiles from /metrics and /api/admin/event-loop
+    viewers       WebSocket events and delivery delay, MJPEG frame rates
+    resources     server CPU (including worker processes) and peak RSS
+
+Usage:
+    python loadtest.py --cameras 8 --ws-viewers 4 --mjpeg-viewers 2 \\
+        --fps 15 --width 1920 --height 1080 --rate 6 --duration 120
+
+MongoDB: --mongo-url points at an existing server (a database named
+loadtest_<random> is created and dropped); --mongod PATH starts a private
+mongod on a temporary directory instead and removes it afterwards.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import psutil
+import requests
+import websockets
+from pymongo import MongoClient
+
+from camera_workers import random_plate
+
+BACKEND_DIR = Path(__file__).parent
+HISTOGRAMS = {
+    "gate": "lpr_plate_lookup_seconds",
+    "inference": "lpr_inference_seconds",
+    "ocr": "lpr_ocr_seconds",
+    "loop_lag": "lpr_event_loop_lag_seconds",
+    "door": "lpr_door_trigger_seconds",
+}
+METRIC_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+
+
+# ==================== HELPERS ====================
+
+def percentile(values: List[float], pct: float) -> float:
+    # Same as benchmark.percentile; not imported because benchmark loads the whole server
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))]
+
+
+def process_tree_usage(process: psutil.Process) -> Tuple[float, int]:
+    """CPU seconds and RSS of the server and its worker processes."""
+    cpu, rss = 0.0, 0
+    for p in [process] + process.children(recursive=True):
+        try:
+            times = p.cpu_times()
+            cpu += times.user + times.system
+            rss += p.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return cpu, rss
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_metrics(text: str) -> List[Tuple[str, Dict[str, str], float]]:
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        label_dict = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels or ""))
+        samples.append((name, label_dict, float(value)))
+    return samples
+
+
+def metric_total(samples, name: str) -> float:
+    return sum(value for sample, _, value in samples if sample == name)
+
+
+def histogram_buckets(samples, name: str) -> Dict[float, float]:
+    """Cumulative bucket counts summed over all label sets."""
+    buckets: Dict[float, float] = {}
+    for sample, labels, value in samples:
+        if sample == f"{name}_bucket":
+            bound = float("inf") if labels["le"] in ("+Inf", "inf") else float(labels["le"])
+            buckets[bound] = buckets.get(bound, 0) + value
+    return buckets
+
+
+def histogram_summary(start: Dict[float, float], end: Dict[float, float]) -> Dict[str, Any]:
+    """Percentiles (bucket upper bounds, in ms) of the observations made between two scrapes."""
+    delta = sorted((bound, end[bound] - start.get(bound, 0)) for bound in end)
+    count = delta[-1][1] if delta else 0
+    summary: Dict[str, Any] = {"count": int(count)}
+    for name, pct in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99)):
+        value = None
+        for bound, cumulative in delta:
+            if count and cumulative >= count * pct / 100.0:
+                value = bound
+                break
+        summary[name] = round(value * 1000, 3) if value not in (None, float("inf")) else value
+    return summary
+
+
+class DoorStub(ThreadingHTTPServer):
+    """Door controller stand-in; every GET is one gate opening."""
+
+    def __init__(self):
+        self.openings = 0
+        self.lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub.lock:
+                    stub.openings += 1
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b"OK")
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(("127.0.0.1", 0), Handler)
+
+
+# ==================== SERVER ====================
+
+class ServerUnderTest:
+    def __init__(self, args):
+        self.args = args
+        self.port = args.port or free_port()
+        self.base = f"http://127.0.0.1:{self.port}"
+        self.db_name = args.db or f"loadtest_{uuid.uuid4().hex[:8]}"
+        self.mongo_url = args.mongo_url
+        self.mongod: Optional[subprocess.Popen] = None
+        self.mongod_dir: Optional[str] = None
+        self.process: Optional[subprocess.Popen] = None
+        self.log = None
+
+    def start_mongod(self):
+        self.mongod_dir = tempfile.mkdtemp(prefix="lpr-loadtest-mongo-")
+        port = free_port()
+        self.mongod = subprocess.Popen(
+            [self.args.mongod, "--dbpath", self.mongod_dir, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.mongo_url = f"mongodb://127.0.0.1:{port}"
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                MongoClient(self.mongo_url, serverSelectionTimeoutMS=500).admin.command("ping")
+                return
+            except Exception:
+                time.sleep(0.5)
+        raise SystemExit("mongod did not start")
+
+    def start(self):
+        if self.args.mongod:
+            self.start_mongod()
+        env = dict(
+            os.environ,
+            MONGO_URL=self.mongo_url,
+            DB_NAME=self.db_name,
+            CAMERA_WORKER_MODE=self.args.worker_mode,
+            CLUSTER_MODE="false",
+        )
+        self.log = open(self.args.server_log, "w") if self.args.server_log else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(self.port)],
+            cwd=BACKEND_DIR, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.time() + self.args.startup_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit(f"Server exited with code {self.process.returncode} (see --server-log)")
+            try:
+                if requests.get(f"{self.base}/api/", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise SystemExit("Server did not become ready")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            # SIGINT lets the lifespan shut the cameras and writers down cleanly
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.log not in (None, subprocess.DEVNULL):
+            self.log.close()
+        if self.args.mongod:
+            if self.mongod:
+                self.mongod.terminate()
+                self.mongod.wait(30)
+            shutil.rmtree(self.mongod_dir, ignore_errors=True)
+        elif not self.args.keep_db:
+            MongoClient(self.mongo_url, serverSelectionTimeoutMS=2000).drop_database(self.db_name)
+
+    def api(self, method: str, path: str, **kwargs) -> Any:
+        response = requests.request(method, f"{self.base}/api{path}", timeout=10, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def metrics(self):
+        return parse_metrics(requests.get(f"{self.base}/metrics", timeout=10).text)
+
+
+def seed(server: ServerUnderTest, door: DoorStub, args) -> List[str]:
+    rng = random.Random(args.seed)
+    plates = sorted({random_plate(rng) for _ in range(args.plates)})
+    site = server.api("POST", "/sites", json={"name": "Load test", "blocks": [{"name": "A Blok", "apartments": 100}]})
+    door_doc = server.api("POST", "/doors", json={
+        "name": "Stub", "ip": f"127.0.0.1:{door.server_address[1]}", "endpoint": "/kapiac",
+    })
+    registered = plates[:int(len(plates) * args.registered)]
+    for i, plate in enumerate(registered):
+        server.api("POST", "/plates", json={
+            "site_id": site["id"], "block_name": "A Blok", "apartment_number": str(i + 1),
+            "owner_name": f"Sakin {i + 1}", "plates": [plate], "valid_until": "2099-12-31", "status": "allowed",
+        })
+
+    camera_ids = []
+    for i in range(args.cameras):
+        query = urlencode({
+            "plates": ",".join(plates), "width": args.width, "height": args.height,
+            "rate": args.rate, "dwell": args.dwell, "seed": f"{args.seed}-{i}",
+        })
+        camera = server.api("POST", "/cameras", json={
+            "name": f"Sentetik {i + 1}", "type": "synthetic", "url": f"synthetic://?{query}",
+            "door_id": door_doc["id"], "fps": args.fps, "position": i % 4,
+        })
+        server.api("POST", f"/cameras/{camera['id']}/start")
+        camera_ids.append(camera["id"])
+    return camera_ids
+
+
+# ==================== VIEWERS ====================
+
+async def ws_viewer(server: ServerUnderTest, stats: Dict[str, Any], stop: asyncio.Event):
+    params = urlencode({"topics": "detections,stats,cameras,system", "format": "compact"})
+    url = f"ws://127.0.0.1:{server.port}/api/ws/detections?{params}"
+    async with websockets.connect(url, max_size=None) as ws:
+        while not stop.is_set():
+            try:
+                raw = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            stats["messages"] += 1
+            message = json.loads(raw)
+            if message.get("type") == "detection":
+                stats["detections"] += 1
+                sent = datetime.fromisoformat(message["data"]["timestamp"].replace("Z", "+00:00"))
+                stats["delays"].append((datetime.now(timezone.utc) - sent).total_seconds())
+            elif message.get("type") == "resync":
+                stats["resyncs"] += 1
+
+
+def mjpeg_viewer(server: ServerUnderTest, camera_id: str, stats: Dict[str, Any], stop: threading.Event):
+    with requests.get(f"{server.base}/api/cameras/{camera_id}/stream", stream=True, timeout=10) as response:
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            if stop.is_set():
+                break
+            stats["bytes"] += len(chunk)
+            stats["frames"] += chunk.count(b"--frame")
+
+
+# ==================== LOAD TEST ====================
+
+async def run_loadtest(args) -> Dict[str, Any]:
+    door = DoorStub()
+    threading.Thread(target=door.serve_forever, daemon=True).start()
+    server = ServerUnderTest(args)
+    await asyncio.to_thread(server.start)
+    try:
+        camera_ids = await asyncio.to_thread(seed, server, door, args)
+
+        stop = asyncio.Event()
+        stop_threads = threading.Event()
+        ws_stats = [{"messages": 0, "detections": 0, "resyncs": 0, "delays": []} for _ in range(args.ws_viewers)]
+        mjpeg_stats = [{"camera_id": camera_ids[i % len(camera_ids)], "frames": 0, "bytes": 0}
+                       for i in range(args.mjpeg_viewers if camera_ids else 0)]
+        viewers = [asyncio.create_task(ws_viewer(server, stats, stop)) for stats in ws_stats]
+        viewers += [asyncio.create_task(asyncio.to_thread(mjpeg_viewer, server, stats["camera_id"], stats, stop_threads))
+                    for stats in mjpeg_stats]
+
+        await asyncio.sleep(args.warmup)
+        process = psutil.Process(server.process.pid)
+        cpu_start, rss_peak = process_tree_usage(process)
+        metrics_start = await asyncio.to_thread(server.metrics)
+        ws_start = [dict(stats, delays=len(stats["delays"])) for stats in ws_stats]
+        mjpeg_start = [dict(stats) for stats in mjpeg_stats]
+        doors_start = door.openings
+        window_start = time.perf_counter()
+
+        while time.perf_counter() - window_start < args.duration:
+            await asyncio.sleep(1)
+            rss_peak = max(rss_peak, process_tree_usage(process)[1])
+
+        window = time.perf_counter() - window_start
+        metrics_end = await asyncio.to_thread(server.metrics)
+        cpu_end = process_tree_usage(process)[0]
+        loop_report = await asyncio.to_thread(server.api, "GET", "/admin/event-loop?history=0")
+        camera_status = await asyncio.to_thread(server.api, "GET", "/cameras/status")
+
+        stop.set()
+        stop_threads.set()
+        await asyncio.gather(*viewers, return_exceptions=True)
+    finally:
+        await asyncio.to_thread(server.stop)
+        door.shutdown()
+
+    def delta(name: str) -> float:
+        return metric_total(metrics_end, name) - metric_total(metrics_start, name)
+
+    recognitions = delta("lpr_detections_total")
+    frames = delta("lpr_camera_frames_total")
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "label": args.label,
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": psutil.cpu_count(),
+            "memory_gb": round(psutil.virtual_memory().total / (1024 ** 3), 1),
+        },
+        "config": {
+            "cameras": args.cameras, "fps": args.fps, "resolution": f"{args.width}x{args.height}",
+            "rate_per_minute": args.rate, "dwell": args.dwell, "plates": args.plates,
+            "registered": args.registered, "ws_viewers": args.ws_viewers, "mjpeg_viewers": args.mjpeg_viewers,
+            "worker_mode": args.worker_mode, "warmup": args.warmup, "duration": args.duration,
+        },
+        "window_seconds": round(window, 1),
+        "throughput": {
+            "frames_per_second": round(frames / window, 2),
+            "frames_per_second_per_camera": round(frames / window / max(1, args.cameras), 2),
+            "recognitions_per_second": round(recognitions / window, 3),
+            "cars_offered_per_second": round(args.cameras * args.rate / 60.0, 3),
+            "door_openings": door.openings - doors_start,
+            "inference_skipped": sum(camera.get("inference_skipped", 0) for camera in camera_status.values()),
+            "demo_mode_cameras": sum(1 for camera in camera_status.values() if camera.get("demo_mode")),
+        },
+        "latency": {
+            name: histogram_summary(histogram_buckets(metrics_start, metric), histogram_buckets(metrics_end, metric))
+            for name, metric in HISTOGRAMS.items()
+        },
+        "event_loop": loop_report["lag_ms"],
+        "viewers": {
+            "websocket": [
+                {
+                    "messages_per_second": round((stats["messages"] - start["messages"]) / window, 2),
+                    "detections": stats["detections"] - start["detections"],
+                    "resyncs": stats["resyncs"] - start["resyncs"],
+                    "delivery_p50_ms": round(percentile(stats["delays"][start["delays"]:], 50) * 1000, 1),
+                    "delivery_p95_ms": round(percentile(stats["delays"][start["delays"]:], 95) * 1000, 1),
+                }
+                for stats, start in zip(ws_stats, ws_start)
+            ],
+            "mjpeg": [
+                {
+                    "camera_id": stats["camera_id"],
+                    "fps": round((stats["frames"] - start["frames"]) / window, 2),
+                    "mbit_per_second": round((stats["bytes"] - start["bytes"]) * 8 / window / 1e6, 2),
+                }
+                for stats, start in zip(mjpeg_stats, mjpeg_start)
+            ],
+        },
+        "resources": {
+            "cpu_seconds": round(cpu_end - cpu_start, 2),
+            "cpu_cores_used": round((cpu_end - cpu_start) / window, 2),
+            "rss_peak_mb": round(rss_peak / (1024 ** 2), 1),
+        },
+    }
+    return report
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test the server with synthetic cameras and viewers")
+    parser.add_argument("--cameras", type=int, default=4, help="Synthetic cameras to start")
+    parser.add_argument("--ws-viewers", type=int, default=2, help="WebSocket dashboards to connect")
+    parser.add_argument("--mjpeg-viewers", type=int, default=1, help="MJPEG stream viewers (spread over the cameras)")
+    parser.add_argument("--fps", type=int, default=15, help="Camera frame rate")
+    parser.add_argument("--width", type=int, default=1280, help="Rendered frame width")
+    parser.add_argument("--height", type=int, default=720, help="Rendered frame height")
+    parser.add_argument("--rate", type=float, default=6.0, help="Cars per minute per camera; 0 for back to back")
+    parser.add_argument("--dwell", type=float, default=4.0, help="Seconds each car stays in view")
+    parser.add_argument("--plates", type=int, default=50, help="Distinct plates the cameras draw from")
+    parser.add_argument("--registered", type=float, default=0.5, help="Share of those plates registered as allowed")
+    parser.add_argument("--seed", default="loadtest", help="Seed for plates and arrivals")
+    parser.add_argument("--worker-mode", choices=["thread", "process"], default="thread", help="CAMERA_WORKER_MODE")
+    parser.add_argument("--warmup", type=float, default=20.0, help="Seconds before measuring")
+    parser.add_argument("--duration", type=float, default=60.0, help="Measured seconds")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017", help="MongoDB server to use")
+    parser.add_argument("--mongod", help="Start a private mongod from this binary instead of using --mongo-url")
+    parser.add_argument("--db", help="Database name (default: loadtest_<random>, dropped afterwards)")
+    parser.add_argument("--keep-db", action="store_true", help="Do not drop the database afterwards")
+    parser.add_argument("--port", type=int, default=0, help="Server port (default: a free one)")
+    parser.add_argument("--startup-timeout", type=float, default=120.0, help="Seconds to wait for the server")
+    parser.add_argument("--server-log", help="Write the server's output to this file")
+    parser.add_argument("--label", default="", help="Free-form build label stored in the report")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_loadtest(args))
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(payload, encoding="utf-8")
+    else:
+        sys.stdout.write(payload + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,68 @@
-from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect, HTTPException, UploadFile, File, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse, RedirectResponse, FileResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from contextlib import asynccontextmanager
+from pymongo import CursorType, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure, PyMongoError
+from bson import json_util
+from contextlib import asynccontextmanager, contextmanager, suppress
 import os
 import logging
+import logging.handlers
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter, ValidationError, field_validator
+from typing import List, Optional, Dict, Any, Tuple, Iterator, AsyncIterator, Callable, Generic, Type, TypeVar
 import uuid
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
 import asyncio
 import json
 import psutil
 import cv2
 import numpy as np
-from collections import deque
+from collections import OrderedDict, deque
 import requests
 import base64
 import re
+import threading
+import time
+import sys
+import traceback
+import random
+import queue
+import atexit
+import codecs
+import csv
+import io
+import importlib.util
+import multiprocessing
+import multiprocessing.connection
+import socket
+import hashlib
+import zlib
+
+try:
+    import msgpack  # optional: binary WebSocket frames
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson  # optional: faster JSON responses
+except ImportError:
+    orjson = None
+
+from camera_workers import (
+    FrameRing, Deadline, capture_worker_main, inference_worker_main, measure_activity,
+    CAPTURE_OPTIONS, open_camera_capture, prepare_frame, read_frame, render_demo_frame,
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Lifespan event handler
@@ -43,6 +79,11 @@ async def lifespan(app: FastAPI):
         # Test MongoDB connection
         await client.admin.command('ping')
         print("✅ MongoDB bağlantısı başarılı!")
+        await ensure_plate_index()
+        await ensure_detection_storage()
+        await detection_counters.load()
+        await detection_rollups.ensure_indexes()
+        await visit_tracker.ensure_indexes()
     except Exception as e:
         print(f"⚠️  MongoDB bağlantı uyarısı: {str(e)}")
     
@@ -55,8 +96,58 @@ async def lifespan(app: FastAPI):
     print(f"📡 WebSocket: ws://localhost:8001/ws/video")
     print("="*60 + "\n")
     
+    lag_monitor = asyncio.create_task(loop_monitor.run())
+    sampler_task = asyncio.create_task(system_sampler.run())
+    compaction_task = asyncio.create_task(compact_detection_images())
+    writer_task = asyncio.create_task(detection_writer.run())
+    rollup_task = asyncio.create_task(detection_rollups.run())
+    visit_writer_task = asyncio.create_task(visit_writer.run())
+    visit_task = asyncio.create_task(visit_tracker.run())
+    snapshot_task = asyncio.create_task(auth_snapshot.run())
+    sampling_task = asyncio.create_task(sampling.run())
+    cluster_task = None
+    if CLUSTER_MODE:
+        # Cameras are started by whichever node wins their lease
+        cluster_task = asyncio.create_task(cluster.run())
+        print(f"🛰️  Küme modu: düğüm {cluster.node_id}")
+    else:
+        try:
+            started = await camera_supervisor.start_enabled()
+            print(f"🎥 {started} kamera otomatik başlatıldı")
+        except Exception as e:
+            print(f"⚠️  Kameralar başlatılamadı: {str(e)}")
+    slow_callback_ms = os.environ.get('LOOP_SLOW_CALLBACK_MS')
+    if slow_callback_ms:
+        loop_monitor.enable_tracer(float(slow_callback_ms) / 1000)
+    
     yield
     
+    if cluster_task:
+        cluster.stop()
+        await cluster_task
+    await camera_supervisor.shutdown()
+    await camera_processes.shutdown()
+    if cluster_task:
+        await cluster.close()
+    loop_monitor.disable_tracer()
+    lag_monitor.cancel()
+    sampler_task.cancel()
+    compaction_task.cancel()
+    snapshot_task.cancel()
+    sampling_task.cancel()
+    # Closing the remaining visits queues their final documents for the visit writer
+    visit_tracker.stop()
+    await visit_task
+    visit_writer.stop()
+    await visit_writer_task
+    await visit_writer.close()
+    detection_writer.stop()
+    await writer_task
+    await detection_writer.close()
+    # After the writer so the increments of its final flush are written too
+    detection_rollups.stop()
+    await rollup_task
+    
     # Shutdown
     print("\n" + "="*60)
     print("🛑 Sunucu kapatılıyor...")
@@ -82,6 +173,25 @@ class SiteCreate(BaseModel):
     name: str
     blocks: List[Dict[str, Any]]
 
+class AccessWindow(BaseModel):
+    days: List[int] = Field(default_factory=lambda: list(range(7)))  # 0 = Monday
+    start: str = "00:00"
+    end: str = "24:00"  # end before start means the window runs past midnight
+
+    @field_validator("days")
+    @classmethod
+    def check_days(cls, days: List[int]) -> List[int]:
+        if any(day < 0 or day > 6 for day in days):
+            raise ValueError("days must be between 0 (Monday) and 6 (Sunday)")
+        return sorted(set(days))
+
+    @field_validator("start", "end")
+    @classmethod
+    def check_time(cls, value: str) -> str:
+        if not re.fullmatch(r"([01]\d|2[0-3]):[0-5]\d|24:00", value):
+            raise ValueError("times must be HH:MM")
+        return value
+
 class Plate(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -92,6 +202,8 @@ class Plate(BaseModel):
     plates: List[str]  # Up to 3 plates
     valid_until: str
     status: str  # "allowed", "blocked"
+    door_ids: Optional[List[str]] = None  # None = every door
+    schedule: Optional[List[AccessWindow]] = None  # None = any time
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 class PlateCreate(BaseModel):
@@ -102,6 +214,20 @@ class PlateCreate(BaseModel):
     plates: List[str]
     valid_until: str
     status: str
+    door_ids: Optional[List[str]] = None
+    schedule: Optional[List[AccessWindow]] = None
+
+    @field_validator("plates")
+    @classmethod
+    def normalize_plates(cls, plates: List[str]) -> List[str]:
+        normalized = []
+        for raw in plates:
+            plate = normalize_plate(raw)
+            if not plate:
+                raise ValueError(f"'{raw}' is not a valid plate")
+            if plate not in normalized:
+                normalized.append(plate)
+        return normalized
 
 class Door(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -120,12 +246,21 @@ class Camera(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
-    type: str  # "webcam", "rtsp", "http"
+    type: str  # "webcam", "rtsp", "http", "synthetic" (load tests, see camera_workers.SyntheticCapture)
     url: str
     door_id: str
     fps: int = 15
     enabled: bool = True
     position: int = 0  # 0-3 for grid position
+    # Capture options; the defaults keep OpenCV's own backend choice
+    decoder: str = "auto"  # "auto", "ffmpeg", "gstreamer"
+    pipeline: Optional[str] = None  # full GStreamer pipeline, or FFmpeg options "key;value|key;value"
+    substream_url: Optional[str] = None  # low resolution stream used for processing instead of url
+    decode_width: Optional[int] = None  # scale while decoding (GStreamer) or ask the device (webcam)
+    decode_height: Optional[int] = None
+    frame_skip: int = 0  # frames discarded with grab() between processed frames
+    keyframes_only: bool = False  # GStreamer: drop delta frames before decoding
+    hw_accel: bool = False
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
 
 class CameraCreate(BaseModel):
@@ -134,7 +269,34 @@ class CameraCreate(BaseModel):
     url: str
     door_id: str
     fps: int = 15
+    enabled: bool = True
     position: int = 0
+    decoder: str = "auto"
+    pipeline: Optional[str] = None
+    substream_url: Optional[str] = None
+    decode_width: Optional[int] = None
+    decode_height: Optional[int] = None
+    frame_skip: int = 0
+    keyframes_only: bool = False
+    hw_accel: bool = False
+
+    @field_validator("decoder")
+    @classmethod
+    def check_decoder(cls, decoder: str) -> str:
+        if decoder not in ("auto", "ffmpeg", "gstreamer"):
+            raise ValueError("decoder must be auto, ffmpeg or gstreamer")
+        return decoder
+
+    @field_validator("frame_skip")
+    @classmethod
+    def check_frame_skip(cls, frame_skip: int) -> int:
+        if frame_skip < 0:
+            raise ValueError("frame_skip cannot be negative")
+        return frame_skip
+
+class CameraUpdate(CameraCreate):
+    # Omitted means unchanged, so editing a camera never restarts one an operator stopped
+    enabled: Optional[bool] = None
 
 class Detection(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -143,9 +305,11 @@ class Detection(BaseModel):
     plate: str
     status: str  # "allowed", "unknown", "blocked"
     confidence: float
-    timestamp: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     image_base64: Optional[str] = None
     owner_info: Optional[Dict[str, Any]] = None
+    reason: Optional[str] = None  # why the gate decision came out this way
+    visit_id: Optional[str] = None  # the visit this recognition opened or changed
 
 class Settings(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -162,12 +326,574 @@ class SettingsUpdate(BaseModel):
     camera_size: Optional[str] = None
     detection_confidence: Optional[float] = None
 
+class AccessEvaluationRequest(BaseModel):
+    plates: List[str]
+    camera_id: Optional[str] = None
+    door_id: Optional[str] = None
+    at: Optional[datetime] = None
+
+class LoopTracerUpdate(BaseModel):
+    enabled: bool
+    threshold_ms: float = 100
+
+class ReportExportRequest(BaseModel):
+    format: str = "csv"  # "csv", "xlsx", "pdf"
+    start_date: str
+    end_date: str
+    status: Optional[str] = None
+    camera_id: Optional[str] = None
+
 # ==================== GLOBAL STATE ====================
 
 active_cameras: Dict[str, Any] = {}
-websocket_clients: List[WebSocket] = []
 detection_buffer = deque(maxlen=20)
 
+# ==================== METRICS ====================
+
+class _Metric:
+    """Base for the in-process Prometheus-style metrics."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Dict[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        rendered = []
+        for name, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            rendered.append(f'{name}="{value}"')
+        return "{" + ",".join(rendered) + "}"
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, dict(state, buckets=list(state["buckets"]))) for key, state in self._values.items()]
+        for key, state in items:
+            for bound, count in zip(self.buckets, state["buckets"]):
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': repr(bound)})} {count}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': '+Inf'})} {state['count']}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state['sum']}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {state['count']}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = Histogram.DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+CAMERA_FRAMES = metrics.counter("lpr_camera_frames_total", "Frames captured per camera", ("camera",))
+CAMERA_FPS = metrics.gauge("lpr_camera_capture_fps", "Measured capture rate per camera", ("camera",))
+INFERENCE_LATENCY = metrics.histogram("lpr_inference_seconds", "YOLOv8 plate localisation latency")
+OCR_LATENCY = metrics.histogram("lpr_ocr_seconds", "OCR latency per plate crop")
+DETECTIONS = metrics.counter("lpr_detections_total", "Recognised plates by decision status", ("camera", "status"))
+LOOKUP_LATENCY = metrics.histogram("lpr_plate_lookup_seconds", "Gate decision latency for a recognised plate",
+                                   buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1))
+DOOR_LATENCY = metrics.histogram("lpr_door_trigger_seconds", "Door controller request latency")
+DOOR_FAILURES = metrics.counter("lpr_door_trigger_failures_total", "Door controller requests that failed")
+WS_SUBSCRIBERS = metrics.gauge("lpr_websocket_subscribers", "Connected detection WebSocket clients")
+WS_DROPS = metrics.counter("lpr_websocket_dropped_messages_total", "WebSocket messages that could not be delivered")
+LOOP_LAG = metrics.histogram("lpr_event_loop_lag_seconds", "Delay of the event loop waking a sleeping task",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+# ==================== EVENT LOOP MONITOR ====================
+
+LOOP_STALLS = metrics.counter("lpr_event_loop_stalls_total", "Times the event loop was blocked longer than the tracer threshold")
+
+class EventLoopMonitor:
+    """Loop lag sampler plus an optional watchdog that records what blocked the loop.
+
+    The sampler measures how late a sleeping task wakes up. The tracer runs in a
+    separate thread: the loop refreshes a heartbeat every tick, and when the
+    heartbeat goes stale for longer than the threshold the watchdog grabs the
+    loop thread's stack and the task that was running at that moment.
+    """
+
+    def __init__(self, interval: float = 0.5, history: int = 240, max_events: int = 100):
+        self.interval = interval
+        self.lag_history = deque(maxlen=history)  # (unix time, lag seconds)
+        self.slow_callbacks = deque(maxlen=max_events)
+        self.tracer_enabled = False
+        self.threshold = 0.1
+        self.tick = 0.02
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat = time.monotonic()
+        self._tick_handle = None
+        self._watchdog = None
+        self._stop_watchdog = threading.Event()
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        while True:
+            started = self._loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self._loop.time() - started - self.interval)
+            LOOP_LAG.observe(lag)
+            self.lag_history.append((time.time(), lag))
+
+    # --- slow callback tracer ---
+
+    def _beat(self):
+        self._heartbeat = time.monotonic()
+        if self.tracer_enabled:
+            self._tick_handle = self._loop.call_later(self.tick, self._beat)
+
+    def enable_tracer(self, threshold: float):
+        """Start the watchdog; must be called from the event loop thread."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self.threshold = threshold
+        if self.tracer_enabled:
+            return
+        self.tracer_enabled = True
+        self._stop_watchdog.clear()
+        self._beat()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def disable_tracer(self):
+        self.tracer_enabled = False
+        self._stop_watchdog.set()
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+        if self._tick_handle:
+            self._tick_handle.cancel()
+            self._tick_handle = None
+
+    def _watch(self):
+        stall = None
+        while not self._stop_watchdog.wait(min(self.threshold / 2, 0.05)):
+            overdue = time.monotonic() - self._heartbeat - self.tick
+            if stall is None and overdue > self.threshold:
+                stall = self._capture_stall()
+            elif stall is not None and overdue <= self.threshold:
+                # Heartbeat resumed, so the loop is free again
+                started = stall.pop("_started")
+                stall["duration_ms"] = round((self._heartbeat - started) * 1000, 1)
+                self.slow_callbacks.append(stall)
+                LOOP_STALLS.inc()
+                stall = None
+
+    def _capture_stall(self) -> Dict[str, Any]:
+        started = self._heartbeat + self.tick
+        record = {
+            "started_at": datetime.fromtimestamp(time.time() - (time.monotonic() - started), timezone.utc).isoformat(),
+            "task": None,
+            "coroutine": None,
+            "location": None,
+            "stack": [],
+            "_started": started,
+        }
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is not None:
+            stack = traceback.extract_stack(frame)[-12:]
+            record["stack"] = [f"{entry.filename}:{entry.lineno} in {entry.name}" for entry in stack]
+            # The innermost frame from our own code is the most useful pointer
+            own = [entry for entry in stack if entry.filename == __file__] or stack
+            record["location"] = f"{own[-1].filename}:{own[-1].lineno} in {own[-1].name}"
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        if task is not None:
+            record["task"] = task.get_name()
+            record["coroutine"] = getattr(task.get_coro(), "__qualname__", repr(task.get_coro()))
+        return record
+
+    # --- reporting ---
+
+    def snapshot(self, history: int = 60) -> Dict[str, Any]:
+        lags = sorted(lag for _, lag in self.lag_history)
+
+        def pct(p: float) -> float:
+            if not lags:
+                return 0.0
+            return round(lags[min(len(lags) - 1, int(p / 100.0 * len(lags)))] * 1000, 2)
+
+        return {
+            "interval_ms": round(self.interval * 1000),
+            "lag_ms": {
+                "current": round(self.lag_history[-1][1] * 1000, 2) if self.lag_history else 0.0,
+                "p50": pct(50),
+                "p95": pct(95),
+                "p99": pct(99),
+                "max": round(lags[-1] * 1000, 2) if lags else 0.0,
+            },
+            "history": [
+                {"t": datetime.fromtimestamp(ts, timezone.utc).isoformat(), "lag_ms": round(lag * 1000, 2)}
+                for ts, lag in list(self.lag_history)[-history:]
+            ],
+            "tracer": {"enabled": self.tracer_enabled, "threshold_ms": round(self.threshold * 1000)},
+            "slow_callbacks": list(self.slow_callbacks),
+        }
+
+loop_monitor = EventLoopMonitor(interval=float(os.environ.get('LOOP_LAG_INTERVAL', '0.5')))
+
+# ==================== SYSTEM SAMPLER ====================
+
+class SystemSampler:
+    """Collects host, process, camera and GPU stats in the background.
+
+    /api/system/status used to call psutil.cpu_percent(interval=1) and import
+    torch on every request; now it just reads the newest sample from here.
+    """
+
+    def __init__(self, interval: float = 2.0, history: int = 150):
+        self.interval = interval
+        self.history = deque(maxlen=history)
+        self.latest: Optional[Dict[str, Any]] = None
+        self.process = psutil.Process()
+        self.gpu_available = False
+        self.gpu_info = "N/A"
+        self._torch = None
+
+    def _probe_gpu(self):
+        """Import torch once (slow) and remember whether CUDA is usable."""
+        try:
+            import torch
+            self.gpu_available = torch.cuda.is_available()
+            if self.gpu_available:
+                self.gpu_info = torch.cuda.get_device_name(0)
+                self._torch = torch
+        except Exception:
+            self.gpu_available = False
+
+    def _gpu_memory(self) -> Optional[Dict[str, float]]:
+        if not self._torch:
+            return None
+        try:
+            free, total = self._torch.cuda.mem_get_info(0)
+            return {
+                "used_gb": round((total - free) / (1024**3), 2),
+                "total_gb": round(total / (1024**3), 2),
+                "allocated_gb": round(self._torch.cuda.memory_allocated(0) / (1024**3), 2),
+            }
+        except Exception:
+            return None
+
+    def sample(self) -> Dict[str, Any]:
+        memory = psutil.virtual_memory()
+        with self.process.oneshot():
+            rss = self.process.memory_info().rss
+            process_cpu = self.process.cpu_percent(interval=None)
+            threads = self.process.num_threads()
+        cameras = camera_supervisor.stats()
+        return {
+            "sampled_at": datetime.now(timezone.utc).isoformat(),
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "memory_percent": memory.percent,
+            "memory_used_gb": round(memory.used / (1024**3), 2),
+            "memory_total_gb": round(memory.total / (1024**3), 2),
+            "gpu_available": self.gpu_available,
+            "gpu_info": self.gpu_info,
+            "gpu_memory": self._gpu_memory(),
+            "process": {
+                "cpu_percent": process_cpu,
+                "rss_mb": round(rss / (1024**2), 1),
+                "threads": threads,
+            },
+            "cameras": cameras,
+            "active_cameras": len(cameras),
+        }
+
+    async def run(self):
+        await asyncio.to_thread(self._probe_gpu)
+        # Prime the psutil counters; the first non-blocking reading is always 0
+        psutil.cpu_percent(interval=None)
+        self.process.cpu_percent(interval=None)
+        while True:
+            try:
+                snapshot = self.sample()
+                self.latest = snapshot
+                event_hub.publish_system(snapshot)
+                self.history.append({
+                    "t": snapshot["sampled_at"],
+                    "cpu": snapshot["cpu_percent"],
+                    "mem": snapshot["memory_percent"],
+                    "rss_mb": snapshot["process"]["rss_mb"],
+                })
+            except Exception as e:
+                logger.error(f"System sampler error: {e}")
+            await asyncio.sleep(self.interval)
+
+    def status(self, history: int = 0) -> Dict[str, Any]:
+        snapshot = dict(self.latest or self.sample())
+        snapshot["active_cameras"] = len(active_cameras)
+        snapshot["detection_writer"] = detection_writer.stats()
+        snapshot["authorization"] = auth_snapshot.status()
+        if CLUSTER_MODE:
+            snapshot["cluster"] = cluster.status()
+        if history:
+            snapshot["history"] = list(self.history)[-history:]
+        return snapshot
+
+system_sampler = SystemSampler(interval=float(os.environ.get('SYSTEM_SAMPLE_INTERVAL', '2.0')))
+
+# ==================== PLATE CROP QUALITY ====================
+
+CROP_QUALITY_ENABLED = os.environ.get('CROP_QUALITY', 'true').lower() in ('1', 'true', 'yes')
+CROP_MIN_HEIGHT = int(os.environ.get('CROP_MIN_HEIGHT', '12'))  # px; smaller crops are rejected
+CROP_GOOD_HEIGHT = int(os.environ.get('CROP_GOOD_HEIGHT', '28'))
+CROP_MIN_SHARPNESS = float(os.environ.get('CROP_MIN_SHARPNESS', '30'))  # variance of the Laplacian
+CROP_GOOD_SHARPNESS = float(os.environ.get('CROP_GOOD_SHARPNESS', '150'))
+CROP_MAX_SKEW = float(os.environ.get('CROP_MAX_SKEW', '20'))  # degrees
+CROP_ACCEPT_SCORE = float(os.environ.get('CROP_ACCEPT_SCORE', '0.6'))
+CROP_DEFER_SECONDS = float(os.environ.get('CROP_DEFER_SECONDS', '1.0'))
+PLATE_TRACK_TIMEOUT = float(os.environ.get('PLATE_TRACK_TIMEOUT', '1.5'))
+PLATE_UPSCALE_HEIGHT = int(os.environ.get('PLATE_UPSCALE_HEIGHT', '48'))  # 0 disables upscaling
+PLATE_SR_MODEL = os.environ.get('PLATE_SR_MODEL', '')  # e.g. models/FSRCNN_x3.pb, needs opencv-contrib
+
+CROP_SCORING_HEIGHT = 48  # crops are compared at this height so the score does not depend on distance
+PLATE_ASPECT = 4.7  # 520 x 110 mm
+
+CROP_DECISIONS = metrics.counter("lpr_plate_crops_total", "Plate crops by quality decision", ("decision",))
+
+def estimate_skew(gray: np.ndarray) -> float:
+    """Median angle in degrees of the long near-horizontal edges (plate borders, character baselines)."""
+    width = gray.shape[1]
+    edges = cv2.Canny(gray, 50, 150)
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=max(10, width // 4),
+                            minLineLength=max(10, width // 3), maxLineGap=5)
+    if lines is None:
+        return 0.0
+    angles = []
+    for x1, y1, x2, y2 in lines[:, 0]:
+        angle = float(np.degrees(np.arctan2(y2 - y1, x2 - x1)))
+        if abs(angle) < 45:
+            angles.append(angle)
+    return float(np.median(angles)) if angles else 0.0
+
+def score_crop(crop: np.ndarray) -> Dict[str, Any]:
+    """Rate a plate crop for OCR: size, sharpness, exposure and skew.
+
+    The decision is "reject" when one measure is hopeless, "accept" when the
+    combined score reaches CROP_ACCEPT_SCORE and "defer" in between: OCR
+    waits for a better view of the same car.
+    """
+    height, width = crop.shape[:2]
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    scaled_width = max(1, int(width * CROP_SCORING_HEIGHT / height))
+    interpolation = cv2.INTER_AREA if height > CROP_SCORING_HEIGHT else cv2.INTER_LINEAR
+    normalized = cv2.resize(gray, (scaled_width, CROP_SCORING_HEIGHT), interpolation=interpolation)
+
+    sharpness = float(cv2.Laplacian(normalized, cv2.CV_64F).var())
+    mean = float(gray.mean())
+    clipped = float(((gray < 10) | (gray > 245)).mean())
+    skew = estimate_skew(normalized)
+
+    size_score = min(1.0, height / CROP_GOOD_HEIGHT)
+    sharpness_score = min(1.0, sharpness / CROP_GOOD_SHARPNESS)
+    exposure_score = max(0.0, min(1.0, mean / 60, (255 - mean) / 60) * (1.0 - 2 * clipped))
+    skew_score = max(0.0, 1.0 - abs(skew) / CROP_MAX_SKEW)
+    # Skew is corrected before OCR, so it weighs less than blur or size
+    score = size_score * sharpness_score * exposure_score * (0.5 + 0.5 * skew_score)
+
+    reasons = []
+    if height < CROP_MIN_HEIGHT:
+        reasons.append("too_small")
+    if sharpness < CROP_MIN_SHARPNESS:
+        reasons.append("blurred")
+    if exposure_score < 0.2:
+        reasons.append("underexposed" if mean < 128 else "overexposed")
+    if abs(skew) > CROP_MAX_SKEW:
+        reasons.append("skewed")
+    decision = "reject" if reasons else "accept" if score >= CROP_ACCEPT_SCORE else "defer"
+    return {
+        "decision": decision,
+        "score": round(score, 3),
+        "height": height,
+        "sharpness": round(sharpness, 1),
+        "brightness": round(mean, 1),
+        "clipped": round(clipped, 3),
+        "skew": round(skew, 1),
+        "reasons": reasons,
+    }
+
+def order_corners(points: np.ndarray) -> np.ndarray:
+    """Top-left, top-right, bottom-right, bottom-left."""
+    points = points.astype(np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                     points[np.argmax(sums)], points[np.argmax(diffs)]], dtype=np.float32)
+
+def find_plate_quad(gray: np.ndarray) -> Optional[np.ndarray]:
+    """The plate's outline when it is a clear quadrilateral filling most of the crop."""
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (3, 3), 0), 50, 150)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = 0.4 * gray.shape[0] * gray.shape[1]
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        approx = cv2.approxPolyDP(contour, 0.03 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.contourArea(approx) >= min_area:
+            return order_corners(approx.reshape(4, 2))
+    return None
+
+def rectify_crop(crop: np.ndarray, skew: float) -> np.ndarray:
+    """Warp the plate to a frontal rectangle, or at least rotate out the skew."""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    corners = find_plate_quad(gray)
+    if corners is not None:
+        width = int(max(np.linalg.norm(corners[1] - corners[0]), np.linalg.norm(corners[2] - corners[3])))
+        height = max(1, int(width / PLATE_ASPECT))
+        target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+        return cv2.warpPerspective(crop, cv2.getPerspectiveTransform(corners, target), (width, height))
+    if abs(skew) >= 1.0:
+        height, width = crop.shape[:2]
+        rotation = cv2.getRotationMatrix2D((width / 2, height / 2), skew, 1.0)
+        return cv2.warpAffine(crop, rotation, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return crop
+
+class CropUpscaler:
+    """Brings small plate crops up to PLATE_UPSCALE_HEIGHT before OCR.
+
+    Uses an OpenCV super-resolution model (cv2.dnn_superres, opencv-contrib)
+    when PLATE_SR_MODEL names one, e.g. FSRCNN_x3.pb or ESPCN_x4.pb; the
+    algorithm and scale are read from the file name. Without it, or if it
+    fails to load, crops are resized with bicubic interpolation.
+    """
+
+    def __init__(self, model_path: str, target_height: int):
+        self.model_path = model_path
+        self.target_height = target_height
+        self.model = None
+        self.loaded = False
+
+    def _load(self):
+        self.loaded = True
+        if not self.model_path:
+            return
+        match = re.match(r'([a-z]+)_x(\d)', Path(self.model_path).stem.lower())
+        if not hasattr(cv2, "dnn_superres") or not match:
+            logger.warning(f"Super-resolution model {self.model_path} unavailable; using bicubic upscaling")
+            return
+        try:
+            model = cv2.dnn_superres.DnnSuperResImpl_create()
+            model.readModel(self.model_path)
+            model.setModel(match.group(1), int(match.group(2)))
+            self.model = model
+            logger.info(f"Plate super-resolution model loaded from {self.model_path}")
+        except Exception as e:
+            logger.error(f"Failed to load super-resolution model: {e}")
+
+    def upscale(self, crop: np.ndarray) -> np.ndarray:
+        height, width = crop.shape[:2]
+        if not self.target_height or height >= self.target_height:
+            return crop
+        if not self.loaded:
+            self._load()
+        if self.model is not None:
+            try:
+                return self.model.upsample(crop)
+            except Exception as e:
+                logger.error(f"Super-resolution failed, falling back to bicubic: {e}")
+                self.model = None
+        scale = self.target_height / height
+        return cv2.resize(crop, (int(width * scale), self.target_height), interpolation=cv2.INTER_CUBIC)
+
+def box_iou(a: List[int], b: List[int]) -> float:
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
 # ==================== PLATE RECOGNITION ENGINE ====================
 
 class PlateRecognitionEngine:
@@ -178,6 +904,10 @@ class PlateRecognitionEngine:
         self.initialized = False
         self.last_detection_time = 0
         self.detection_cooldown = 1.0  # 1 second between detections
+        self.lock = threading.Lock()
+        self.tracks: Dict[str, Dict[str, Any]] = {}  # source -> plate currently in view
+        self.upscaler = CropUpscaler(PLATE_SR_MODEL, PLATE_UPSCALE_HEIGHT)
+        self.clock = time.time  # the benchmark swaps in video time
     
     def initialize(self):
         """Initialize YOLOv8 model"""
@@ -296,11 +1026,69 @@ class PlateRecognitionEngine:
             logger.error(f"Tesseract OCR error: {e}")
             return None
     
-    async def detect_plate(self, frame: np.ndarray) -> Optional[Dict[str, Any]]:
-        """Detect license plates directly using a custom YOLOv8 model and OCR."""
-        import time
-        
-        current_time = time.time()
+    def locate_plate(self, frame: np.ndarray) -> Optional[Tuple[List[int], float]]:
+        """Run the YOLOv8 plate model and return the best box and its confidence."""
+        results = self.yolo_model(frame, verbose=False, conf=0.4)
+
+        best_detection = None
+        max_conf = 0
+
+        # Find the best detection based on confidence
+        for result in results:
+            for box in result.boxes:
+                conf = float(box.conf[0])
+                if conf > max_conf:
+                    max_conf = conf
+                    best_detection = box
+
+        if not best_detection:
+            return None
+
+        x1, y1, x2, y2 = map(int, best_detection.xyxy[0])
+
+        # Ensure coordinates are valid
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(frame.shape[1], x2), min(frame.shape[0], y2)
+        return [x1, y1, x2, y2], max_conf
+
+    async def detect_plate(self, frame: np.ndarray, source: str = "default") -> Optional[Dict[str, Any]]:
+        """Detect license plates without blocking the event loop."""
+        return await asyncio.to_thread(self.detect, frame, source)
+
+    def detect(self, frame: np.ndarray, source: str = "default",
+               trace: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Detect license plates directly using a custom YOLOv8 model and OCR.
+
+        Blocking; camera workers call this from their own threads, and the lock
+        keeps them from running the shared model concurrently. source (the
+        camera id) keeps the plate tracks of different cameras apart.
+
+        When given, trace is filled with the seconds spent in each stage
+        (locate, quality, ocr) and in total under the lock ("inference"),
+        plus the crop "decision". It stays empty when the call returned
+        without running the model (cooldown), so waiting for the lock and
+        skipped frames never count as inference time.
+        """
+        with self.lock:
+            started = time.perf_counter()
+            result = self._detect(frame, source, trace)
+            if trace is not None and "locate" in trace:
+                trace["inference"] = time.perf_counter() - started
+            return result
+
+    def end_track(self, source: str) -> Optional[Dict[str, Any]]:
+        """Close the track of source, reading its best crop if it never got an OCR pass."""
+        with self.lock:
+            return self._end_track(source, self.clock())
+
+    @staticmethod
+    def _stage(trace: Optional[Dict[str, Any]], stage: str, started: float):
+        if trace is not None:
+            trace[stage] = trace.get(stage, 0.0) + time.perf_counter() - started
+
+    def _detect(self, frame: np.ndarray, source: str = "default",
+                trace: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        current_time = self.clock()
         if current_time - self.last_detection_time < self.detection_cooldown:
             return None
 
@@ -310,365 +1098,3075 @@ class PlateRecognitionEngine:
                 return None
 
         try:
-            # Run YOLOv8 detection for license plates
-            results = self.yolo_model(frame, verbose=False, conf=0.4)
-            
-            best_detection = None
-            max_conf = 0
-
-            # Find the best detection based on confidence
-            for result in results:
-                for box in result.boxes:
-                    conf = float(box.conf[0])
-                    if conf > max_conf:
-                        max_conf = conf
-                        best_detection = box
-
-            if best_detection:
-                x1, y1, x2, y2 = map(int, best_detection.xyxy[0])
-
-                # Ensure coordinates are valid
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(frame.shape[1], x2), min(frame.shape[0], y2)
-
-                # Crop the plate region
-                plate_region = frame[y1:y2, x1:x2]
-
-                if plate_region.size > 0:
-                    # Perform OCR on the cropped plate
-                    plate_text = self.ocr_with_tesseract(plate_region)
-                    
-                    if plate_text and len(plate_text) >= 5:
-                        self.last_detection_time = current_time
-                        return {
-                            "plate": plate_text,
-                            "confidence": max_conf,
-                            "bbox": [x1, y1, x2, y2]
-                        }
-            
-            return None
+            started = time.perf_counter()
+            with INFERENCE_LATENCY.time():
+                located = self.locate_plate(frame)
+            self._stage(trace, "locate", started)
+
+            if not located:
+                return self._track_lost(source, current_time, trace)
+
+            bbox, max_conf = located
+            x1, y1, x2, y2 = bbox
+
+            # Crop the plate region
+            plate_region = frame[y1:y2, x1:x2]
+            if plate_region.size == 0:
+                return None
+            if not CROP_QUALITY_ENABLED:
+                return self._read({"crop": plate_region, "confidence": max_conf, "bbox": bbox}, current_time,
+                                  trace=trace)
+
+            started = time.perf_counter()
+            quality = score_crop(plate_region)
+            self._stage(trace, "quality", started)
+            CROP_DECISIONS.inc(decision=quality["decision"])
+            if trace is not None:
+                trace["decision"] = quality["decision"]
+            if quality["decision"] == "reject":
+                return None
+            return self._track_crop(source, {
+                "crop": plate_region.copy(), "confidence": max_conf, "bbox": bbox, "quality": quality,
+            }, current_time, trace)
 
         except Exception as e:
             logger.error(f"Plate detection error: {e}")
             return None
 
-plate_engine = PlateRecognitionEngine()
+    # --- tracks: the best crop of the car currently in front of each camera ---
 
-# ==================== CAMERA PROCESSING ====================
+    def _track_crop(self, source: str, candidate: Dict[str, Any], now: float,
+                    trace: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Keep the best crop per track and decide whether to spend an OCR pass now."""
+        track = self.tracks.get(source)
+        previous = None
+        if track and (now - track["last_seen"] > PLATE_TRACK_TIMEOUT or box_iou(track["bbox"], candidate["bbox"]) < 0.2):
+            previous = track  # a different car
+            track = None
+        if track is None:
+            track = self.tracks[source] = {"first_seen": now, "last_seen": now, "bbox": candidate["bbox"],
+                                           "best": None, "read": False}
+        track["last_seen"] = now
+        track["bbox"] = candidate["bbox"]
+        if track["best"] is None or candidate["quality"]["score"] > track["best"]["quality"]["score"]:
+            track["best"] = candidate
 
-async def process_camera_stream(camera_id: str, camera_data: Dict[str, Any]):
-    """Process camera stream and detect plates"""
-    camera_url = camera_data["url"]
-    camera_type = camera_data["type"]
-    fps = camera_data.get("fps", 15)
-    
-    # Try to open real camera
-    cap = None
-    frame_count = 0
-    is_demo_mode = False
-    
-    try:
-        if camera_type == "webcam":
-            # Try to parse as int for webcam index
-            try:
-                cam_index = int(camera_url)
-                cap = cv2.VideoCapture(cam_index)
-            except:
-                cap = cv2.VideoCapture(camera_url)
-        elif camera_type in ["rtsp", "http"]:
-            cap = cv2.VideoCapture(camera_url)
-        
-        if cap and cap.isOpened():
-            logger.info(f"Camera {camera_id} connected successfully")
-        else:
-            logger.warning(f"Camera {camera_id} connection failed, using demo mode")
-            is_demo_mode = True
-            if cap:
-                cap.release()
-            cap = None
-    except Exception as e:
-        logger.error(f"Camera {camera_id} error during initialization: {e}")
-        is_demo_mode = True
-        cap = None
-    
-    while camera_id in active_cameras:
-        try:
-            # Try to read from real camera
-            if cap and cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    logger.error(f"Camera {camera_id} failed to read frame, switching to demo mode")
-                    is_demo_mode = True
-                    cap.release()
-                    cap = None
-            
-            # Demo mode fallback
-            if is_demo_mode or cap is None:
-                frame = np.zeros((480, 640, 3), dtype=np.uint8)
-                color = (
-                    hash(camera_id) % 100 + 50,
-                    (hash(camera_id) * 2) % 100 + 50,
-                    (hash(camera_id) * 3) % 100 + 50
-                )
-                frame[:] = color
-                cv2.putText(frame, f"DEMO MODE - {camera_data['name']}", (10, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                cv2.putText(frame, f"Camera not accessible", (10, 60),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-                cv2.putText(frame, f"URL: {camera_url}", (10, 90),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
-            
-            # Resize frame if needed
-            if frame is not None and frame.shape[0] > 0:
-                frame = cv2.resize(frame, (640, 480))
-            
-            # Attempt plate detection (every 5th frame to save resources)
-            detection_result = None
-            if frame_count % 5 == 0:
-                detection_result = await plate_engine.detect_plate(frame)
-            
-            if detection_result:
-                plate_text = detection_result["plate"]
-                confidence = detection_result["confidence"]
-                
-                # Check if plate is registered
-                plate_record = await db.plates.find_one({
-                    "plates": plate_text
-                }, {"_id": 0})
-                
-                status = "unknown"
-                owner_info = None
-                
-                if plate_record:
-                    if plate_record["status"] == "blocked":
-                        status = "blocked"
-                    else:
-                        status = "allowed"
-                        # Trigger door opening
-                        camera_info = await db.cameras.find_one({"id": camera_id}, {"_id": 0})
-                        if camera_info:
-                            door_info = await db.doors.find_one({"id": camera_info["door_id"]}, {"_id": 0})
-                            if door_info:
-                                try:
-                                    requests.get(f"http://{door_info['ip']}{door_info['endpoint']}", timeout=2)
-                                except:
-                                    pass
-                    
-                    owner_info = {
-                        "owner_name": plate_record["owner_name"],
-                        "apartment": f"{plate_record['block_name']} - {plate_record['apartment_number']}"
-                    }
-                
-                # Draw detection on frame
-                bbox = detection_result["bbox"]
-                color_map = {"allowed": (0, 255, 0), "blocked": (0, 0, 255), "unknown": (0, 255, 255)}
-                cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), color_map[status], 3)
-                cv2.putText(frame, plate_text, (bbox[0], bbox[1] - 10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.9, color_map[status], 2)
-                
-                # Save detection
-                _, buffer = cv2.imencode('.jpg', frame)
-                img_base64 = base64.b64encode(buffer).decode('utf-8')
-                
-                detection = Detection(
-                    camera_id=camera_id,
-                    plate=plate_text,
-                    status=status,
-                    confidence=confidence,
-                    image_base64=img_base64,
-                    owner_info=owner_info
-                )
-                
-                await db.detections.insert_one(detection.model_dump())
-                detection_buffer.append(detection.model_dump())
-                
-                # Broadcast to websocket clients
-                for ws_client in websocket_clients:
-                    try:
-                        await ws_client.send_json({
-                            "type": "detection",
-                            "data": detection.model_dump()
-                        })
-                    except:
-                        pass
-            
-            # Store latest frame
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
-            active_cameras[camera_id]["latest_frame"] = buffer.tobytes()
-            active_cameras[camera_id]["status"] = status if detection_result else "monitoring"
-            
-            frame_count += 1
-            await asyncio.sleep(1.0 / fps)
-            
-        except Exception as e:
-            logger.error(f"Camera {camera_id} error: {e}")
-            await asyncio.sleep(1)
-    
-    # Cleanup
-    if cap:
-        cap.release()
-    logger.info(f"Camera {camera_id} stream stopped")
+        best = track["best"]
+        if candidate["quality"]["decision"] == "accept":
+            # The best crop so far scores at least as well as this accepted one
+            return self._read(best, now, track, trace)
+        if not track["read"] and not best.get("tried") and now - track["first_seen"] >= CROP_DEFER_SECONDS:
+            # No good view came along; settle for the best one seen
+            return self._read(best, now, track, trace)
+        if previous and not previous["read"] and not previous["best"].get("tried"):
+            return self._read(previous["best"], now, previous, trace)
+        return None
 
-# ==================== API ROUTES ====================
+    def tracking(self, source: str, within: float = 1.0) -> bool:
+        """Whether a plate was in view of this source recently (read or not)."""
+        track = self.tracks.get(source)
+        return track is not None and self.clock() - track["last_seen"] <= within
 
-@api_router.get("/")
-async def root():
-    return {"message": "Evo Teknoloji Plaka Tanıma Sistemi API"}
+    def _track_lost(self, source: str, now: float, trace: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """The car left without a good view: its deferred best crop still gets one OCR pass."""
+        track = self.tracks.get(source)
+        if not track or now - track["last_seen"] <= PLATE_TRACK_TIMEOUT:
+            return None
+        return self._end_track(source, now, trace)
 
-# Sites
-@api_router.post("/sites", response_model=Site)
-async def create_site(site: SiteCreate):
-    site_obj = Site(**site.model_dump())
-    await db.sites.insert_one(site_obj.model_dump())
-    return site_obj
+    def _end_track(self, source: str, now: float, trace: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        track = self.tracks.pop(source, None)
+        if not track or track["read"] or track["best"].get("tried"):
+            return None
+        return self._read(track["best"], now, track, trace)
 
-@api_router.get("/sites", response_model=List[Site])
-async def get_sites():
-    sites = await db.sites.find({}, {"_id": 0}).to_list(1000)
-    return sites
+    def _read(self, candidate: Dict[str, Any], now: float, track: Optional[Dict[str, Any]] = None,
+              trace: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        crop = candidate["crop"]
+        quality = candidate.get("quality")
+        if quality:
+            candidate["tried"] = True
+            started = time.perf_counter()
+            crop = self.upscaler.upscale(rectify_crop(crop, quality["skew"]))
+            self._stage(trace, "quality", started)
 
-@api_router.put("/sites/{site_id}", response_model=Site)
-async def update_site(site_id: str, site: SiteCreate):
-    site_obj = Site(id=site_id, **site.model_dump())
-    await db.sites.update_one({"id": site_id}, {"$set": site_obj.model_dump()})
-    return site_obj
+        # Perform OCR on the cropped plate
+        started = time.perf_counter()
+        with OCR_LATENCY.time():
+            plate_text = self.ocr_with_tesseract(crop)
+        self._stage(trace, "ocr", started)
 
-@api_router.delete("/sites/{site_id}")
-async def delete_site(site_id: str):
-    await db.sites.delete_one({"id": site_id})
-    return {"message": "Site deleted"}
+        if plate_text and len(plate_text) >= 5:
+            self.last_detection_time = now
+            if track is not None:
+                track["read"] = True
+            result = {
+                "plate": plate_text,
+                "confidence": candidate["confidence"],
+                "bbox": candidate["bbox"]
+            }
+            if quality:
+                result["quality"] = quality
+            return result
+        return None
 
-# Plates
-@api_router.post("/plates", response_model=Plate)
-async def create_plate(plate: PlateCreate):
-    plate_obj = Plate(**plate.model_dump())
-    await db.plates.insert_one(plate_obj.model_dump())
-    return plate_obj
+plate_engine = PlateRecognitionEngine()
 
-@api_router.get("/plates", response_model=List[Plate])
-async def get_plates(site_id: Optional[str] = None, block_name: Optional[str] = None, status: Optional[str] = None):
-    query = {}
-    if site_id:
-        query["site_id"] = site_id
-    if block_name:
-        query["block_name"] = block_name
-    if status:
-        query["status"] = status
-    plates = await db.plates.find(query, {"_id": 0}).to_list(1000)
-    return plates
+def normalize_plate(text: str) -> Optional[str]:
+    """Normalize a plate typed by an operator with the rules applied to OCR output."""
+    cleaned = re.sub(r'[^0-9A-Za-z]', '', text or '')
+    if not cleaned:
+        return None
+    return plate_engine.validate_and_correct_plate(cleaned)
 
-@api_router.put("/plates/{plate_id}", response_model=Plate)
-async def update_plate(plate_id: str, plate: PlateCreate):
-    plate_obj = Plate(id=plate_id, **plate.model_dump())
-    await db.plates.update_one({"id": plate_id}, {"$set": plate_obj.model_dump()})
-    return plate_obj
+# ==================== PLATE INDEX ====================
 
-@api_router.delete("/plates/{plate_id}")
-async def delete_plate(plate_id: str):
-    await db.plates.delete_one({"id": plate_id})
-    return {"message": "Plate deleted"}
+PLATE_INDEX_MIGRATION = "plates_normalized_v1"
 
-# Doors
-@api_router.post("/doors", response_model=Door)
-async def create_door(door: DoorCreate):
-    door_obj = Door(**door.model_dump())
-    await db.doors.insert_one(door_obj.model_dump())
-    return door_obj
+async def ensure_plate_index():
+    """Normalize stored plates once, then enforce one owner per plate.
 
-@api_router.get("/doors", response_model=List[Door])
-async def get_doors():
-    doors = await db.doors.find({}, {"_id": 0}).to_list(1000)
-    return doors
+    The unique multikey index on `plates` makes the gate lookup an index hit
+    and stops the same plate being registered to two residents. Plates that
+    do not parse as Turkish plates are kept in cleaned upper-case form so no
+    data is lost; they can never match OCR output anyway.
+    """
+    done = await db.migrations.find_one({"id": PLATE_INDEX_MIGRATION})
+    if not done:
+        owners: Dict[str, str] = {}
+        updated = conflicts = 0
+        async for doc in db.plates.find({}, {"_id": 0, "id": 1, "plates": 1}).sort("created_at", 1):
+            normalized = []
+            for raw in doc.get("plates") or []:
+                plate = normalize_plate(raw) or re.sub(r'[^0-9A-Za-z]', '', raw or '').upper()
+                if not plate or plate in normalized:
+                    continue
+                if plate in owners and owners[plate] != doc["id"]:
+                    conflicts += 1
+                    logger.warning(f"Plate {plate} on record {doc['id']} already belongs to {owners[plate]}; removed")
+                    continue
+                owners[plate] = doc["id"]
+                normalized.append(plate)
+            if normalized != doc.get("plates"):
+                await db.plates.update_one({"id": doc["id"]}, {"$set": {"plates": normalized}})
+                updated += 1
+        await db.migrations.insert_one({
+            "id": PLATE_INDEX_MIGRATION,
+            "applied_at": datetime.now(timezone.utc).isoformat(),
+            "updated": updated,
+            "conflicts": conflicts,
+        })
+        logger.info(f"Plate normalization migration: {updated} records updated, {conflicts} duplicates removed")
 
-@api_router.put("/doors/{door_id}", response_model=Door)
-async def update_door(door_id: str, door: DoorCreate):
-    door_obj = Door(id=door_id, **door.model_dump())
-    await db.doors.update_one({"id": door_id}, {"$set": door_obj.model_dump()})
-    return door_obj
+    await db.plates.create_index(
+        "plates",
+        name="plates_unique",
+        unique=True,
+        # Records without plates would otherwise collide on the empty-array key
+        partialFilterExpression={"plates": {"$type": "string"}},
+    )
+    await db.plates.create_index("id", name="id_unique", unique=True)
 
-@api_router.delete("/doors/{door_id}")
-async def delete_door(door_id: str):
-    await db.doors.delete_one({"id": door_id})
-    return {"message": "Door deleted"}
+# ==================== DETECTION STORAGE ====================
 
-@api_router.post("/doors/{door_id}/open")
-async def open_door(door_id: str):
-    door = await db.doors.find_one({"id": door_id}, {"_id": 0})
-    if not door:
-        raise HTTPException(status_code=404, detail="Door not found")
-    try:
-        response = requests.get(f"http://{door['ip']}{door['endpoint']}", timeout=3)
-        return {"success": True, "message": "Door opened"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to open door: {str(e)}")
+DETECTION_RETENTION_DAYS = float(os.environ.get('DETECTION_RETENTION_DAYS', '0'))  # 0 keeps metadata forever
+DETECTION_IMAGE_RETENTION_DAYS = float(os.environ.get('DETECTION_IMAGE_RETENTION_DAYS', '0'))  # 0 keeps images forever
+DETECTIONS_TIMESERIES = os.environ.get('DETECTIONS_TIMESERIES', '').lower() in ('1', 'true', 'yes')
+DETECTION_COMPACTION_INTERVAL = float(os.environ.get('DETECTION_COMPACTION_INTERVAL', '3600'))
+DETECTION_DATETIME_MIGRATION = "detections_datetime_v1"
+# TTL indexes cannot be switched off, so "keep forever" is the largest allowed value (~68 years)
+TTL_FOREVER = 2**31 - 1
 
-# Cameras
-@api_router.post("/cameras", response_model=Camera)
-async def create_camera(camera: CameraCreate):
-    camera_obj = Camera(**camera.model_dump())
-    await db.cameras.insert_one(camera_obj.model_dump())
-    return camera_obj
+def detection_ttl_seconds() -> int:
+    return int(DETECTION_RETENTION_DAYS * 86400) if DETECTION_RETENTION_DAYS > 0 else TTL_FOREVER
 
-@api_router.get("/cameras", response_model=List[Camera])
-async def get_cameras():
-    cameras = await db.cameras.find({}, {"_id": 0}).to_list(1000)
-    return cameras
+async def migrate_detection_timestamps():
+    """Convert ISO-string timestamps written by older versions to BSON dates."""
+    if await db.migrations.find_one({"id": DETECTION_DATETIME_MIGRATION}):
+        return
+    converted = 0
+    batch = []
+    async for doc in db.detections.find({"timestamp": {"$type": "string"}}, {"_id": 1, "timestamp": 1}):
+        try:
+            parsed = datetime.fromisoformat(doc["timestamp"])
+        except ValueError:
+            continue
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"timestamp": parsed}}))
+        if len(batch) >= 1000:
+            converted += (await db.detections.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        converted += (await db.detections.bulk_write(batch, ordered=False)).modified_count
+    await db.migrations.insert_one({
+        "id": DETECTION_DATETIME_MIGRATION,
+        "applied_at": datetime.now(timezone.utc).isoformat(),
+        "converted": converted,
+    })
+    logger.info(f"Detection timestamp migration: {converted} records converted")
 
-@api_router.put("/cameras/{camera_id}", response_model=Camera)
-async def update_camera(camera_id: str, camera: CameraCreate):
-    camera_obj = Camera(id=camera_id, **camera.model_dump())
-    await db.cameras.update_one({"id": camera_id}, {"$set": camera_obj.model_dump()})
-    return camera_obj
+async def ensure_detection_storage():
+    """Create the detections collection layout, indexes and TTL retention."""
+    ttl = detection_ttl_seconds()
+    existing = await db.list_collection_names(filter={"name": "detections"})
+    if DETECTIONS_TIMESERIES and not existing:
+        await db.create_collection(
+            "detections",
+            timeseries={"timeField": "timestamp", "metaField": "camera_id", "granularity": "seconds"},
+            expireAfterSeconds=ttl,
+        )
+        logger.info("Created detections as a time-series collection")
 
-@api_router.delete("/cameras/{camera_id}")
-async def delete_camera(camera_id: str):
-    # Stop camera if active
-    if camera_id in active_cameras:
-        del active_cameras[camera_id]
-    await db.cameras.delete_one({"id": camera_id})
-    return {"message": "Camera deleted"}
+    options = await db.detections.options()
+    # Time-series collections cannot have a unique index, so the writer filters replays by id itself
+    detection_writer.dedupe_replay = "timeseries" in options
+    if "timeseries" in options:
+        if options.get("expireAfterSeconds") != ttl:
+            await db.command("collMod", "detections", expireAfterSeconds=ttl)
+        await db.detections.create_index("id", name="id")
+    else:
+        if DETECTIONS_TIMESERIES:
+            logger.warning("DETECTIONS_TIMESERIES is set but detections already exists as a regular collection; "
+                           "copy it into a new time-series collection to switch")
+        await migrate_detection_timestamps()
+        try:
+            await db.detections.create_index("timestamp", name="timestamp_ttl", expireAfterSeconds=ttl)
+        except OperationFailure:
+            # Retention changed since the index was built
+            await db.command("collMod", "detections", index={"name": "timestamp_ttl", "expireAfterSeconds": ttl})
+        await db.detections.create_index("id", name="id_unique", unique=True)
 
-@api_router.post("/cameras/{camera_id}/start")
-async def start_camera(camera_id: str):
-    camera = await db.cameras.find_one({"id": camera_id}, {"_id": 0})
-    if not camera:
+    await db.detections.create_index([("status", 1), ("timestamp", -1)], name="status_timestamp")
+    await db.detections.create_index([("camera_id", 1), ("timestamp", -1)], name="camera_timestamp")
+
+async def compact_detection_images():
+    """Drop stored frames older than the image retention while keeping the metadata."""
+    while True:
+        if DETECTION_IMAGE_RETENTION_DAYS > 0:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=DETECTION_IMAGE_RETENTION_DAYS)
+            try:
+                result = await db.detections.update_many(
+                    {"timestamp": {"$lt": cutoff}, "image_base64": {"$type": "string"}},
+                    {"$unset": {"image_base64": ""}},
+                )
+                if result.modified_count:
+                    logger.info(f"Compacted {result.modified_count} detection images older than {cutoff.date()}")
+                await db.visits.update_many(
+                    {"last_seen": {"$lt": cutoff}, "best_image_base64": {"$type": "string"}},
+                    {"$unset": {"best_image_base64": ""}},
+                )
+            except Exception as e:
+                # Time-series collections only accept these updates from MongoDB 7.0 on
+                logger.error(f"Detection image compaction failed: {e}")
+        await asyncio.sleep(DETECTION_COMPACTION_INTERVAL)
+
+def parse_date_bound(value: str, end: bool = False) -> datetime:
+    """Parse a report date filter; a bare date as the end bound includes that whole day."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+# ==================== DETECTION WRITER ====================
+
+WRITER_PENDING = metrics.gauge("lpr_detection_writer_pending", "Documents waiting to be written", ("collection",))
+WRITER_FLUSH_LATENCY = metrics.histogram("lpr_detection_writer_flush_seconds", "Bulk write latency per batch", ("collection",))
+WRITER_SPILLED = metrics.counter("lpr_detection_writer_spilled_total", "Documents written to the local spool file", ("collection",))
+WRITER_REPLAYED = metrics.counter("lpr_detection_writer_replayed_total", "Spooled documents replayed into MongoDB", ("collection",))
+WRITER_DROPPED = metrics.counter("lpr_detection_writer_dropped_total", "Documents dropped because every buffer was full", ("collection",))
+WRITER_DEAD_LETTERED = metrics.counter("lpr_detection_writer_dead_lettered_total", "Documents MongoDB rejected for good, kept in the dead-letter file", ("collection",))
+
+# Write errors worth retrying from the spool; any other per-document error
+# (validation, document too large, ...) fails the same way every time
+RETRYABLE_WRITE_CODES = {6, 7, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436}
+
+class DetectionWriter:
+    """Write-behind batching for detection inserts.
+
+    The camera loop hands documents to submit() and moves on. A background
+    task writes them with insert_many once batch_size documents are queued or
+    flush_interval has passed. When MongoDB is unreachable batches go to an
+    append-only NDJSON spool file and are replayed once writes succeed again.
+    Replays are idempotent because documents keep their _id and the detections
+    collection has a unique id index, so duplicate key errors are ignored.
+    A time-series collection cannot have that index; with dedupe_replay set
+    the writer looks up the ids of each replayed batch and skips those
+    already stored instead.
+
+    Documents MongoDB rejects for a reason that will not go away are moved
+    to a dead-letter file next to the spool rather than respooled, and a
+    replay records how many lines it has stored, so a failure resumes
+    where it stopped instead of resending the whole file.
+
+    With upsert_key the writer keeps one current document per key instead
+    (visits): each submit carries the whole document with an increasing
+    "revision", a batch keeps only the newest revision per key, and the
+    replace only matches an older stored revision. A stale replay then
+    fails on the unique key and is ignored like a duplicate insert.
+    """
+
+    def __init__(self, collection: str = "detections", batch_size: int = 200, flush_interval: float = 1.0,
+                 max_pending: int = 5000, write_timeout: float = 5.0, spool_dir: Path = ROOT_DIR / "spool",
+                 upsert_key: Optional[str] = None, dedupe_replay: bool = False):
+        self.collection = collection
+        self.upsert_key = upsert_key
+        self.dedupe_replay = dedupe_replay
+        # Called with the documents each insert actually stored (not duplicates)
+        self.on_inserted: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_timeout = write_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        # Documents that did not fit in the queue; the writer task spills them
+        self.overflow = deque(maxlen=max_pending)
+        self.spool_path = spool_dir / f"{collection}.ndjson"
+        self.replay_path = spool_dir / f"{collection}.replaying.ndjson"
+        self.replay_offset_path = spool_dir / f"{collection}.replaying.offset"
+        self.dead_letter_path = spool_dir / f"{collection}.dead.ndjson"
+        self.healthy = True
+        self.last_error: Optional[str] = None
+        self.written = 0
+        self._batch: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    def submit(self, doc: Dict[str, Any]):
+        """Queue a document without waiting; never blocks the caller."""
+        try:
+            self.queue.put_nowait(doc)
+            if self.queue.qsize() >= self.batch_size:
+                self._wakeup.set()
+        except asyncio.QueueFull:
+            if len(self.overflow) == self.overflow.maxlen:
+                WRITER_DROPPED.inc(collection=self.collection)
+            self.overflow.append(doc)
+        WRITER_PENDING.set(self.queue.qsize() + len(self.overflow), collection=self.collection)
+
+    async def _collect(self):
+        """Wait for a full batch or the flush interval, whichever comes first."""
+        if self.queue.qsize() < self.batch_size and not self._stopping:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+        self._wakeup.clear()
+        while len(self._batch) < self.batch_size and not self.queue.empty():
+            self._batch.append(self.queue.get_nowait())
+
+    async def _insert(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch and return the documents that still need to be stored."""
+        if self.upsert_key:
+            latest = {doc[self.upsert_key]: doc for doc in docs}
+            docs = list(latest.values())
+        try:
+            with WRITER_FLUSH_LATENCY.time(collection=self.collection):
+                if self.upsert_key:
+                    await asyncio.wait_for(db[self.collection].bulk_write([
+                        ReplaceOne({self.upsert_key: doc[self.upsert_key], "revision": {"$lt": doc["revision"]}}, doc, upsert=True)
+                        for doc in docs
+                    ], ordered=False), self.write_timeout)
+                else:
+                    await asyncio.wait_for(db[self.collection].insert_many(docs, ordered=False), self.write_timeout)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            failed = [err["index"] for err in errors if err.get("code") in RETRYABLE_WRITE_CODES]
+            dead = [err for err in errors if err.get("code") != 11000 and err.get("code") not in RETRYABLE_WRITE_CODES]
+            rejected = {err["index"] for err in errors}
+            self.written += len(docs) - len(rejected)
+            self._inserted([doc for index, doc in enumerate(docs) if index not in rejected])
+            if dead:
+                await asyncio.to_thread(self._append_dead_letter, [(docs[err["index"]], err) for err in dead])
+            return [docs[i] for i in failed]
+        except (PyMongoError, asyncio.TimeoutError) as e:
+            self.healthy = False
+            self.last_error = str(e) or e.__class__.__name__
+            return docs
+        self.healthy = True
+        self.written += len(docs)
+        self._inserted(docs)
+        return []
+
+    def _inserted(self, docs: List[Dict[str, Any]]):
+        if self.on_inserted and docs:
+            try:
+                self.on_inserted(docs)
+            except Exception as e:
+                logger.error(f"{self.collection} insert hook failed: {e}")
+
+    def _append_spool(self, docs: List[Dict[str, Any]]):
+        self.spool_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spool_path, "a", encoding="utf-8") as f:
+            for doc in docs:
+                f.write(json_util.dumps(doc) + "\n")
+
+    def _append_dead_letter(self, rejected: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for doc, error in rejected:
+                f.write(json_util.dumps({"error": {"code": error.get("code"), "errmsg": error.get("errmsg")},
+                                         "doc": doc}) + "\n")
+        WRITER_DEAD_LETTERED.inc(len(rejected), collection=self.collection)
+        logger.error(f"{len(rejected)} {self.collection} documents rejected by MongoDB; kept in {self.dead_letter_path}")
+
+    async def _spill(self, docs: List[Dict[str, Any]]):
+        if not docs:
+            return
+        await asyncio.to_thread(self._append_spool, docs)
+        WRITER_SPILLED.inc(len(docs), collection=self.collection)
+
+    def _claim_spool(self) -> bool:
+        """Move the spool aside so new spills never mix with a running replay."""
+        if self.replay_path.exists():
+            return True
+        if self.spool_path.exists():
+            # An offset left behind by a finished replay must not apply to the new file
+            self.replay_offset_path.unlink(missing_ok=True)
+            os.replace(self.spool_path, self.replay_path)
+            return True
+        return False
+
+    def _read_offset(self) -> int:
+        try:
+            return int(self.replay_offset_path.read_text(encoding="utf-8").strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _save_offset(self, offset: int):
+        tmp = self.replay_offset_path.with_suffix(".tmp")
+        tmp.write_text(str(offset), encoding="utf-8")
+        os.replace(tmp, self.replay_offset_path)
+
+    def _finish_replay(self):
+        self.replay_path.unlink()
+        self.replay_offset_path.unlink(missing_ok=True)
+
+    def _read_replay(self, skip: int = 0) -> Iterator[Tuple[List[Dict[str, Any]], int]]:
+        """Yield batches from the replay file with the line offset just after each."""
+        with open(self.replay_path, encoding="utf-8") as f:
+            batch = []
+            offset = 0
+            for line in f:
+                offset += 1
+                if offset <= skip:
+                    continue
+                if line.strip():
+                    batch.append(json_util.loads(line))
+                if len(batch) >= self.batch_size:
+                    yield batch, offset
+                    batch = []
+            if batch:
+                yield batch, offset
+
+    async def _drop_stored(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Remove documents whose id is already in the collection."""
+        ids = [doc["id"] for doc in docs if "id" in doc]
+        stored = set()
+        cursor = db[self.collection].find({"id": {"$in": ids}}, {"_id": 0, "id": 1})
+        async for doc in cursor:
+            stored.add(doc["id"])
+        return [doc for doc in docs if doc.get("id") not in stored]
+
+    async def _replay(self):
+        if not await asyncio.to_thread(self._claim_spool):
+            return
+        skip = await asyncio.to_thread(self._read_offset)
+        batches = self._read_replay(skip)
+        try:
+            while True:
+                item = await asyncio.to_thread(next, batches, None)
+                if item is None:
+                    break
+                batch, offset = item
+                pending = await asyncio.wait_for(self._drop_stored(batch), self.write_timeout) if self.dedupe_replay else batch
+                remaining = await self._insert(pending) if pending else []
+                if remaining:
+                    # MongoDB is unavailable again; the next replay resumes at this batch
+                    return
+                await asyncio.to_thread(self._save_offset, offset)
+                WRITER_REPLAYED.inc(len(batch), collection=self.collection)
+        finally:
+            batches.close()
+        await asyncio.to_thread(self._finish_replay)
+        logger.info(f"Replayed spooled {self.collection} into MongoDB")
+
+    async def _flush_once(self):
+        if self.overflow:
+            spilled = list(self.overflow)
+            self.overflow.clear()
+            await self._spill(spilled)
+        if self._batch:
+            await self._spill(await self._insert(self._batch))
+            self._batch = []
+        WRITER_PENDING.set(self.queue.qsize() + len(self.overflow), collection=self.collection)
+
+    async def run(self):
+        last_probe = 0.0
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            try:
+                await self._collect()
+                await self._flush_once()
+                if not self.healthy and loop.time() - last_probe > 10 * self.flush_interval:
+                    last_probe = loop.time()
+                    await asyncio.wait_for(client.admin.command("ping"), self.write_timeout)
+                    self.healthy = True
+                if self.healthy and (self.spool_path.exists() or self.replay_path.exists()):
+                    await self._replay()
+            except Exception as e:
+                self.last_error = str(e) or e.__class__.__name__
+                await asyncio.sleep(self.flush_interval)
+
+    def stop(self):
+        """Ask run() to finish after the batch it is working on."""
+        self._stopping = True
+        self._wakeup.set()
+
+    async def close(self):
+        """Flush whatever is queued; anything that cannot be written is spooled."""
+        while not self.queue.empty():
+            self._batch.append(self.queue.get_nowait())
+        await self._flush_once()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.queue.qsize() + len(self.overflow),
+            "written": self.written,
+            "healthy": self.healthy,
+            "spooled": self.spool_path.exists() or self.replay_path.exists(),
+            "dead_letters": self.dead_letter_path.exists(),
+            "last_error": self.last_error,
+        }
+
+detection_writer = DetectionWriter(
+    dedupe_replay=DETECTIONS_TIMESERIES,  # corrected by ensure_detection_storage once the collection is known
+    batch_size=int(os.environ.get('DETECTION_BATCH_SIZE', '200')),
+    flush_interval=float(os.environ.get('DETECTION_FLUSH_INTERVAL', '1.0')),
+    max_pending=int(os.environ.get('DETECTION_MAX_PENDING', '5000')),
+)
+
+# ==================== ACCESS POLICY ====================
+
+ACCESS_TZ = ZoneInfo(os.environ['ACCESS_TIMEZONE']) if os.environ.get('ACCESS_TIMEZONE') else None
+MINUTES_PER_DAY = 1440
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+def access_now() -> datetime:
+    """Current time in the zone schedules and validity dates are written in."""
+    return datetime.now(ACCESS_TZ) if ACCESS_TZ else datetime.now().astimezone()
+
+def parse_hhmm(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def parse_valid_until(value: Optional[str]) -> Optional[datetime]:
+    """A bare date is valid through the end of that day; unparsable values never expire."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if len(value) == 10:
+        parsed += timedelta(days=1)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=ACCESS_TZ) if ACCESS_TZ else parsed.astimezone()
+    return parsed
+
+class AccessPolicy:
+    """Plate rules compiled once per snapshot refresh for constant-time gate decisions.
+
+    Each plate maps to a rule holding its block flag, expiry instant, permitted
+    doors as a frozenset, and its weekly schedule as an integer bitmask with one
+    bit per minute of the week. A decision is one dict lookup plus a few
+    comparisons and a bit test, whatever the number of plates or windows.
+    Identical schedules share one mask.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.rules: Dict[str, Dict[str, Any]] = {}
+        masks: Dict[Tuple, int] = {}
+        for record in records:
+            rule = {
+                "record": record,
+                "blocked": record.get("status") == "blocked",
+                "expires_at": parse_valid_until(record.get("valid_until")),
+                "door_ids": frozenset(record["door_ids"]) if record.get("door_ids") else None,
+                "schedule": self._compile_schedule(record.get("schedule"), masks),
+            }
+            for plate in record.get("plates") or []:
+                self.rules[plate] = rule
+
+    @staticmethod
+    def _compile_schedule(windows: Optional[List[Dict[str, Any]]], masks: Dict[Tuple, int]) -> Optional[int]:
+        if not windows:
+            return None
+        key = tuple((tuple(w.get("days", range(7))), w.get("start", "00:00"), w.get("end", "24:00")) for w in windows)
+        if key in masks:
+            return masks[key]
+        mask = 0
+        for days, start, end in key:
+            start_min, end_min = parse_hhmm(start), parse_hhmm(end)
+            # A window ending before it starts runs past midnight into the next day
+            length = (end_min - start_min) % MINUTES_PER_DAY or MINUTES_PER_DAY
+            for day in days:
+                first = day * MINUTES_PER_DAY + start_min
+                for offset in (0, MINUTES_PER_WEEK):
+                    bits = ((1 << length) - 1) << first
+                    mask |= bits >> offset
+            mask &= (1 << MINUTES_PER_WEEK) - 1
+        masks[key] = mask
+        return mask
+
+    def evaluate(self, plate: str, door_id: Optional[str] = None, at: Optional[datetime] = None) -> Dict[str, Any]:
+        rule = self.rules.get(plate)
+        if rule is None:
+            return {"status": "unknown", "reason": "not_registered", "owner_info": None}
+
+        record = rule["record"]
+        owner_info = {
+            "owner_name": record["owner_name"],
+            "apartment": f"{record['block_name']} - {record['apartment_number']}"
+        }
+        at = at or access_now()
+        if rule["blocked"]:
+            reason = "blocked"
+        elif rule["expires_at"] and at >= rule["expires_at"]:
+            reason = "expired"
+        elif rule["door_ids"] is not None and door_id not in rule["door_ids"]:
+            reason = "door_not_permitted"
+        elif rule["schedule"] is not None and not (rule["schedule"] >> self._minute_of_week(at)) & 1:
+            reason = "outside_schedule"
+        else:
+            return {"status": "allowed", "reason": "ok", "owner_info": owner_info}
+        return {"status": "blocked", "reason": reason, "owner_info": owner_info}
+
+    @staticmethod
+    def _minute_of_week(at: datetime) -> int:
+        local = at.astimezone(ACCESS_TZ) if ACCESS_TZ else at.astimezone()
+        return local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+
+# ==================== ROLLUPS ====================
+
+def access_tz_name() -> str:
+    """The access time zone as MongoDB date operators expect it (IANA name or UTC offset)."""
+    if ACCESS_TZ:
+        return ACCESS_TZ.key
+    offset = access_now().strftime("%z")
+    return f"{offset[:3]}:{offset[3:]}"
+
+def local_day(timestamp: datetime) -> str:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)  # spooled documents come back naive
+    return timestamp.astimezone(ACCESS_TZ).strftime("%Y-%m-%d")
+
+class DetectionRollups:
+    """Hourly and daily summaries of detections, kept current during ingestion.
+
+    The detection writer reports every batch it stores; counts are summed in
+    memory and upserted with $inc every flush_interval, a handful of writes
+    however busy the gates are. Analytics read only these collections:
+
+      rollups_hourly        {hour (UTC), camera_id, status, count}
+      rollups_daily         {day, camera_id, status, count}
+      rollups_plates_daily  {day, plate, camera_id, count, per-status counts,
+                             owner_name, apartment, first_seen, last_seen}
+
+    Days are local dates in the access time zone. _ids are built the same
+    way here and in rebuild(), so a rebuilt range merges cleanly with live
+    increments.
+    """
+
+    STATUSES = ("allowed", "blocked", "unknown")
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self.hourly: Dict[Tuple, int] = {}
+        self.daily: Dict[Tuple, int] = {}
+        self.plates: Dict[Tuple, Dict[str, Any]] = {}
+        self.last_error: Optional[str] = None
+        self.rebuilding: Optional[Dict[str, Any]] = None
+        self.rebuild_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+
+    async def ensure_indexes(self):
+        await db.rollups_hourly.create_index("hour")
+        await db.rollups_daily.create_index("day")
+        await db.rollups_plates_daily.create_index("day")
+        await db.rollups_plates_daily.create_index([("plate", 1), ("day", 1)])
+
+    def add(self, docs: List[Dict[str, Any]]):
+        for doc in docs:
+            timestamp = doc["timestamp"]
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            hour = timestamp.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+            day = local_day(timestamp)
+            camera_id, status, plate = doc["camera_id"], doc["status"], doc["plate"]
+            self.hourly[(hour, camera_id, status)] = self.hourly.get((hour, camera_id, status), 0) + 1
+            self.daily[(day, camera_id, status)] = self.daily.get((day, camera_id, status), 0) + 1
+
+            entry = self.plates.setdefault((day, plate, camera_id), {
+                "count": 0, "first_seen": timestamp, "last_seen": timestamp, "owner_info": None,
+                **{status_name: 0 for status_name in self.STATUSES},
+            })
+            entry["count"] += 1
+            entry[status] = entry.get(status, 0) + 1
+            entry["first_seen"] = min(entry["first_seen"], timestamp)
+            entry["last_seen"] = max(entry["last_seen"], timestamp)
+            entry["owner_info"] = doc.get("owner_info") or entry["owner_info"]
+
+    def _operations(self, hourly, daily, plates) -> Dict[str, List[UpdateOne]]:
+        operations = {"rollups_hourly": [], "rollups_daily": [], "rollups_plates_daily": []}
+        for (hour, camera_id, status), count in hourly.items():
+            operations["rollups_hourly"].append(UpdateOne(
+                {"_id": {"h": hour, "c": camera_id, "s": status}},
+                {"$inc": {"count": count}, "$setOnInsert": {"hour": hour, "camera_id": camera_id, "status": status}},
+                upsert=True,
+            ))
+        for (day, camera_id, status), count in daily.items():
+            operations["rollups_daily"].append(UpdateOne(
+                {"_id": {"d": day, "c": camera_id, "s": status}},
+                {"$inc": {"count": count}, "$setOnInsert": {"day": day, "camera_id": camera_id, "status": status}},
+                upsert=True,
+            ))
+        for (day, plate, camera_id), entry in plates.items():
+            update = {
+                "$inc": {"count": entry["count"], **{name: entry[name] for name in self.STATUSES if entry[name]}},
+                "$min": {"first_seen": entry["first_seen"]},
+                "$max": {"last_seen": entry["last_seen"]},
+                "$setOnInsert": {"day": day, "plate": plate, "camera_id": camera_id},
+            }
+            owner = entry["owner_info"]
+            if owner:
+                update["$set"] = {"owner_name": owner.get("owner_name"), "apartment": owner.get("apartment")}
+            operations["rollups_plates_daily"].append(UpdateOne({"_id": {"d": day, "p": plate, "c": camera_id}}, update, upsert=True))
+        return operations
+
+    def _merge_back(self, hourly, daily, plates):
+        """Return increments that could not be written so the next flush retries them."""
+        for key, count in hourly.items():
+            self.hourly[key] = self.hourly.get(key, 0) + count
+        for key, count in daily.items():
+            self.daily[key] = self.daily.get(key, 0) + count
+        for key, entry in plates.items():
+            current = self.plates.get(key)
+            if current is None:
+                self.plates[key] = entry
+                continue
+            for name in ("count",) + self.STATUSES:
+                current[name] += entry[name]
+            current["first_seen"] = min(current["first_seen"], entry["first_seen"])
+            current["last_seen"] = max(current["last_seen"], entry["last_seen"])
+            current["owner_info"] = current["owner_info"] or entry["owner_info"]
+
+    async def flush(self):
+        if not (self.hourly or self.daily or self.plates):
+            return
+        hourly, daily, plates = self.hourly, self.daily, self.plates
+        self.hourly, self.daily, self.plates = {}, {}, {}
+        operations = self._operations(hourly, daily, plates)
+        try:
+            for collection, ops in operations.items():
+                if ops:
+                    await db[collection].bulk_write(ops, ordered=False)
+            self.last_error = None
+        except PyMongoError as e:
+            # A partly applied flush may count a few detections twice; rebuild() corrects that
+            self.last_error = str(e)
+            self._merge_back(hourly, daily, plates)
+
+    async def run(self):
+        while not self._stopping:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Rollup flush failed: {e}")
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    async def rebuild(self, start_day: str, end_day: str):
+        """Recompute the summaries of whole local days [start_day, end_day] from the detections."""
+        tz = access_tz_name()
+        start = datetime.fromisoformat(start_day).replace(tzinfo=ACCESS_TZ or access_now().tzinfo)
+        end = datetime.fromisoformat(end_day).replace(tzinfo=start.tzinfo) + timedelta(days=1)
+        self.rebuilding = {"start": start_day, "end": end_day, "started_at": datetime.now(timezone.utc).isoformat()}
+        try:
+            # Pending live increments belong to the range too; write them before deleting
+            await self.flush()
+            match = {"$match": {"timestamp": {"$gte": start, "$lt": end}}}
+            day_expr = {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp", "timezone": tz}}
+            await db.rollups_hourly.delete_many({"hour": {"$gte": start.astimezone(timezone.utc), "$lt": end.astimezone(timezone.utc)}})
+            await db.rollups_daily.delete_many({"day": {"$gte": start_day, "$lte": end_day}})
+            await db.rollups_plates_daily.delete_many({"day": {"$gte": start_day, "$lte": end_day}})
+
+            hour_expr = {"$dateTrunc": {"date": "$timestamp", "unit": "hour"}}
+            await db.detections.aggregate([
+                match,
+                {"$group": {"_id": {"h": hour_expr, "c": "$camera_id", "s": "$status"}, "count": {"$sum": 1}}},
+                {"$set": {"hour": "$_id.h", "camera_id": "$_id.c", "status": "$_id.s"}},
+                {"$merge": {"into": "rollups_hourly", "whenMatched": [{"$set": {"count": {"$add": ["$count", "$$new.count"]}}}]}},
+            ]).to_list(None)
+            await db.detections.aggregate([
+                match,
+                {"$group": {"_id": {"d": day_expr, "c": "$camera_id", "s": "$status"}, "count": {"$sum": 1}}},
+                {"$set": {"day": "$_id.d", "camera_id": "$_id.c", "status": "$_id.s"}},
+                {"$merge": {"into": "rollups_daily", "whenMatched": [{"$set": {"count": {"$add": ["$count", "$$new.count"]}}}]}},
+            ]).to_list(None)
+            status_counts = {name: {"$sum": {"$cond": [{"$eq": ["$status", name]}, 1, 0]}} for name in self.STATUSES}
+            await db.detections.aggregate([
+                match,
+                {"$sort": {"timestamp": 1}},
+                {"$group": {
+                    "_id": {"d": day_expr, "p": "$plate", "c": "$camera_id"},
+                    "count": {"$sum": 1},
+                    **status_counts,
+                    "first_seen": {"$min": "$timestamp"},
+                    "last_seen": {"$max": "$timestamp"},
+                    "owner_name": {"$last": "$owner_info.owner_name"},
+                    "apartment": {"$last": "$owner_info.apartment"},
+                }},
+                {"$set": {"day": "$_id.d", "plate": "$_id.p", "camera_id": "$_id.c"}},
+                {"$merge": {"into": "rollups_plates_daily", "whenMatched": [{"$set": {
+                    "count": {"$add": ["$count", "$$new.count"]},
+                    **{name: {"$add": [{"$ifNull": [f"${name}", 0]}, f"$$new.{name}"]} for name in self.STATUSES},
+                    "first_seen": {"$min": ["$first_seen", "$$new.first_seen"]},
+                    "last_seen": {"$max": ["$last_seen", "$$new.last_seen"]},
+                    "owner_name": {"$ifNull": ["$$new.owner_name", "$owner_name"]},
+                    "apartment": {"$ifNull": ["$$new.apartment", "$apartment"]},
+                }}]}},
+            ]).to_list(None)
+            logger.info(f"Rollups rebuilt for {start_day} .. {end_day}")
+        finally:
+            self.rebuilding = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self.hourly) + len(self.daily) + len(self.plates),
+            "last_error": self.last_error,
+            "rebuilding": self.rebuilding,
+        }
+
+detection_rollups = DetectionRollups(flush_interval=float(os.environ.get('ROLLUP_FLUSH_INTERVAL', '5')))
+# Every detection the writer stores is counted exactly once, including spool replays
+detection_writer.on_inserted = detection_rollups.add
+
+# ==================== AUTHORIZATION SNAPSHOT ====================
+
+class AuthorizationSnapshot:
+    """Local copy of the data a gate decision needs: plates, statuses, validity and camera→door.
+
+    It is refreshed from MongoDB every refresh_interval seconds and shortly after
+    any write to plates, cameras or doors, and persisted to disk so a restart
+    during a database outage still has something to decide with. Gate decisions
+    are made from the compiled AccessPolicy held here, never by querying MongoDB
+    per detection, so they keep working when the database does not.
+    """
+
+    PLATE_FIELDS = {"_id": 0, "id": 1, "site_id": 1, "plates": 1, "status": 1, "valid_until": 1,
+                    "owner_name": 1, "block_name": 1, "apartment_number": 1, "door_ids": 1, "schedule": 1}
+
+    def __init__(self, path: Path = ROOT_DIR / "cache" / "auth_snapshot.json", refresh_interval: float = 60.0,
+                 stale_after: float = 300.0):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.stale_after = stale_after
+        self.policy = AccessPolicy([])
+        self.camera_doors: Dict[str, Dict[str, Any]] = {}
+        self.loaded_at: Optional[float] = None
+        self.source: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self._dirty = asyncio.Event()
+
+    def load(self, records: List[Dict[str, Any]], cameras: List[Dict[str, Any]], doors: List[Dict[str, Any]]):
+        door_by_id = {door["id"]: {"id": door["id"], "ip": door["ip"], "endpoint": door["endpoint"]} for door in doors}
+        self.policy = AccessPolicy(records)
+        self.camera_doors = {camera["id"]: door_by_id[camera["door_id"]]
+                             for camera in cameras if camera.get("door_id") in door_by_id}
+
+    async def refresh(self):
+        records = await db.plates.find({}, self.PLATE_FIELDS).to_list(None)
+        cameras = await db.cameras.find({}, {"_id": 0, "id": 1, "door_id": 1}).to_list(None)
+        doors = await db.doors.find({}, {"_id": 0, "id": 1, "ip": 1, "endpoint": 1}).to_list(None)
+        self.load(records, cameras, doors)
+        self.loaded_at = time.time()
+        self.source = "mongo"
+        self.last_error = None
+        payload = {"saved_at": self.loaded_at, "plates": records, "cameras": cameras, "doors": doors}
+        await asyncio.to_thread(self._persist, payload)
+
+    def _persist(self, payload: Dict[str, Any]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def load_from_disk(self) -> bool:
+        """Load the last persisted snapshot; it is only read at startup, so a plain read will do."""
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return False
+        payload = json.loads(self.path.read_text(encoding="utf-8"))
+        self.load(payload["plates"], payload["cameras"], payload["doors"])
+        self.loaded_at = payload["saved_at"]
+        self.source = "disk"
+        return True
+
+    def request_refresh(self, broadcast: bool = True):
+        """Called by write endpoints; refreshes are coalesced by run()."""
+        self._dirty.set()
+        if broadcast:
+            # Other nodes hold their own snapshot and must not wait for their next interval
+            cluster.publish("auth_refresh")
+
+    async def run(self):
+        if self.loaded_at is None:
+            try:
+                if await asyncio.to_thread(self.load_from_disk):
+                    logger.info(f"Loaded authorization snapshot from {self.path}")
+            except Exception as e:
+                logger.error(f"Could not read authorization snapshot: {e}")
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.last_error = str(e) or e.__class__.__name__
+                logger.warning(f"Authorization snapshot refresh failed: {self.last_error}")
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._dirty.wait(), self.refresh_interval)
+            self._dirty.clear()
+            # Let a burst of writes (e.g. a bulk import) settle into one refresh
+            await asyncio.sleep(0.5)
+
+    # --- decisions ---
+
+    def decide(self, plate_text: str, camera_id: Optional[str] = None, door_id: Optional[str] = None,
+               at: Optional[datetime] = None) -> Dict[str, Any]:
+        if door_id is None and camera_id is not None:
+            door = self.camera_doors.get(camera_id)
+            door_id = door["id"] if door else None
+        return self.policy.evaluate(plate_text, door_id, at)
+
+    def door_for_camera(self, camera_id: str) -> Optional[Dict[str, Any]]:
+        return self.camera_doors.get(camera_id)
+
+    def status(self) -> Dict[str, Any]:
+        age = time.time() - self.loaded_at if self.loaded_at else None
+        return {
+            "source": self.source,
+            "loaded_at": datetime.fromtimestamp(self.loaded_at, timezone.utc).isoformat() if self.loaded_at else None,
+            "age_seconds": round(age, 1) if age is not None else None,
+            "stale": age is None or age > self.stale_after,
+            "database_available": self.last_error is None,
+            "plates": len(self.policy.rules),
+            "cameras": len(self.camera_doors),
+            "last_error": self.last_error,
+        }
+
+auth_snapshot = AuthorizationSnapshot(
+    refresh_interval=float(os.environ.get('AUTH_SNAPSHOT_INTERVAL', '60')),
+    stale_after=float(os.environ.get('AUTH_SNAPSHOT_STALE_AFTER', '300')),
+)
+
+# ==================== REFERENCE CACHE ====================
+
+REFERENCE_CACHE_TTL = float(os.environ.get('REFERENCE_CACHE_TTL', '300'))
+CACHE_LOOKUPS = metrics.counter("lpr_reference_cache_lookups_total", "Reference cache reads", ("collection", "result"))
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+class CacheEntry:
+    """A loaded value with its JSON encoding and ETag, computed once per load."""
+    __slots__ = ("value", "body", "etag", "loaded_at")
+
+    def __init__(self, value: Any, body: bytes):
+        self.value = value
+        self.body = body
+        self.etag = f'"{hashlib.md5(body).hexdigest()}"'
+        self.loaded_at = time.monotonic()
+
+class CachedCollection(Generic[ModelT]):
+    """In-process copy of a small reference collection (sites, doors, cameras).
+
+    Reads are served from memory as validated models plus their encoded
+    JSON. Every write handler calls invalidate() after its MongoDB write, so
+    the next read on this node reloads; other nodes hear about it through
+    the cluster event feed, and ttl bounds staleness if that is lost.
+    A load that overlaps an invalidation is returned but not kept, so a
+    write is never hidden behind data read before it.
+    """
+
+    def __init__(self, collection: str, model: Type[ModelT], ttl: float = 300.0):
+        self.collection = collection
+        self.model = model
+        self.ttl = ttl
+        self.adapter = TypeAdapter(List[model])
+        self.entry: Optional[CacheEntry] = None
+        self.version = 0
+        self._lock = asyncio.Lock()
+
+    async def _fetch(self) -> Any:
+        docs = await db[self.collection].find({}, {"_id": 0}).to_list(None)
+        return [self.model.model_validate(doc) for doc in docs]
+
+    def _fresh(self, entry: Optional[CacheEntry]) -> bool:
+        return entry is not None and time.monotonic() - entry.loaded_at < self.ttl
+
+    async def get(self) -> CacheEntry:
+        if self._fresh(self.entry):
+            CACHE_LOOKUPS.inc(collection=self.collection, result="hit")
+            return self.entry
+        async with self._lock:
+            if self._fresh(self.entry):
+                CACHE_LOOKUPS.inc(collection=self.collection, result="hit")
+                return self.entry
+            CACHE_LOOKUPS.inc(collection=self.collection, result="miss")
+            version = self.version
+            value = await self._fetch()
+            entry = CacheEntry(value, self.adapter.dump_json(value))
+            if version == self.version:
+                self.entry = entry
+            return entry
+
+    async def items(self) -> Any:
+        return (await self.get()).value
+
+    def invalidate(self, broadcast: bool = True):
+        self.version += 1
+        self.entry = None
+        if broadcast:
+            cluster.publish("cache_invalidate", {"collection": self.collection})
+
+class CachedDocument(CachedCollection[ModelT]):
+    """A single document such as the system settings; defaults are served, not inserted, when it is missing."""
+
+    def __init__(self, collection: str, model: Type[ModelT], doc_id: str, ttl: float = 300.0):
+        super().__init__(collection, model, ttl)
+        self.doc_id = doc_id
+        self.adapter = TypeAdapter(model)
+
+    async def _fetch(self) -> Any:
+        doc = await db[self.collection].find_one({"id": self.doc_id}, {"_id": 0})
+        return self.model.model_validate(doc) if doc else self.model()
+
+class ReferenceCache:
+    def __init__(self, ttl: float):
+        self.sites = CachedCollection("sites", Site, ttl)
+        self.doors = CachedCollection("doors", Door, ttl)
+        self.cameras = CachedCollection("cameras", Camera, ttl)
+        self.settings = CachedDocument("settings", Settings, "system_settings", ttl)
+        self.by_collection: Dict[str, CachedCollection] = {
+            cache.collection: cache for cache in (self.sites, self.doors, self.cameras, self.settings)
+        }
+
+    def invalidate(self, collection: str, broadcast: bool = True):
+        cache = self.by_collection.get(collection)
+        if cache:
+            cache.invalidate(broadcast=broadcast)
+
+reference_cache = ReferenceCache(REFERENCE_CACHE_TTL)
+
+async def cached_response(request: Request, cache: CachedCollection) -> Response:
+    """Serve a cached collection as JSON; browsers revalidate with If-None-Match for a 304."""
+    entry = await cache.get()
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == entry.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+# ==================== EVENT HUB ====================
+
+EVENT_TOPICS = ("detections", "stats", "cameras", "system")
+
+class DetectionCounters:
+    """Today's detection counts per status, kept up to date as detections are published.
+
+    Loaded once from MongoDB, then incremented in memory, so neither the
+    stats endpoint nor the dashboards scan the collection per detection.
+    Days are UTC, as in the original /detections/stats query.
+    """
+
+    def __init__(self):
+        self.day = None
+        self.counts = {"allowed": 0, "blocked": 0, "unknown": 0}
+
+    @staticmethod
+    def today() -> datetime:
+        return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    async def load(self):
+        today = self.today()
+        counts = {"allowed": 0, "blocked": 0, "unknown": 0}
+        async for row in db.detections.aggregate([
+            {"$match": {"timestamp": {"$gte": today}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ]):
+            counts[row["_id"]] = row["count"]
+        self.day, self.counts = today, counts
+
+    def current(self) -> bool:
+        return self.day == self.today()
+
+    def roll(self) -> bool:
+        """Start a new day at zero; returns True when the day changed."""
+        if self.day is None or self.current():
+            return False
+        self.day = self.today()
+        self.counts = {status: 0 for status in self.counts}
+        return True
+
+    def add(self, status: str) -> Optional[Dict[str, int]]:
+        """Count one detection; returns the delta to publish, or None before the first load."""
+        if self.day is None:
+            return None
+        self.roll()
+        self.counts[status] = self.counts.get(status, 0) + 1
+        return {"total_today": 1, f"{status}_today": 1}
+
+    def snapshot(self) -> Dict[str, int]:
+        return {
+            "total_today": sum(self.counts.values()),
+            "allowed_today": self.counts["allowed"],
+            "blocked_today": self.counts["blocked"],
+            "unknown_today": self.counts["unknown"]
+        }
+
+detection_counters = DetectionCounters()
+
+EVENT_FORMATS = ("json", "compact", "msgpack")
+
+def compact_detection(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Detection event without the embedded JPEG; images are fetched over HTTP when shown."""
+    owner = payload.get("owner_info") or None
+    return {
+        "id": payload["id"],
+        "camera_id": payload["camera_id"],
+        "plate": payload["plate"],
+        "status": payload["status"],
+        "confidence": round(payload["confidence"], 3),
+        "timestamp": payload["timestamp"],
+        "reason": payload.get("reason"),
+        "visit_id": payload.get("visit_id"),
+        "owner_info": owner and {key: owner.get(key) for key in ("owner_name", "apartment")},
+        "thumbnail_url": f"/api/detections/{payload['id']}/thumbnail",
+        "image_url": f"/api/detections/{payload['id']}/image",
+    }
+
+class Event:
+    """One published event; each wire format is encoded at most once."""
+
+    def __init__(self, seq: int, topic: str, kind: str, data: Any, compact: Any = None):
+        self.seq = seq
+        self.topic = topic
+        self.kind = kind
+        self.data = data
+        self.compact = data if compact is None else compact
+        self.encoded: Dict[str, Any] = {}
+
+    def encode(self, fmt: str):
+        if fmt not in self.encoded:
+            data = self.data if fmt == "json" else self.compact
+            message = {"seq": self.seq, "topic": self.topic, "type": self.kind, "data": data}
+            if fmt == "msgpack":
+                self.encoded[fmt] = msgpack.packb(message, default=str)
+            else:
+                self.encoded[fmt] = json.dumps(message, separators=(",", ":"), ensure_ascii=False, default=str)
+        return self.encoded[fmt]
+
+class Subscriber:
+    def __init__(self, topics: List[str], queue_size: int, fmt: str = "json"):
+        self.topics = set(topics)
+        self.format = fmt
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+class EventHub:
+    """Fan-out of dashboard events over /api/ws/detections.
+
+    Every event gets a sequence number and is encoded once per wire format,
+    however many clients receive it. Formats: "json" (full detection with
+    its JPEG, the original payload), "compact" (JSON, images by URL) and
+    "msgpack" (compact, as binary frames; needs the msgpack package).
+    Each client has a bounded queue drained by its own sender, so a slow
+    phone never holds up the camera loops; a client whose queue overflows
+    is told to resync. The last history_size events are kept so a
+    reconnecting client can resume from the last sequence it saw instead of
+    reloading everything.
+    """
+
+    SYSTEM_FIELDS = ("cpu_percent", "memory_percent", "memory_used_gb", "memory_total_gb",
+                     "gpu_available", "gpu_info", "active_cameras")
+
+    def __init__(self, history_size: int = 1000, queue_size: int = 256):
+        self.seq = 0
+        self.history = deque(maxlen=history_size)
+        self.queue_size = queue_size
+        self.subscribers: List[Subscriber] = []
+        self.system: Dict[str, Any] = {}
+
+    def _enqueue(self, subscriber: Subscriber, event: Event):
+        try:
+            subscriber.queue.put_nowait(event.encode(subscriber.format))
+        except asyncio.QueueFull:
+            WS_DROPS.inc()
+            subscriber.overflowed = True
+
+    def publish(self, topic: str, kind: str, data: Any, compact: Any = None):
+        self.seq += 1
+        event = Event(self.seq, topic, kind, data, compact)
+        self.history.append(event)
+        for subscriber in self.subscribers:
+            if topic in subscriber.topics:
+                self._enqueue(subscriber, event)
+
+    def subscribe(self, topics: List[str], since: Optional[int] = None, fmt: str = "json") -> Subscriber:
+        if fmt == "msgpack" and msgpack is None:
+            fmt = "compact"
+        subscriber = Subscriber(topics, self.queue_size, fmt)
+        self._enqueue(subscriber, Event(self.seq, "control", "hello",
+                                        {"seq": self.seq, "topics": sorted(subscriber.topics), "format": fmt}))
+        if since is not None and self.history and self.history[0].seq <= since + 1 and since <= self.seq:
+            for event in self.history:
+                if event.seq > since and event.topic in subscriber.topics:
+                    self._enqueue(subscriber, event)
+        else:
+            self._snapshot(subscriber, subscriber.topics)
+        self.subscribers.append(subscriber)
+        WS_SUBSCRIBERS.set(len(self.subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+        WS_SUBSCRIBERS.set(len(self.subscribers))
+
+    def update_topics(self, subscriber: Subscriber, message: str):
+        """Handle {"op": "subscribe"|"unsubscribe", "topics": [...]}; anything else is a keepalive."""
+        try:
+            request = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(request, dict):
+            return
+        topics = [topic for topic in request.get("topics") or [] if topic in EVENT_TOPICS]
+        if request.get("op") == "subscribe":
+            added = set(topics) - subscriber.topics
+            subscriber.topics |= added
+            # Newly added topics start from a snapshot
+            self._snapshot(subscriber, added)
+        elif request.get("op") == "unsubscribe":
+            subscriber.topics -= set(topics)
+
+    def _snapshot(self, subscriber: Subscriber, topics):
+        """Current state of each topic, stamped with the current sequence."""
+        for topic in topics:
+            compact = None
+            if topic == "detections":
+                data, kind = list(detection_buffer), "recent"
+                compact = [compact_detection(payload) for payload in data]
+            elif topic == "stats":
+                data, kind = detection_counters.snapshot(), "stats"
+            elif topic == "cameras":
+                data, kind = {camera_id: camera_status(camera_id, state) for camera_id, state in list(active_cameras.items())}, "cameras"
+            else:
+                data, kind = self.system, "system"
+            self._enqueue(subscriber, Event(self.seq, topic, kind, data, compact))
+
+    async def pump(self, websocket: WebSocket, subscriber: Subscriber):
+        """Sender for one client; ends when the socket fails."""
+        while True:
+            message = await subscriber.queue.get()
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_text(message)
+            if subscriber.overflowed and subscriber.queue.empty():
+                # Events were dropped: the client must reload state (reconnect without since)
+                subscriber.overflowed = False
+                resync = Event(self.seq, "control", "resync", None).encode(subscriber.format)
+                if isinstance(resync, bytes):
+                    await websocket.send_bytes(resync)
+                else:
+                    await websocket.send_text(resync)
+
+    def publish_system(self, sample: Dict[str, Any]):
+        """Publish the system fields that changed since the last sample."""
+        changed = {key: sample.get(key) for key in self.SYSTEM_FIELDS if self.system.get(key) != sample.get(key)}
+        if changed:
+            self.system.update(changed)
+            self.publish("system", "system", changed)
+        if detection_counters.roll():
+            self.publish("stats", "stats", detection_counters.snapshot())
+
+event_hub = EventHub(
+    history_size=int(os.environ.get('EVENT_HISTORY_SIZE', '1000')),
+    queue_size=int(os.environ.get('EVENT_QUEUE_SIZE', '256')),
+)
+
+def camera_status(camera_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": camera_id, "name": state.get("name"), "status": state.get("status"),
+            "demo_mode": state.get("demo_mode", False)}
+
+def set_camera_status(camera_id: str, camera_data: Dict[str, Any], status: str):
+    """Update a camera's status, publishing only actual changes."""
+    if camera_data.get("status") != status:
+        camera_data["status"] = status
+        event_hub.publish("cameras", "camera", camera_status(camera_id, camera_data))
+
+# ==================== VISITS ====================
+
+VISIT_WINDOW_SECONDS = float(os.environ.get('VISIT_WINDOW_SECONDS', '30'))
+VISITS_OPEN = metrics.gauge("lpr_visits_open", "Vehicles currently at a gate")
+VISIT_RECOGNITIONS_MERGED = metrics.counter(
+    "lpr_visit_recognitions_merged_total", "Recognitions folded into an open visit instead of stored", ("camera",)
+)
+
+class VisitTracker:
+    """Merges repeated recognitions of one car at one gate into a visit.
+
+    A car idling in front of the camera is read about once per second. The
+    first read of (camera, plate) opens a visit and goes through the full
+    path: door trigger, detection document, broadcast. Later reads within
+    window seconds of the previous one only extend the visit (last_seen,
+    recognitions, best snapshot by confidence) in memory. A change of gate
+    decision is a transition and is handled like an opening; a visit idle
+    for the window is closed, written and announced as "visit_closed".
+
+    Visits are stored one document per visit through their own writer in
+    upsert mode. The best snapshot stays in the detection it came from;
+    only a snapshot taken from a merged read is copied into the visit.
+    """
+
+    def __init__(self, writer: "DetectionWriter", window: float = 30.0):
+        self.writer = writer
+        self.window = timedelta(seconds=window)
+        self.open: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+
+    async def ensure_indexes(self):
+        ttl = detection_ttl_seconds()
+        try:
+            await db.visits.create_index("last_seen", name="last_seen_ttl", expireAfterSeconds=ttl)
+        except OperationFailure:
+            await db.command("collMod", "visits", index={"name": "last_seen_ttl", "expireAfterSeconds": ttl})
+        await db.visits.create_index("id", name="id_unique", unique=True)
+        await db.visits.create_index([("camera_id", 1), ("last_seen", -1)], name="camera_last_seen")
+        await db.visits.create_index([("plate", 1), ("last_seen", -1)], name="plate_last_seen")
+
+    def observe(self, camera_id: str, plate: str, decision: Dict[str, Any], confidence: float,
+                image_base64: Optional[str], detection_id: str) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Record a recognition; returns the visit and "opened", "status_changed" or None for a merged read."""
+        now = datetime.now(timezone.utc)
+        key = (camera_id, plate)
+        visit = self.open.get(key)
+        if visit and now - visit["last_seen"] > self.window:
+            self.close(key)
+            visit = None
+        if visit is None:
+            visit = self.open[key] = {
+                "id": str(uuid.uuid4()),
+                "camera_id": camera_id,
+                "plate": plate,
+                "state": "open",
+                "status": decision["status"],
+                "owner_info": decision["owner_info"],
+                "reason": decision["reason"],
+                "first_seen": now,
+                "last_seen": now,
+                "recognitions": 1,
+                "best_confidence": confidence,
+                "best_detection_id": detection_id,
+                "best_image_base64": image_base64,
+                "door_opened": False,  # set by publish_detection; a failed open is retried on the next read
+                "revision": 0,
+            }
+            VISITS_OPEN.set(len(self.open))
+            return visit, "opened"
+
+        visit["last_seen"] = now
+        visit["recognitions"] += 1
+        transition = None
+        if decision["status"] != visit["status"]:
+            # e.g. the plate was registered while the car waited
+            transition = "status_changed"
+            visit.update(status=decision["status"], owner_info=decision["owner_info"], reason=decision["reason"])
+        else:
+            VISIT_RECOGNITIONS_MERGED.inc(camera=camera_id)
+        if confidence > visit["best_confidence"] and image_base64:
+            visit.update(best_confidence=confidence, best_image_base64=image_base64,
+                         best_detection_id=detection_id if transition else None)
+        return visit, transition
+
+    def save(self, visit: Dict[str, Any]):
+        visit["revision"] += 1
+        doc = {key: value for key, value in visit.items() if key != "best_image_base64"}
+        if visit["best_detection_id"] is None:
+            doc["best_image_base64"] = visit["best_image_base64"]
+        self.writer.submit(doc)
+
+    def close(self, key: Tuple[str, str]):
+        visit = self.open.pop(key)
+        VISITS_OPEN.set(len(self.open))
+        visit["state"] = "closed"
+        self.save(visit)
+        payload = visit_payload(visit)
+        event_hub.publish("detections", "visit_closed", payload)
+        cluster.publish("visit_closed", payload)
+
+    async def run(self):
+        interval = min(1.0, self.window.total_seconds() / 4)
+        while not self._stopping:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            cutoff = datetime.now(timezone.utc) - self.window
+            for key in [key for key, visit in self.open.items() if visit["last_seen"] < cutoff]:
+                self.close(key)
+        # Visits still open at shutdown end here; nothing resumes them after a restart
+        for key in list(self.open):
+            self.close(key)
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    def find(self, visit_id: str) -> Optional[Dict[str, Any]]:
+        return next((visit for visit in self.open.values() if visit["id"] == visit_id), None)
+
+def visit_payload(visit: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-safe visit summary for events and the API (without the snapshot itself)."""
+    payload = {key: value for key, value in visit.items() if key not in ("_id", "best_image_base64", "revision")}
+    for key in ("first_seen", "last_seen"):
+        if isinstance(payload.get(key), datetime):
+            payload[key] = payload[key].isoformat()
+    payload["image_url"] = f"/api/visits/{visit['id']}/image"
+    return payload
+
+visit_writer = DetectionWriter(
+    collection="visits",
+    batch_size=int(os.environ.get('DETECTION_BATCH_SIZE', '200')),
+    flush_interval=float(os.environ.get('DETECTION_FLUSH_INTERVAL', '1.0')),
+    max_pending=int(os.environ.get('DETECTION_MAX_PENDING', '5000')),
+    upsert_key="id",
+)
+visit_tracker = VisitTracker(visit_writer, window=VISIT_WINDOW_SECONDS)
+
+# ==================== ADAPTIVE SAMPLING ====================
+
+SAMPLING_MAX_INFERENCE_FPS = float(os.environ.get('SAMPLING_MAX_INFERENCE_FPS', '5'))  # per camera, busy gate
+SAMPLING_MIN_INFERENCE_FPS = float(os.environ.get('SAMPLING_MIN_INFERENCE_FPS', '0.2'))  # per camera, idle gate
+SAMPLING_INFERENCE_BUDGET = float(os.environ.get('SAMPLING_INFERENCE_BUDGET', '0'))  # inferences/s for all cameras; 0 = measured capacity
+SAMPLING_CPU_BUDGET = float(os.environ.get('SAMPLING_CPU_BUDGET', '80'))  # host CPU percent
+SAMPLING_IDLE_FPS = float(os.environ.get('SAMPLING_IDLE_FPS', '5'))  # capture rate of an idle camera
+SAMPLING_HOLD_SECONDS = float(os.environ.get('SAMPLING_HOLD_SECONDS', '3'))  # stay busy this long after a plate
+SAMPLING_INTERVAL = float(os.environ.get('SAMPLING_INTERVAL', '1.0'))
+
+SAMPLING_INFERENCE_RATE = metrics.gauge("lpr_sampling_inference_fps", "Inference rate allotted per camera", ("camera",))
+SAMPLING_FACTOR = metrics.gauge("lpr_sampling_budget_factor", "Share of the inference budget in use after CPU and backlog feedback")
+
+class SamplingController:
+    """Decides how often each camera captures and runs plate inference.
+
+    Every camera reports its scene activity (frame difference, see
+    camera_workers.measure_activity) and whether a plate is in view. Once
+    per interval the controller turns that into a demand between
+    SAMPLING_MIN_INFERENCE_FPS (idle) and SAMPLING_MAX_INFERENCE_FPS (busy),
+    and shares the global budget out in proportion to demand, so a busy
+    gate gets inference and an idle one almost none. The budget is
+    SAMPLING_INFERENCE_BUDGET, or the measured capacity of the inference
+    workers, scaled by a factor that backs off multiplicatively when host
+    CPU exceeds SAMPLING_CPU_BUDGET or inference backs up and creeps back
+    when there is room. Idle cameras also capture at SAMPLING_IDLE_FPS.
+
+    The resulting intervals drive deadline scheduling in the camera loops:
+    a frame runs inference when its camera's inference deadline has passed.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.cameras: Dict[str, Dict[str, Any]] = {}
+        self.factor = 1.0
+        self.cpu_percent = 0.0
+        self.inference_seconds: Optional[float] = None  # moving average
+        self.backlog = 0
+        self.workers = 1
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def register(self, camera_id: str, camera_data: Dict[str, Any], controls=None) -> Dict[str, Any]:
+        fps = max(1, camera_data.get("fps", 15))
+        state = self.cameras[camera_id] = {
+            "fps": fps,
+            "activity": 0.0,
+            "hold_until": 0.0,
+            "capture_interval": 1.0 / fps,
+            # New cameras start busy until the first rebalance has seen them
+            "inference_interval": 1.0 / min(fps, SAMPLING_MAX_INFERENCE_FPS),
+            "next_inference": 0.0,
+            "controls": controls,  # shared array of a capture process
+        }
+        self._publish(state)
+        return state
+
+    def unregister(self, camera_id: str):
+        self.cameras.pop(camera_id, None)
+        SAMPLING_INFERENCE_RATE.remove(camera=camera_id)
+
+    def observe(self, camera_id: str, activity: float, plate_in_view: bool = False,
+                inference_seconds: Optional[float] = None, backlog: Optional[int] = None):
+        state = self.cameras.get(camera_id)
+        if state is None:
+            return
+        now = time.monotonic()
+        # Rises immediately, decays over about a second so one still frame does not idle a gate
+        state["activity"] = max(activity, state["activity"] * 0.7)
+        if plate_in_view:
+            state["hold_until"] = now + SAMPLING_HOLD_SECONDS
+        if inference_seconds is not None:
+            previous = self.inference_seconds
+            self.inference_seconds = inference_seconds if previous is None else previous * 0.9 + inference_seconds * 0.1
+        if backlog is not None:
+            self.backlog = backlog
+
+    def should_infer(self, camera_id: str) -> bool:
+        state = self.cameras.get(camera_id)
+        if state is None:
+            return False
+        now = time.monotonic()
+        if now < state["next_inference"]:
+            return False
+        state["next_inference"] = now + state["inference_interval"]
+        return True
+
+    @contextmanager
+    def inference(self):
+        """Counts thread-mode inferences waiting for the engine lock; that queue is the backlog."""
+        with self._lock:
+            self._inflight += 1
+            self.backlog = self._inflight - 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def status_of(self, camera_id: str) -> Optional[float]:
+        state = self.cameras.get(camera_id)
+        return round(1.0 / state["inference_interval"], 2) if state else None
+
+    def level(self, state: Dict[str, Any], now: float) -> float:
+        return 1.0 if now < state["hold_until"] else state["activity"]
+
+    def capacity(self) -> float:
+        if SAMPLING_INFERENCE_BUDGET > 0:
+            return SAMPLING_INFERENCE_BUDGET
+        if not self.inference_seconds:
+            return SAMPLING_MAX_INFERENCE_FPS * max(1, len(self.cameras))
+        # Leave headroom so bursts do not queue
+        return 0.8 * self.workers / self.inference_seconds
+
+    def rebalance(self):
+        now = time.monotonic()
+        if self.cpu_percent > SAMPLING_CPU_BUDGET or self.backlog > self.workers:
+            self.factor = max(0.1, self.factor * 0.8)
+        elif self.cpu_percent < 0.9 * SAMPLING_CPU_BUDGET and self.backlog == 0:
+            self.factor = min(1.0, self.factor + 0.05)
+        SAMPLING_FACTOR.set(round(self.factor, 3))
+
+        demands = {}
+        for camera_id, state in self.cameras.items():
+            level = self.level(state, now)
+            demands[camera_id] = SAMPLING_MIN_INFERENCE_FPS + (SAMPLING_MAX_INFERENCE_FPS - SAMPLING_MIN_INFERENCE_FPS) * level
+        total = sum(demands.values())
+        scale = min(1.0, self.capacity() * self.factor / total) if total else 1.0
+        for camera_id, state in self.cameras.items():
+            active = self.level(state, now) > 0.1
+            capture_fps = state["fps"] if active else min(state["fps"], SAMPLING_IDLE_FPS)
+            rate = min(capture_fps, max(SAMPLING_MIN_INFERENCE_FPS, demands[camera_id] * scale))
+            state["capture_interval"] = 1.0 / capture_fps
+            state["inference_interval"] = 1.0 / rate
+            # A camera that just became busy should not sit out the rest of a long idle interval
+            state["next_inference"] = min(state["next_inference"], now + state["inference_interval"])
+            self._publish(state)
+            SAMPLING_INFERENCE_RATE.set(round(rate, 3), camera=camera_id)
+
+    @staticmethod
+    def _publish(state: Dict[str, Any]):
+        controls = state["controls"]
+        if controls is not None:
+            controls[0] = state["capture_interval"]
+            controls[1] = state["inference_interval"]
+
+    async def run(self):
+        psutil.cpu_percent(None)  # primes the counter; the first reading is meaningless
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.cpu_percent = psutil.cpu_percent(None)
+                self.rebalance()
+            except Exception as e:
+                logger.error(f"Sampling rebalance failed: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "factor": round(self.factor, 3),
+            "cpu_percent": self.cpu_percent,
+            "cpu_budget": SAMPLING_CPU_BUDGET,
+            "backlog": self.backlog,
+            "capacity_fps": round(self.capacity(), 2),
+            "inference_ms": round(self.inference_seconds * 1000, 1) if self.inference_seconds else None,
+            "cameras": {
+                camera_id: {
+                    "activity": round(state["activity"], 3),
+                    "plate_in_view": now < state["hold_until"],
+                    "capture_fps": round(1.0 / state["capture_interval"], 2),
+                    "inference_fps": round(1.0 / state["inference_interval"], 2),
+                }
+                for camera_id, state in self.cameras.items()
+            },
+        }
+
+sampling = SamplingController(interval=SAMPLING_INTERVAL)
+
+# ==================== CAMERA PROCESSING ====================
+
+def decide_access(camera_id: str, plate_text: str) -> Dict[str, Any]:
+    """Gate decision for a recognised plate at a camera, from the in-memory policy."""
+    with LOOKUP_LATENCY.time():
+        return auth_snapshot.decide(plate_text, camera_id=camera_id)
+
+async def trigger_door(camera_id: str) -> bool:
+    """Open the door attached to a camera; returns whether the controller accepted the call."""
+    door_info = auth_snapshot.door_for_camera(camera_id)
+    if not door_info:
+        return False
+    url = f"http://{door_info['ip']}{door_info['endpoint']}"
+    try:
+        with DOOR_LATENCY.time():
+            # The controller call is blocking; keep it off the event loop
+            response = await asyncio.to_thread(requests.get, url, timeout=2)
+        if response.ok:
+            return True
+        logger.warning(f"Door controller {url} answered {response.status_code}")
+    except Exception as e:
+        logger.warning(f"Door controller {url} failed: {e}")
+    DOOR_FAILURES.inc()
+    return False
+
+STATUS_COLORS = {"allowed": (0, 255, 0), "blocked": (0, 0, 255), "unknown": (0, 255, 255)}
+
+def annotate_detection(camera_id: str, frame: np.ndarray, detection_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Decide on a plate read and draw it onto the frame; blocking, run off the loop."""
+    plate_text = detection_result["plate"]
+    # Check if plate is registered and currently allowed through this gate
+    decision = decide_access(camera_id, plate_text)
+    status = decision["status"]
+
+    # Draw detection on frame
+    bbox = detection_result["bbox"]
+    cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), STATUS_COLORS[status], 3)
+    cv2.putText(frame, plate_text, (bbox[0], bbox[1] - 10),
+               cv2.FONT_HERSHEY_SIMPLEX, 0.9, STATUS_COLORS[status], 2)
+
+    _, buffer = cv2.imencode('.jpg', frame)
+    return {
+        "plate": plate_text,
+        "confidence": detection_result["confidence"],
+        "decision": decision,
+        "image_base64": base64.b64encode(buffer).decode('utf-8'),
+    }
+
+def process_frame(camera_id: str, camera_data: Dict[str, Any], source: Dict[str, Any], run_detection: bool) -> Dict[str, Any]:
+    """Capture, detect and encode one frame.
+
+    Blocking; runs in a worker thread so a slow camera or model never stalls
+    the event loop. `source` carries the capture handle between frames.
+    """
+    cpu_started = time.thread_time()
+    frame = None
+    cap = source.get("cap")
+    if cap is not None and cap.isOpened():
+        ret, frame = read_frame(cap, camera_data.get("frame_skip") or 0)
+        if not ret:
+            logger.error(f"Camera {camera_id} failed to read frame, switching to demo mode")
+            cap.release()
+            source["cap"] = None
+            frame = None
+
+    # Demo mode fallback
+    if frame is None:
+        frame = render_demo_frame(camera_id, camera_data)
+
+    frame = prepare_frame(frame)
+    activity, source["previous"] = measure_activity(frame, source.get("previous"))
+
+    detection = None
+    detection_result = None
+    trace: Dict[str, Any] = {}
+    if run_detection:
+        with sampling.inference():
+            detection_result = plate_engine.detect(frame, camera_id, trace)
+    if detection_result:
+        detection = annotate_detection(camera_id, frame, detection_result)
+
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
+    return {
+        "jpeg": buffer.tobytes(),
+        "detection": detection,
+        "cpu_seconds": time.thread_time() - cpu_started,
+        "activity": activity,
+        # Time under the engine lock only; None when the engine skipped the frame (cooldown)
+        "detect_seconds": trace.get("inference"),
+        "plate_in_view": run_detection and plate_engine.tracking(camera_id),
+    }
+
+async def publish_detection(camera_id: str, camera_data: Dict[str, Any], detected: Dict[str, Any]) -> str:
+    """Open the gate if allowed, then store and broadcast a detection unless the read
+    only extends an open visit; returns its status."""
+    decision = detected["decision"]
+    status = decision["status"]
+    DETECTIONS.inc(camera=camera_id, status=status)
+    camera_data["detections"] += 1
+
+    detection_id = str(uuid.uuid4())
+    visit, transition = visit_tracker.observe(
+        camera_id, detected["plate"], decision, detected["confidence"], detected["image_base64"], detection_id
+    )
+    if transition is None:
+        # The same car is still at the gate: no document or broadcast, and no
+        # door trigger unless the last one failed and the car is still waiting
+        if status == "allowed" and not visit["door_opened"]:
+            visit["door_opened"] = await trigger_door(camera_id)
+        return status
+
+    if status == "allowed":
+        visit["door_opened"] = await trigger_door(camera_id)
+
+    detection = Detection(
+        id=detection_id,
+        camera_id=camera_id,
+        plate=detected["plate"],
+        status=status,
+        confidence=detected["confidence"],
+        image_base64=detected["image_base64"],
+        owner_info=decision["owner_info"],
+        reason=decision["reason"],
+        visit_id=visit["id"],
+    )
+
+    detection_writer.submit(detection.model_dump())
+    visit_tracker.save(visit)
+    payload = detection.model_dump(mode="json")
+    await broadcast_detection(payload)
+    cluster.publish("detection", payload)
+    return status
+
+async def broadcast_detection(payload: Dict[str, Any]):
+    """Add a detection to the recent list and push it to this node's websocket clients."""
+    detection_buffer.append(payload)
+    event_hub.publish("detections", "detection", payload, compact_detection(payload))
+    delta = detection_counters.add(payload["status"])
+    if delta:
+        event_hub.publish("stats", "stats_delta", delta)
+
+def record_frame(camera_id: str, camera_data: Dict[str, Any], jpeg: bytes, status: str):
+    """Store the latest preview frame and update the frame counters."""
+    camera_data["latest_frame"] = jpeg
+    set_camera_status(camera_id, camera_data, status)
+    camera_data["frames"] += 1
+    CAMERA_FRAMES.inc(camera=camera_id)
+    now = time.monotonic()
+    last_frame_at = camera_data.get("last_frame_at")
+    if last_frame_at is not None and now > last_frame_at:
+        # Exponentially smoothed so the gauge does not jitter between scrapes
+        previous = camera_data.get("measured_fps") or camera_data.get("fps", 15)
+        measured = 0.8 * previous + 0.2 * (1.0 / (now - last_frame_at))
+        camera_data["measured_fps"] = measured
+        CAMERA_FPS.set(round(measured, 2), camera=camera_id)
+    camera_data["last_frame_at"] = now
+
+async def process_camera_stream(camera_id: str, camera_data: Dict[str, Any]):
+    """Process camera stream and detect plates until the task is cancelled."""
+    schedule = sampling.register(camera_id, camera_data)
+    deadline = Deadline()
+    source: Dict[str, Any] = {"cap": None}
+    pending: Optional[asyncio.Future] = None
+
+    def open_source():
+        source["cap"] = open_camera_capture(camera_id, camera_data)
+
+    def release_source(work: Optional[asyncio.Future] = None):
+        if work is not None and not work.cancelled():
+            work.exception()  # retrieved so asyncio does not log it as lost
+        if source["cap"] is not None:
+            source["cap"].release()
+            source["cap"] = None
+
+    try:
+        # Blocking work is shielded so cancellation never abandons a capture
+        # handle halfway through a read; the finally block releases it after
+        pending = asyncio.ensure_future(asyncio.to_thread(open_source))
+        await asyncio.shield(pending)
+        while True:
+            try:
+                # Plate detection runs when the sampling controller's deadline for this camera is due
+                pending = asyncio.ensure_future(
+                    asyncio.to_thread(process_frame, camera_id, camera_data, source, sampling.should_infer(camera_id))
+                )
+                result = await asyncio.shield(pending)
+                camera_data["cpu_seconds"] += result["cpu_seconds"]
+                sampling.observe(camera_id, result["activity"], result["plate_in_view"], result["detect_seconds"])
+
+                status = "monitoring"
+                if result["detection"]:
+                    status = await publish_detection(camera_id, camera_data, result["detection"])
+
+                camera_data["demo_mode"] = source["cap"] is None
+                record_frame(camera_id, camera_data, result["jpeg"], status)
+                await asyncio.sleep(deadline.advance(schedule["capture_interval"]))
+
+            except Exception as e:
+                camera_data["errors"] += 1
+                logger.error(f"Camera {camera_id} error: {e}")
+                await asyncio.sleep(1)
+    finally:
+        # Cleanup; releasing under a blocked read can crash the decoder, so
+        # wait for any frame still in its worker thread
+        if pending is not None and not pending.done():
+            pending.add_done_callback(release_source)
+        else:
+            release_source()
+        sampling.unregister(camera_id)
+        CAMERA_FPS.remove(camera=camera_id)
+        logger.info(f"Camera {camera_id} stream stopped")
+
+# ==================== CAMERA WORKER PROCESSES ====================
+
+CAMERA_WORKER_MODE = os.environ.get('CAMERA_WORKER_MODE', 'thread')  # "thread" or "process"
+
+class CameraProcessPool:
+    """Runs cameras in child processes (CAMERA_WORKER_MODE=process).
+
+    Each camera gets a capture process writing into a FrameRing; a pool of
+    inference processes runs the plate engine on the frames it names. Every
+    camera is pinned to one inference process (a stable hash of its id picks
+    that process' queue), because the engine keeps per-camera state, the
+    detection cooldown and the plate track with its best crop, that would
+    split across processes otherwise. One reader thread drains the result
+    queue and hands messages to the owning camera task, which does the gate
+    decision and everything after it here. See camera_workers.py for the
+    child side.
+    """
+
+    def __init__(self, inference_workers: int, ring_slots: int):
+        self.inference_workers = max(1, inference_workers)
+        self.ring_slots = ring_slots
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: List[Any] = []
+        self.infer_queues: List[Any] = []
+        self.result_queue = None
+        self.inboxes: Dict[str, asyncio.Queue] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_started(self):
+        if self.infer_queues:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.result_queue = self.context.Queue(maxsize=2000)
+        for index in range(self.inference_workers):
+            # Small on purpose: a full queue makes capture workers skip frames
+            # instead of queueing work that will be stale by the time it runs
+            infer_queue = self.context.Queue(maxsize=2)
+            self.infer_queues.append(infer_queue)
+            process = self.context.Process(
+                target=inference_worker_main, args=(infer_queue, self.result_queue),
+                name=f"plate-inference-{index}", daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+        threading.Thread(target=self._read_results, name="camera-results", daemon=True).start()
+        sampling.workers = self.inference_workers
+        logger.info(f"Started {self.inference_workers} plate inference processes")
+
+    def _read_results(self):
+        while True:
+            message = self.result_queue.get()
+            if message is None:
+                return
+            self.loop.call_soon_threadsafe(self._dispatch, message)
+
+    def _dispatch(self, message):
+        kind, camera_id, payload = message
+        inbox = self.inboxes.get(camera_id)
+        if inbox is not None:
+            inbox.put_nowait((kind, payload))
+
+    def worker_queue(self, camera_id: str):
+        """The inference queue this camera always uses; crc32 is stable across runs, unlike hash()."""
+        return self.infer_queues[zlib.crc32(camera_id.encode("utf-8")) % len(self.infer_queues)]
+
+    def _watch_exit(self, process, inbox: asyncio.Queue):
+        """Post ("exit", None) to the inbox when the capture process ends.
+
+        loop.add_reader cannot watch a process handle on Windows, so a daemon
+        thread waits on the sentinel. It is a thread of its own rather than
+        asyncio.to_thread: one blocked default-executor thread per camera
+        would starve every other to_thread caller once cameras outnumber it.
+        """
+        def wait():
+            multiprocessing.connection.wait([process.sentinel])
+            with suppress(RuntimeError):  # the loop is already closed at shutdown
+                self.loop.call_soon_threadsafe(inbox.put_nowait, ("exit", None))
+        threading.Thread(target=wait, name=f"watch-{process.name}", daemon=True).start()
+
+    async def run_camera(self, camera_id: str, camera_data: Dict[str, Any]):
+        """Camera task body in process mode; same contract as process_camera_stream."""
+        self._ensure_started()
+        ring = FrameRing(slots=self.ring_slots)
+        stop_event = self.context.Event()
+        inbox: asyncio.Queue = asyncio.Queue()
+        self.inboxes[camera_id] = inbox
+        camera = {key: camera_data.get(key) for key in ("name", "type", "url", "fps") + CAPTURE_OPTIONS}
+        # Capture and inference intervals, rewritten by the sampling controller
+        controls = self.context.Array("d", 2, lock=False)
+        sampling.register(camera_id, camera_data, controls)
+        process = self.context.Process(
+            target=capture_worker_main,
+            args=(camera_id, camera, ring.name, self.ring_slots, self.worker_queue(camera_id), self.result_queue,
+                  stop_event, controls),
+            name=f"camera-{camera_id}", daemon=True,
+        )
+        try:
+            await asyncio.to_thread(process.start)
+            camera_data["pid"] = process.pid
+            self._watch_exit(process, inbox)
+            while True:
+                kind, payload = await inbox.get()
+                if kind == "exit":
+                    raise RuntimeError(f"capture process exited with code {process.exitcode}")
+                camera_data["cpu_seconds"] += payload.get("cpu_seconds", 0.0)
+                if kind == "frame":
+                    camera_data["demo_mode"] = payload["demo_mode"]
+                    camera_data["inference_skipped"] = payload["inference_skipped"]
+                    sampling.observe(camera_id, payload["activity"], backlog=payload["backlog"])
+                    record_frame(camera_id, camera_data, payload["jpeg"], camera_data.get("last_status", "monitoring"))
+                    camera_data["last_status"] = "monitoring"
+                elif kind == "inference":
+                    if payload.get("detect_seconds") is not None:
+                        INFERENCE_LATENCY.observe(payload["detect_seconds"])
+                    sampling.observe(camera_id, 0.0, payload.get("tracking", False), payload.get("detect_seconds"))
+                    if payload.get("plate"):
+                        try:
+                            frame = cv2.imdecode(np.frombuffer(payload["image"], np.uint8), cv2.IMREAD_COLOR)
+                            detected = await asyncio.to_thread(annotate_detection, camera_id, frame, payload)
+                            camera_data["last_status"] = await publish_detection(camera_id, camera_data, detected)
+                        except Exception as e:
+                            camera_data["errors"] += 1
+                            logger.error(f"Camera {camera_id} error: {e}")
+        finally:
+            # The watch thread returns by itself once the process below has exited
+            self.inboxes.pop(camera_id, None)
+            stop_event.set()
+            await asyncio.to_thread(self._reap, process)
+            ring.close()
+            sampling.unregister(camera_id)
+            CAMERA_FPS.remove(camera=camera_id)
+            logger.info(f"Camera {camera_id} worker process stopped")
+
+    @staticmethod
+    def _reap(process, timeout: float = 5.0):
+        if process.pid is None:
+            return
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    async def shutdown(self):
+        if not self.infer_queues:
+            return
+        for infer_queue in self.infer_queues:
+            infer_queue.put(None)
+        await asyncio.to_thread(lambda: [self._reap(process) for process in self.processes])
+        self.result_queue.put(None)
+
+camera_processes = CameraProcessPool(
+    inference_workers=int(os.environ.get('CAMERA_INFERENCE_WORKERS', '2')),
+    ring_slots=int(os.environ.get('FRAME_RING_SLOTS', '8')),
+)
+
+# ==================== CAMERA SUPERVISOR ====================
+
+class CameraSupervisor:
+    """Owns the processing task of every running camera.
+
+    Starting, stopping and reconfiguring a camera all go through here so a
+    camera never ends up with two loops, and stopping cancels the task and
+    waits for it to release the capture device. A task that crashes is
+    started again after a backoff.
+    """
+
+    RESTART_BACKOFF_MAX = 60.0
+
+    def __init__(self):
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.pending_restarts: Dict[str, asyncio.TimerHandle] = {}
+        self.lock = asyncio.Lock()
+
+    def is_running(self, camera_id: str) -> bool:
+        if camera_id in self.pending_restarts:
+            return True
+        task = self.tasks.get(camera_id)
+        return task is not None and not task.done()
+
+    def _launch(self, camera: Dict[str, Any], restarts: int = 0):
+        camera_id = camera["id"]
+        state = {
+            "name": camera["name"],
+            "type": camera["type"],
+            "url": camera["url"],
+            "fps": camera.get("fps", 15),
+            "latest_frame": None,
+            "status": "starting",
+            "started_at": time.monotonic(),
+            "frames": 0,
+            "detections": 0,
+            "errors": 0,
+            "cpu_seconds": 0.0,
+            "restarts": restarts,
+        }
+        state.update({option: camera.get(option) for option in CAPTURE_OPTIONS})
+        active_cameras[camera_id] = state
+        event_hub.publish("cameras", "camera", camera_status(camera_id, state))
+        runner = camera_processes.run_camera if CAMERA_WORKER_MODE == "process" else process_camera_stream
+        task = asyncio.create_task(runner(camera_id, state), name=f"camera:{camera_id}")
+        task.add_done_callback(lambda done: self._finished(camera, done))
+        self.tasks[camera_id] = task
+
+    def _finished(self, camera: Dict[str, Any], task: asyncio.Task):
+        camera_id = camera["id"]
+        if self.tasks.get(camera_id) is not task:
+            return
+        del self.tasks[camera_id]
+        if task.cancelled() or task.exception() is None:
+            self._forget(camera_id)
+            return
+        state = active_cameras.get(camera_id, {})
+        restarts = state.get("restarts", 0) + 1
+        delay = min(self.RESTART_BACKOFF_MAX, 2.0 ** restarts)
+        if state:
+            set_camera_status(camera_id, state, "restarting")
+        logger.error(f"Camera {camera_id} task crashed: {task.exception()!r}; restarting in {delay:.0f}s")
+        self.pending_restarts[camera_id] = asyncio.get_running_loop().call_later(
+            delay, self._restart, camera, restarts
+        )
+
+    def _restart(self, camera: Dict[str, Any], restarts: int):
+        if self.pending_restarts.pop(camera["id"], None) is not None:
+            self._launch(camera, restarts)
+
+    def _forget(self, camera_id: str):
+        if active_cameras.pop(camera_id, None) is not None:
+            event_hub.publish("cameras", "camera", {"id": camera_id, "status": "stopped"})
+
+    async def _cancel(self, camera_id: str):
+        handle = self.pending_restarts.pop(camera_id, None)
+        if handle is not None:
+            handle.cancel()
+        task = self.tasks.pop(camera_id, None)
+        self._forget(camera_id)
+        if task is None:
+            return
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    async def start(self, camera: Dict[str, Any]) -> bool:
+        """Start a camera; returns False when it was already running."""
+        async with self.lock:
+            if self.is_running(camera["id"]):
+                return False
+            self._launch(camera)
+            return True
+
+    async def stop(self, camera_id: str) -> bool:
+        """Stop a camera; returns False when it was not running."""
+        async with self.lock:
+            running = self.is_running(camera_id)
+            await self._cancel(camera_id)
+            return running
+
+    async def apply(self, camera: Dict[str, Any]):
+        """Pick up an edited camera: restart it with the new settings, or stop it when disabled."""
+        async with self.lock:
+            if not self.is_running(camera["id"]):
+                return
+            await self._cancel(camera["id"])
+            if camera.get("enabled", True):
+                self._launch(camera)
+                logger.info(f"Camera {camera['id']} restarted with new settings")
+
+    async def start_enabled(self):
+        """Start every camera marked enabled; called once at startup."""
+        started = 0
+        async for camera in db.cameras.find({"enabled": True}, {"_id": 0}):
+            if await self.start(camera):
+                started += 1
+        return started
+
+    async def shutdown(self):
+        async with self.lock:
+            camera_ids = set(self.tasks) | set(self.pending_restarts)
+            await asyncio.gather(*(self._cancel(camera_id) for camera_id in camera_ids))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        stats = {}
+        for camera_id, state in list(active_cameras.items()):
+            uptime = now - state["started_at"]
+            stats[camera_id] = {
+                "name": state["name"],
+                "status": state["status"],
+                "demo_mode": state.get("demo_mode", False),
+                "uptime_seconds": round(uptime, 1),
+                "fps": round(state.get("measured_fps") or 0.0, 2),
+                "frames": state["frames"],
+                "detections": state["detections"],
+                "errors": state["errors"],
+                "restarts": state["restarts"],
+                "inference_skipped": state.get("inference_skipped", 0),
+                "inference_fps": sampling.status_of(camera_id),
+                "pid": state.get("pid"),  # capture process in CAMERA_WORKER_MODE=process
+                "cpu_seconds": round(state["cpu_seconds"], 3),
+                # Share of one core spent on this camera's capture/inference/encode
+                "cpu_percent": round(state["cpu_seconds"] / uptime * 100, 1) if uptime > 0 else 0.0,
+            }
+        return stats
+
+camera_supervisor = CameraSupervisor()
+
+# ==================== CLUSTER ====================
+
+CLUSTER_MODE = os.environ.get('CLUSTER_MODE', '').lower() in ('1', 'true', 'yes')
+NODE_ID = os.environ.get('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+class ClusterCoordinator:
+    """Spreads cameras over several backend nodes using leases in MongoDB.
+
+    Every node heartbeats into `nodes`. Cameras are assigned to live nodes by
+    rendezvous hashing, so each node computes the same assignment and only a
+    failed or new node's share moves. A node runs a camera only while it
+    holds that camera's lease in `camera_leases`; leases are renewed every
+    heartbeat and expire after lease_seconds, which is how a dead node's
+    cameras get picked up by the others.
+
+    Detections and invalidations are relayed through the capped `events`
+    collection, tailed by every node, so websocket clients on any node see
+    all gates.
+    """
+
+    def __init__(self, node_id: str, lease_seconds: float, heartbeat_interval: float,
+                 node_url: Optional[str] = None, events_size: int = 64 * 1024 * 1024):
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.node_url = node_url
+        self.events_size = events_size
+        self.owned: Dict[str, Dict[str, Any]] = {}  # camera_id -> config it was started with
+        self.renewed_until = 0.0
+        self.live_nodes: List[str] = []
+        self.seen_events = deque(maxlen=2000)
+        self._pending_events: set = set()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    @staticmethod
+    def owner_for(camera_id: str, nodes: List[str]) -> Optional[str]:
+        """Rendezvous hashing: the node with the highest score for this camera wins."""
+        if not nodes:
+            return None
+        return max(nodes, key=lambda node: hashlib.md5(f"{node}:{camera_id}".encode()).digest())
+
+    def wake(self):
+        self._wakeup.set()
+
+    def cameras_changed(self):
+        """A camera was started, stopped, edited or deleted; reassign without waiting a heartbeat."""
+        self.wake()
+        self.publish("rebalance")
+
+    async def ensure_collections(self):
+        try:
+            await db.create_collection("events", capped=True, size=self.events_size)
+        except CollectionInvalid:
+            pass  # already there
+        await db.camera_leases.create_index("node_id")
+        await db.nodes.create_index("heartbeat_at")
+
+    async def _acquire(self, camera_id: str, now: datetime, expires: datetime) -> bool:
+        try:
+            await db.camera_leases.update_one(
+                {"_id": camera_id, "$or": [{"node_id": self.node_id}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"node_id": self.node_id, "expires_at": expires, "acquired_at": now}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False  # another node's lease has not run out yet
+
+    async def _release(self, camera_id: str):
+        self.owned.pop(camera_id, None)
+        await camera_supervisor.stop(camera_id)
+        await db.camera_leases.delete_one({"_id": camera_id, "node_id": self.node_id})
+        logger.info(f"Camera {camera_id} released by node {self.node_id}")
+
+    async def rebalance(self):
+        now = datetime.now(timezone.utc)
+        expires = now + timedelta(seconds=self.lease_seconds)
+        await db.nodes.update_one(
+            {"_id": self.node_id},
+            {
+                "$set": {"heartbeat_at": now, "url": self.node_url, "host": socket.gethostname(),
+                         "pid": os.getpid(), "cameras": sorted(self.owned)},
+                "$setOnInsert": {"started_at": now},
+            },
+            upsert=True,
+        )
+        alive_since = now - timedelta(seconds=self.lease_seconds)
+        self.live_nodes = [node["_id"] async for node in db.nodes.find({"heartbeat_at": {"$gte": alive_since}}, {"_id": 1})]
+        cameras = await db.cameras.find({"enabled": True}, {"_id": 0}).to_list(None)
+        wanted = {
+            camera["id"]: camera for camera in cameras
+            if self.owner_for(camera["id"], self.live_nodes) == self.node_id
+        }
+
+        # Hand back cameras that were disabled, deleted or now hash to another node
+        for camera_id in [camera_id for camera_id in self.owned if camera_id not in wanted]:
+            await self._release(camera_id)
+
+        if self.owned:
+            held = [lease["_id"] async for lease in db.camera_leases.find(
+                {"_id": {"$in": list(self.owned)}, "node_id": self.node_id}, {"_id": 1})]
+            await db.camera_leases.update_many(
+                {"_id": {"$in": held}, "node_id": self.node_id}, {"$set": {"expires_at": expires}}
+            )
+            for camera_id in [camera_id for camera_id in self.owned if camera_id not in held]:
+                # Our lease ran out (e.g. we could not reach MongoDB) and someone took over
+                logger.warning(f"Lease for camera {camera_id} lost, stopping it on node {self.node_id}")
+                self.owned.pop(camera_id)
+                await camera_supervisor.stop(camera_id)
+
+        for camera_id, camera in wanted.items():
+            if camera_id in self.owned:
+                if self.owned[camera_id] != camera:
+                    self.owned[camera_id] = camera
+                    await camera_supervisor.apply(camera)
+                continue
+            if await self._acquire(camera_id, now, expires):
+                self.owned[camera_id] = camera
+                await camera_supervisor.start(camera)
+                logger.info(f"Camera {camera_id} assigned to node {self.node_id}")
+        self.renewed_until = time.monotonic() + self.lease_seconds
+
+    async def run(self):
+        try:
+            await self.ensure_collections()
+        except PyMongoError as e:
+            logger.error(f"Cluster collections could not be prepared: {e}")
+        relay_task = asyncio.create_task(self.relay())
+        while not self._stopping:
+            try:
+                await self.rebalance()
+            except PyMongoError as e:
+                logger.error(f"Cluster heartbeat failed: {e}")
+                if self.owned and time.monotonic() > self.renewed_until:
+                    # Our leases have expired, so another node may already run these cameras
+                    logger.warning(f"Leases expired on node {self.node_id}, stopping {len(self.owned)} cameras")
+                    for camera_id in list(self.owned):
+                        self.owned.pop(camera_id)
+                        await camera_supervisor.stop(camera_id)
+            self._wakeup.clear()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.heartbeat_interval)
+        relay_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await relay_task
+
+    def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+
+    async def close(self):
+        """Give up this node's cameras so the others take over without waiting for expiry."""
+        try:
+            await db.camera_leases.delete_many({"node_id": self.node_id})
+            await db.nodes.delete_one({"_id": self.node_id})
+        except PyMongoError as e:
+            logger.error(f"Cluster leave failed: {e}")
+        self.owned.clear()
+
+    # -- event relay --
+
+    def publish(self, kind: str, data: Optional[Dict[str, Any]] = None):
+        """Relay an event to the other nodes; never blocks the caller."""
+        if not CLUSTER_MODE:
+            return
+        event = {"node": self.node_id, "type": kind, "data": data, "ts": datetime.now(timezone.utc)}
+        task = asyncio.create_task(self._insert_event(event))
+        self._pending_events.add(task)
+        task.add_done_callback(self._pending_events.discard)
+
+    async def _insert_event(self, event: Dict[str, Any]):
+        try:
+            await db.events.insert_one(event)
+        except PyMongoError as e:
+            logger.warning(f"Cluster event {event['type']} not relayed: {e}")
+
+    async def handle_event(self, event: Dict[str, Any]):
+        kind = event.get("type")
+        if kind == "detection":
+            await broadcast_detection(event["data"])
+        elif kind == "visit_closed":
+            event_hub.publish("detections", "visit_closed", event["data"])
+        elif kind == "cache_invalidate":
+            reference_cache.invalidate(event["data"]["collection"], broadcast=False)
+        elif kind == "auth_refresh":
+            auth_snapshot.request_refresh(broadcast=False)
+        elif kind == "rebalance":
+            self.wake()
+
+    async def relay(self):
+        since = datetime.now(timezone.utc)
+        lookback = timedelta(0)
+        while True:
+            try:
+                cursor = db.events.find(
+                    {"ts": {"$gte": since - lookback}},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                )
+                while cursor.alive:
+                    async for event in cursor:
+                        since = max(since, event["ts"])
+                        if event["node"] == self.node_id or event["_id"] in self.seen_events:
+                            continue
+                        self.seen_events.append(event["_id"])
+                        try:
+                            await self.handle_event(event)
+                        except Exception as e:
+                            logger.error(f"Cluster event {event.get('type')} failed: {e}")
+            except PyMongoError as e:
+                logger.warning(f"Cluster event relay interrupted: {e}")
+            # Reconnects reread a few seconds back; seen_events drops the repeats
+            lookback = timedelta(seconds=5)
+            # A tailable cursor on an empty capped collection dies at once
+            await asyncio.sleep(1)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": CLUSTER_MODE,
+            "node_id": self.node_id,
+            "live_nodes": self.live_nodes,
+            "cameras": sorted(self.owned),
+        }
+
+cluster = ClusterCoordinator(
+    NODE_ID,
+    lease_seconds=float(os.environ.get('CLUSTER_LEASE_SECONDS', '15')),
+    heartbeat_interval=float(os.environ.get('CLUSTER_HEARTBEAT_SECONDS', '5')),
+    node_url=os.environ.get('CLUSTER_NODE_URL'),
+    events_size=int(os.environ.get('CLUSTER_EVENTS_MB', '64')) * 1024 * 1024,
+)
+
+# ==================== REPORT EXPORTS ====================
+
+EXPORT_DIR = ROOT_DIR / "exports"
+EXPORT_FORMATS = {"csv": "text/csv", "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                  "pdf": "application/pdf"}
+EXPORT_BATCH = 1000
+EXPORT_COLUMNS = ["timestamp", "plate", "status", "reason", "camera", "owner_name", "apartment", "confidence"]
+EXPORT_PROJECTION = {"_id": 0, "timestamp": 1, "plate": 1, "status": 1, "reason": 1, "camera_id": 1,
+                     "owner_info": 1, "confidence": 1}
+
+class CsvReportWriter:
+    def __init__(self, path: Path, title: str):
+        self.file = open(path, "w", newline="", encoding="utf-8-sig")  # BOM so Excel reads Turkish text
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write_rows(self, rows: List[List[Any]]):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class XlsxReportWriter:
+    def __init__(self, path: Path, title: str):
+        from openpyxl import Workbook  # optional dependency
+
+        self.path = path
+        # Write-only mode streams rows to disk instead of keeping the sheet in memory
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(title="Detections")
+        self.sheet.append(EXPORT_COLUMNS)
+
+    def write_rows(self, rows: List[List[Any]]):
+        for row in rows:
+            self.sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+class PdfReportWriter:
+    """Table of detections drawn page by page, so memory stays flat however many rows."""
+
+    WIDTHS = [120, 80, 60, 110, 110, 120, 70, 50]
+    ROW_HEIGHT = 14
+
+    def __init__(self, path: Path, title: str):
+        from reportlab.lib.pagesizes import A4, landscape  # optional dependency
+        from reportlab.pdfgen import canvas
+
+        self.font = self._register_font()
+        self.width, self.height = landscape(A4)
+        self.canvas = canvas.Canvas(str(path), pagesize=(self.width, self.height))
+        self.title = title
+        self.page = 0
+        self._new_page()
+
+    @staticmethod
+    def _register_font() -> str:
+        # The built-in PDF fonts cannot draw ş, ğ or İ; use a TrueType font when there is one
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        for candidate in filter(None, [os.environ.get('REPORT_PDF_FONT'),
+                                       "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+                                       "C:/Windows/Fonts/arial.ttf"]):
+            if os.path.exists(candidate):
+                pdfmetrics.registerFont(TTFont("ReportFont", candidate))
+                return "ReportFont"
+        return "Helvetica"
+
+    def _new_page(self):
+        if self.page:
+            self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - 40
+        self.canvas.setFont(self.font, 12)
+        self.canvas.drawString(30, self.y, f"{self.title} - {self.page}")
+        self.y -= 24
+        self._draw_row(EXPORT_COLUMNS, size=8)
+
+    def _draw_row(self, values: List[Any], size: int = 7):
+        self.canvas.setFont(self.font, size)
+        x = 30
+        for value, width in zip(values, self.WIDTHS):
+            text = "" if value is None else str(value)
+            self.canvas.drawString(x, self.y, text[: int(width / (size * 0.5))])
+            x += width
+        self.y -= self.ROW_HEIGHT
+
+    def write_rows(self, rows: List[List[Any]]):
+        for row in rows:
+            if self.y < 30:
+                self._new_page()
+            self._draw_row(row)
+
+    def close(self):
+        self.canvas.save()
+
+EXPORT_WRITERS = {"csv": CsvReportWriter, "xlsx": XlsxReportWriter, "pdf": PdfReportWriter}
+
+class ReportExports:
+    """Background report exports.
+
+    A job streams detections from a MongoDB cursor (no images) into a file
+    under backend/exports in batches, writing each batch in a worker
+    thread, and records its progress as it goes. Only `concurrency` jobs
+    run at once so an audit cannot crowd out the cameras; finished files
+    are removed after `ttl_hours`. Jobs live in this process' memory.
+    """
+
+    def __init__(self, concurrency: int, ttl_hours: float):
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.ttl = timedelta(hours=ttl_hours)
+        self._tasks: set = set()
+
+    def create(self, fmt: str, query: Dict[str, Any], title: str) -> Dict[str, Any]:
+        self.sweep()
+        job_id = str(uuid.uuid4())
+        job = {
+            "id": job_id,
+            "format": fmt,
+            "title": title,
+            "status": "queued",
+            "rows": 0,
+            "total": None,
+            "progress": 0.0,
+            "error": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+            "filename": f"{title.replace(' ', '_')}.{fmt}",
+        }
+        self.jobs[job_id] = job
+        task = asyncio.create_task(self._run(job, query))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def path(self, job: Dict[str, Any]) -> Path:
+        return EXPORT_DIR / f"{job['id']}.{job['format']}"
+
+    async def _run(self, job: Dict[str, Any], query: Dict[str, Any]):
+        async with self.semaphore:
+            job["status"] = "running"
+            path = self.path(job)
+            writer = None
+            try:
+                EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+                job["total"] = await db.detections.count_documents(query)
+                cameras = {camera["id"]: camera["name"] async for camera in db.cameras.find({}, {"_id": 0, "id": 1, "name": 1})}
+                writer = await asyncio.to_thread(EXPORT_WRITERS[job["format"]], path, job["title"])
+                cursor = db.detections.find(query, EXPORT_PROJECTION).sort("timestamp", 1).batch_size(EXPORT_BATCH)
+                batch = []
+                async for doc in cursor:
+                    batch.append(self._row(doc, cameras))
+                    if len(batch) >= EXPORT_BATCH:
+                        await asyncio.to_thread(writer.write_rows, batch)
+                        self._advance(job, len(batch))
+                        batch = []
+                if batch:
+                    await asyncio.to_thread(writer.write_rows, batch)
+                    self._advance(job, len(batch))
+                await asyncio.to_thread(writer.close)
+                writer = None
+                job["status"] = "done"
+                job["progress"] = 1.0
+                job["size_bytes"] = path.stat().st_size
+            except Exception as e:
+                logger.error(f"Report export {job['id']} failed: {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+                if writer is not None:
+                    with suppress(Exception):
+                        await asyncio.to_thread(writer.close)
+                path.unlink(missing_ok=True)
+            finally:
+                job["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    @staticmethod
+    def _row(doc: Dict[str, Any], cameras: Dict[str, str]) -> List[Any]:
+        owner = doc.get("owner_info") or {}
+        timestamp = doc.get("timestamp")
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.astimezone(ACCESS_TZ).strftime("%Y-%m-%d %H:%M:%S")
+        return [
+            timestamp,
+            doc.get("plate"),
+            doc.get("status"),
+            doc.get("reason"),
+            cameras.get(doc.get("camera_id"), doc.get("camera_id")),
+            owner.get("owner_name"),
+            owner.get("apartment"),
+            round(doc.get("confidence") or 0.0, 3),
+        ]
+
+    @staticmethod
+    def _advance(job: Dict[str, Any], rows: int):
+        job["rows"] += rows
+        if job["total"]:
+            job["progress"] = round(min(1.0, job["rows"] / job["total"]), 4)
+
+    def sweep(self):
+        """Forget finished jobs older than the TTL and delete their files."""
+        cutoff = datetime.now(timezone.utc) - self.ttl
+        for job_id, job in list(self.jobs.items()):
+            if job["finished_at"] and datetime.fromisoformat(job["finished_at"]) < cutoff:
+                self.remove(job_id)
+
+    def remove(self, job_id: str) -> bool:
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return False
+        self.path(job).unlink(missing_ok=True)
+        return True
+
+report_exports = ReportExports(
+    concurrency=int(os.environ.get('REPORT_EXPORT_CONCURRENCY', '1')),
+    ttl_hours=float(os.environ.get('REPORT_EXPORT_TTL_HOURS', '24')),
+)
+
+# ==================== JSON RESPONSES ====================
+
+JSON_STREAM_CHUNK = 64 * 1024
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def dump_json(value: Any) -> bytes:
+    """orjson when installed (datetimes natively, several times faster), else the standard encoder."""
+    if orjson is not None:
+        return orjson.dumps(value, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """Default response class for /api: same output as JSONResponse, encoded with dump_json."""
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+def model_projection(model: Type[BaseModel]) -> Dict[str, int]:
+    """Project exactly the fields a response model would keep, so documents need no re-validation."""
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+async def stream_json_array(docs: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Encode documents one by one into a JSON array, in chunks, while the cursor is still fetching."""
+    buffer = bytearray(b"[")
+    first = True
+    async for doc in docs:
+        if not first:
+            buffer += b","
+        buffer += dump_json(doc)
+        first = False
+        if len(buffer) >= JSON_STREAM_CHUNK:
+            yield bytes(buffer)
+            buffer.clear()
+    buffer += b"]"
+    yield bytes(buffer)
+
+def stream_documents(cursor, headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Stream a cursor of stored documents as a JSON array.
+
+    List endpoints keep their response_model for the API docs, but return
+    this response directly, so FastAPI neither validates nor re-encodes
+    each document. The documents were written through the same models and
+    are read with model_projection, so they already have the response shape.
+    """
+    return StreamingResponse(stream_json_array(cursor), media_type="application/json", headers=headers)
+
+# ==================== API ROUTES ====================
+
+@api_router.get("/")
+async def root():
+    return {"message": "Evo Teknoloji Plaka Tanıma Sistemi API"}
+
+# Sites
+@api_router.post("/sites", response_model=Site)
+async def create_site(site: SiteCreate):
+    site_obj = Site(**site.model_dump())
+    await db.sites.insert_one(site_obj.model_dump())
+    reference_cache.sites.invalidate()
+    return site_obj
+
+@api_router.get("/sites", response_model=List[Site])
+async def get_sites(request: Request):
+    return await cached_response(request, reference_cache.sites)
+
+@api_router.put("/sites/{site_id}", response_model=Site)
+async def update_site(site_id: str, site: SiteCreate):
+    site_obj = Site(id=site_id, **site.model_dump())
+    await db.sites.update_one({"id": site_id}, {"$set": site_obj.model_dump()})
+    reference_cache.sites.invalidate()
+    return site_obj
+
+@api_router.delete("/sites/{site_id}")
+async def delete_site(site_id: str):
+    await db.sites.delete_one({"id": site_id})
+    reference_cache.sites.invalidate()
+    return {"message": "Site deleted"}
+
+# Plates
+@api_router.post("/plates", response_model=Plate)
+async def create_plate(plate: PlateCreate):
+    plate_obj = Plate(**plate.model_dump())
+    try:
+        await db.plates.insert_one(plate_obj.model_dump())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="One of these plates is already registered")
+    auth_snapshot.request_refresh()
+    return plate_obj
+
+@api_router.get("/plates", response_model=List[Plate])
+async def get_plates(site_id: Optional[str] = None, block_name: Optional[str] = None,
+                     status: Optional[str] = None, skip: int = 0, limit: int = 1000):
+    query = {}
+    if site_id:
+        query["site_id"] = site_id
+    if block_name:
+        query["block_name"] = block_name
+    if status:
+        query["status"] = status
+    limit = max(1, min(limit, 5000))
+    # Let clients notice when there are more records than one page
+    total = await db.plates.count_documents(query)
+    cursor = db.plates.find(query, model_projection(Plate)).skip(max(0, skip)).limit(limit).batch_size(PLATE_IMPORT_BATCH)
+    return stream_documents(cursor, headers={"X-Total-Count": str(total)})
+
+@api_router.put("/plates/{plate_id}", response_model=Plate)
+async def update_plate(plate_id: str, plate: PlateCreate):
+    plate_obj = Plate(id=plate_id, **plate.model_dump())
+    try:
+        await db.plates.update_one({"id": plate_id}, {"$set": plate_obj.model_dump()})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="One of these plates is already registered")
+    auth_snapshot.request_refresh()
+    return plate_obj
+
+@api_router.delete("/plates/{plate_id}")
+async def delete_plate(plate_id: str):
+    await db.plates.delete_one({"id": plate_id})
+    auth_snapshot.request_refresh()
+    return {"message": "Plate deleted"}
+
+# Plate bulk import/export
+PLATE_IMPORT_BATCH = 500
+PLATE_EXPORT_FIELDS = ["id", "site_id", "block_name", "apartment_number", "owner_name",
+                       "plates", "valid_until", "status", "door_ids", "schedule", "created_at"]
+
+async def iter_request_lines(request: Request):
+    """Yield decoded lines from a streamed request body without buffering it."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+async def iter_plate_rows(request: Request, fmt: str):
+    """Yield (row number, dict) pairs from an NDJSON or CSV upload.
+
+    CSV needs a header row; the plates and door_ids columns hold values
+    separated by ';' and schedule holds JSON. Quoted fields may span lines.
+    """
+    header = None
+    record = ""
+    row_number = 0
+    async for line in iter_request_lines(request):
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                yield row_number, json.loads(line)
+            except ValueError as e:
+                yield row_number, e
+            continue
+
+        # CSV: keep reading physical lines until the quotes balance
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        if not record.strip():
+            record = ""
+            continue
+        values = next(csv.reader([record]))
+        record = ""
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        row = dict(zip(header, values))
+        for column in ("plates", "door_ids"):
+            if isinstance(row.get(column), str):
+                row[column] = [p.strip() for p in row[column].split(";") if p.strip()] or None
+        try:
+            row["schedule"] = json.loads(row["schedule"]) if row.get("schedule") else None
+        except ValueError as e:
+            yield row_number, e
+            continue
+        yield row_number, row
+
+async def import_plate_batch(batch: List[Tuple[int, Dict[str, Any]]], seen_plates: Dict[str, int],
+                             errors: List[Dict[str, Any]], dry_run: bool) -> int:
+    """Validate one batch, reject duplicate plates and insert the rest unordered."""
+    candidates = []
+    for row_number, row in batch:
+        if isinstance(row, Exception):
+            errors.append({"row": row_number, "error": f"Invalid JSON: {row}"})
+            continue
+        if not isinstance(row, dict):
+            errors.append({"row": row_number, "error": f"Expected a JSON object, got {type(row).__name__}"})
+            continue
+        try:
+            plate_obj = Plate(**PlateCreate(**row).model_dump())
+        except ValidationError as e:
+            errors.append({"row": row_number, "error": "; ".join(
+                f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())})
+            continue
+        duplicate = next((p for p in plate_obj.plates if p in seen_plates), None)
+        if duplicate:
+            errors.append({"row": row_number, "error": f"Plate {duplicate} already appears in row {seen_plates[duplicate]}"})
+            continue
+        for p in plate_obj.plates:
+            seen_plates[p] = row_number
+        candidates.append((row_number, plate_obj.model_dump()))
+
+    # One query per batch for plates that are already registered
+    batch_plates = [p for _, doc in candidates for p in doc["plates"]]
+    existing = set()
+    if batch_plates:
+        async for doc in db.plates.find({"plates": {"$in": batch_plates}}, {"_id": 0, "plates": 1}):
+            existing.update(doc["plates"])
+
+    documents, rows = [], []
+    for row_number, doc in candidates:
+        taken = [p for p in doc["plates"] if p in existing]
+        if taken:
+            errors.append({"row": row_number, "error": f"Plate already registered: {', '.join(taken)}"})
+            continue
+        documents.append(doc)
+        rows.append(row_number)
+
+    if not documents or dry_run:
+        return len(documents)
+    try:
+        result = await db.plates.insert_many(documents, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        for write_error in e.details.get("writeErrors", []):
+            errors.append({"row": rows[write_error["index"]], "error": write_error.get("errmsg", "Write failed")})
+        return e.details.get("nInserted", 0)
+
+@api_router.post("/plates/import")
+async def import_plates(request: Request, format: Optional[str] = None, dry_run: bool = False):
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+
+    errors: List[Dict[str, Any]] = []
+    seen_plates: Dict[str, int] = {}
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    received = inserted = 0
+    async for row_number, row in iter_plate_rows(request, fmt):
+        received += 1
+        batch.append((row_number, row))
+        if len(batch) >= PLATE_IMPORT_BATCH:
+            inserted += await import_plate_batch(batch, seen_plates, errors, dry_run)
+            batch = []
+    if batch:
+        inserted += await import_plate_batch(batch, seen_plates, errors, dry_run)
+    if inserted and not dry_run:
+        # One snapshot rebuild for the whole import
+        auth_snapshot.request_refresh()
+
+    return {
+        "received": received,
+        "inserted": inserted,
+        "failed": len(errors),
+        "dry_run": dry_run,
+        "errors": sorted(errors, key=lambda e: e["row"]),
+    }
+
+@api_router.get("/plates/export")
+async def export_plates(format: str = "ndjson", site_id: Optional[str] = None,
+                        block_name: Optional[str] = None, status: Optional[str] = None):
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    query = {}
+    if site_id:
+        query["site_id"] = site_id
+    if block_name:
+        query["block_name"] = block_name
+    if status:
+        query["status"] = status
+
+    async def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == "csv":
+            writer.writerow(PLATE_EXPORT_FIELDS)
+        rows = 0
+        async for doc in db.plates.find(query, {"_id": 0}).batch_size(PLATE_IMPORT_BATCH):
+            if format == "csv":
+                writer.writerow([
+                    ";".join(doc.get(f) or []) if f in ("plates", "door_ids")
+                    else json.dumps(doc[f]) if f == "schedule" and doc.get(f)
+                    else doc.get(f, "")
+                    for f in PLATE_EXPORT_FIELDS
+                ])
+            else:
+                buffer.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            rows += 1
+            if rows % PLATE_IMPORT_BATCH == 0:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode("utf-8")
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"plates-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.{format}"
+    return StreamingResponse(generate(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# Access decisions
+@api_router.post("/access/evaluate")
+async def evaluate_access(request: AccessEvaluationRequest):
+    """Run plates through the same compiled policy the gates use, for audits."""
+    at = request.at or access_now()
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=ACCESS_TZ) if ACCESS_TZ else at.astimezone()
+    results = []
+    for raw in request.plates:
+        plate = normalize_plate(raw)
+        if not plate:
+            results.append({"input": raw, "plate": None, "status": "unknown", "reason": "invalid_plate", "owner_info": None})
+            continue
+        decision = auth_snapshot.decide(plate, camera_id=request.camera_id, door_id=request.door_id, at=at)
+        results.append({"input": raw, "plate": plate, **decision})
+    return {
+        "evaluated_at": at.isoformat(),
+        "snapshot": auth_snapshot.status(),
+        "results": results,
+    }
+
+# Doors
+@api_router.post("/doors", response_model=Door)
+async def create_door(door: DoorCreate):
+    door_obj = Door(**door.model_dump())
+    await db.doors.insert_one(door_obj.model_dump())
+    reference_cache.doors.invalidate()
+    auth_snapshot.request_refresh()
+    return door_obj
+
+@api_router.get("/doors", response_model=List[Door])
+async def get_doors(request: Request):
+    return await cached_response(request, reference_cache.doors)
+
+@api_router.put("/doors/{door_id}", response_model=Door)
+async def update_door(door_id: str, door: DoorCreate):
+    door_obj = Door(id=door_id, **door.model_dump())
+    await db.doors.update_one({"id": door_id}, {"$set": door_obj.model_dump()})
+    reference_cache.doors.invalidate()
+    auth_snapshot.request_refresh()
+    return door_obj
+
+@api_router.delete("/doors/{door_id}")
+async def delete_door(door_id: str):
+    await db.doors.delete_one({"id": door_id})
+    reference_cache.doors.invalidate()
+    auth_snapshot.request_refresh()
+    return {"message": "Door deleted"}
+
+@api_router.post("/doors/{door_id}/open")
+async def open_door(door_id: str):
+    door = await db.doors.find_one({"id": door_id}, {"_id": 0})
+    if not door:
+        raise HTTPException(status_code=404, detail="Door not found")
+    try:
+        response = requests.get(f"http://{door['ip']}{door['endpoint']}", timeout=3)
+        return {"success": True, "message": "Door opened"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to open door: {str(e)}")
+
+# Cameras
+@api_router.post("/cameras", response_model=Camera)
+async def create_camera(camera: CameraCreate):
+    camera_obj = Camera(**camera.model_dump())
+    await db.cameras.insert_one(camera_obj.model_dump())
+    reference_cache.cameras.invalidate()
+    auth_snapshot.request_refresh()
+    return camera_obj
+
+@api_router.get("/cameras", response_model=List[Camera])
+async def get_cameras(request: Request):
+    return await cached_response(request, reference_cache.cameras)
+
+@api_router.put("/cameras/{camera_id}", response_model=Camera)
+async def update_camera(camera_id: str, camera: CameraUpdate):
+    data = camera.model_dump()
+    if data["enabled"] is None:
+        existing = await db.cameras.find_one({"id": camera_id}, {"_id": 0, "enabled": 1})
+        if not existing:
+            raise HTTPException(status_code=404, detail="Camera not found")
+        data["enabled"] = bool(existing.get("enabled"))
+    camera_obj = Camera(id=camera_id, **data)
+    await db.cameras.update_one({"id": camera_id}, {"$set": camera_obj.model_dump()})
+    reference_cache.cameras.invalidate()
+    auth_snapshot.request_refresh()
+    if CLUSTER_MODE:
+        # The owning node restarts it when it sees the new settings
+        cluster.cameras_changed()
+    else:
+        await camera_supervisor.apply(camera_obj.model_dump())
+    return camera_obj
+
+@api_router.delete("/cameras/{camera_id}")
+async def delete_camera(camera_id: str):
+    # Stop camera if active
+    await camera_supervisor.stop(camera_id)
+    await db.cameras.delete_one({"id": camera_id})
+    reference_cache.cameras.invalidate()
+    auth_snapshot.request_refresh()
+    cluster.cameras_changed()
+    return {"message": "Camera deleted"}
+
+@api_router.post("/cameras/{camera_id}/start")
+async def start_camera(camera_id: str):
+    camera = await db.cameras.find_one({"id": camera_id}, {"_id": 0})
+    if not camera:
         raise HTTPException(status_code=404, detail="Camera not found")
     
-    if camera_id in active_cameras:
+    # Remember the choice so the camera comes back after a restart
+    await db.cameras.update_one({"id": camera_id}, {"$set": {"enabled": True}})
+    reference_cache.cameras.invalidate()
+    if CLUSTER_MODE:
+        cluster.cameras_changed()
+        return {"message": "Camera started"}
+    if not await camera_supervisor.start(camera):
         return {"message": "Camera already running"}
-    
-    active_cameras[camera_id] = {
-        "name": camera["name"],
-        "type": camera["type"],
-        "url": camera["url"],
-        "fps": camera.get("fps", 15),
-        "latest_frame": None,
-        "status": "starting"
-    }
-    
-    asyncio.create_task(process_camera_stream(camera_id, active_cameras[camera_id]))
     return {"message": "Camera started"}
 
 @api_router.post("/cameras/{camera_id}/stop")
 async def stop_camera(camera_id: str):
-    if camera_id in active_cameras:
-        del active_cameras[camera_id]
+    await db.cameras.update_one({"id": camera_id}, {"$set": {"enabled": False}})
+    reference_cache.cameras.invalidate()
+    await camera_supervisor.stop(camera_id)
+    cluster.cameras_changed()
     return {"message": "Camera stopped"}
 
+@api_router.get("/cameras/status")
+async def get_camera_status():
+    return camera_supervisor.stats()
+
 @api_router.get("/cameras/{camera_id}/stream")
 async def get_camera_stream(camera_id: str):
     if camera_id not in active_cameras:
+        if CLUSTER_MODE:
+            # Another node may be running it; send the viewer there
+            lease = await db.camera_leases.find_one({"_id": camera_id})
+            node = lease and await db.nodes.find_one({"_id": lease["node_id"]})
+            if node and node.get("url"):
+                return RedirectResponse(f"{node['url'].rstrip('/')}/api/cameras/{camera_id}/stream")
         raise HTTPException(status_code=404, detail="Camera not active")
     
-    def generate():
+    async def generate():
+        # Send each frame once; the camera loop replaces latest_frame at its own pace
+        sent = None
         while camera_id in active_cameras:
-            frame = active_cameras[camera_id].get("latest_frame")
-            if frame:
+            state = active_cameras.get(camera_id)
+            frame = state.get("latest_frame") if state else None
+            if frame and frame is not sent:
+                sent = frame
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
             else:
-                import time
-                time.sleep(0.1)
+                await asyncio.sleep(0.02)
     
     return StreamingResponse(generate(), media_type="multipart/x-mixed-replace; boundary=frame")
 
@@ -677,54 +4175,283 @@ async def get_camera_stream(camera_id: str):
 async def get_detections(start_date: Optional[str] = None, end_date: Optional[str] = None, status: Optional[str] = None):
     query = {}
     if start_date and end_date:
-        query["timestamp"] = {"$gte": start_date, "$lte": end_date}
+        query["timestamp"] = {"$gte": parse_date_bound(start_date), "$lt": parse_date_bound(end_date, end=True)}
     if status:
         query["status"] = status
-    detections = await db.detections.find(query, {"_id": 0}).sort("timestamp", -1).to_list(1000)
-    return detections
+    # Up to 1000 documents with embedded JPEGs: stream them instead of building one huge list
+    cursor = db.detections.find(query, model_projection(Detection)).sort("timestamp", -1).limit(1000).batch_size(100)
+    return stream_documents(cursor)
 
 @api_router.get("/detections/recent")
 async def get_recent_detections():
     return list(detection_buffer)
 
+# Detection images, fetched lazily by compact event clients. A detection's
+# image never changes, so browsers may cache it for as long as they like.
+IMAGE_CACHE_CONTROL = "public, max-age=604800, immutable"
+THUMBNAIL_SIZE = (160, 120)
+THUMBNAIL_CACHE_SIZE = int(os.environ.get('THUMBNAIL_CACHE_SIZE', '256'))
+thumbnail_cache: "OrderedDict[str, bytes]" = OrderedDict()
+
+async def load_detection_image(detection_id: str) -> Optional[bytes]:
+    # Recent detections may still be waiting in the write-behind buffer
+    for payload in reversed(detection_buffer):
+        if payload["id"] == detection_id:
+            encoded = payload.get("image_base64")
+            break
+    else:
+        doc = await db.detections.find_one({"id": detection_id}, {"_id": 0, "image_base64": 1})
+        encoded = doc and doc.get("image_base64")
+    return base64.b64decode(encoded) if encoded else None
+
+def make_thumbnail(image: bytes) -> bytes:
+    frame = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+    frame = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
+    return buffer.tobytes()
+
+async def detection_image_response(request: Request, detection_id: str, thumbnail: bool) -> Response:
+    etag = f'"{detection_id}{"-thumb" if thumbnail else ""}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    body = thumbnail_cache.get(detection_id) if thumbnail else None
+    if body is not None:
+        thumbnail_cache.move_to_end(detection_id)
+    else:
+        body = await load_detection_image(detection_id)
+        if body is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        if thumbnail:
+            body = await asyncio.to_thread(make_thumbnail, body)
+            thumbnail_cache[detection_id] = body
+            if len(thumbnail_cache) > THUMBNAIL_CACHE_SIZE:
+                thumbnail_cache.popitem(last=False)
+    return Response(body, media_type="image/jpeg", headers=headers)
+
+@api_router.get("/detections/{detection_id}/image")
+async def get_detection_image(detection_id: str, request: Request):
+    return await detection_image_response(request, detection_id, thumbnail=False)
+
+@api_router.get("/detections/{detection_id}/thumbnail")
+async def get_detection_thumbnail(detection_id: str, request: Request):
+    return await detection_image_response(request, detection_id, thumbnail=True)
+
+# Visits
+@api_router.get("/visits")
+async def get_visits(start_date: Optional[str] = None, end_date: Optional[str] = None, camera_id: Optional[str] = None,
+                     plate: Optional[str] = None, state: Optional[str] = None, limit: int = 200):
+    query: Dict[str, Any] = {}
+    if start_date and end_date:
+        query["last_seen"] = {"$gte": parse_date_bound(start_date), "$lt": parse_date_bound(end_date, end=True)}
+    if camera_id:
+        query["camera_id"] = camera_id
+    if plate:
+        query["plate"] = normalize_plate(plate) or plate
+    if state:
+        query["state"] = state
+    visits = await db.visits.find(query, {"_id": 0, "best_image_base64": 0}) \
+        .sort("last_seen", -1).to_list(max(1, min(limit, 1000)))
+    # Open visits are only written on transitions; the tracker has their current counts
+    return [visit_payload(visit_tracker.find(visit["id"]) or visit) for visit in visits]
+
+@api_router.get("/visits/{visit_id}/image")
+async def get_visit_image(visit_id: str, request: Request):
+    visit = visit_tracker.find(visit_id) or await db.visits.find_one({"id": visit_id}, {"_id": 0})
+    if not visit:
+        raise HTTPException(status_code=404, detail="Visit not found")
+    # The best snapshot may still improve while the visit is open
+    etag = f'"{visit_id}-{visit["best_detection_id"] or visit["revision"]}-{visit["best_confidence"]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    encoded = visit.get("best_image_base64")
+    body = base64.b64decode(encoded) if encoded else await load_detection_image(visit["best_detection_id"] or "")
+    if body is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return Response(body, media_type="image/jpeg", headers=headers)
+
 @api_router.get("/detections/stats")
 async def get_detection_stats():
-    today = datetime.now(timezone.utc).date().isoformat()
-    
-    total_today = await db.detections.count_documents({
-        "timestamp": {"$gte": today}
-    })
-    
-    allowed_today = await db.detections.count_documents({
-        "timestamp": {"$gte": today},
-        "status": "allowed"
-    })
-    
-    blocked_today = await db.detections.count_documents({
-        "timestamp": {"$gte": today},
-        "status": "blocked"
-    })
-    
-    unknown_today = await db.detections.count_documents({
-        "timestamp": {"$gte": today},
-        "status": "unknown"
-    })
-    
-    return {
-        "total_today": total_today,
-        "allowed_today": allowed_today,
-        "blocked_today": blocked_today,
-        "unknown_today": unknown_today
-    }
+    # Served from the in-memory counters; one indexed pass reloads them when
+    # they were never loaded (MongoDB down at startup)
+    if detection_counters.day is None:
+        await detection_counters.load()
+    detection_counters.roll()
+    return detection_counters.snapshot()
+
+# Reports
+@api_router.post("/reports/exports", status_code=202)
+async def create_report_export(request: ReportExportRequest):
+    if request.format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv, xlsx or pdf")
+    module = {"xlsx": "openpyxl", "pdf": "reportlab"}.get(request.format)
+    if module and importlib.util.find_spec(module) is None:
+        raise HTTPException(status_code=400, detail=f"{request.format} export needs the {module} package")
+
+    query: Dict[str, Any] = {"timestamp": {"$gte": parse_date_bound(request.start_date),
+                                           "$lt": parse_date_bound(request.end_date, end=True)}}
+    if request.status:
+        query["status"] = request.status
+    if request.camera_id:
+        query["camera_id"] = request.camera_id
+    title = f"Rapor {request.start_date} - {request.end_date}"
+    return report_exports.create(request.format, query, title)
+
+@api_router.get("/reports/exports")
+async def list_report_exports():
+    report_exports.sweep()
+    return sorted(report_exports.jobs.values(), key=lambda job: job["created_at"], reverse=True)
+
+@api_router.get("/reports/exports/{job_id}")
+async def get_report_export(job_id: str):
+    job = report_exports.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+@api_router.get("/reports/exports/{job_id}/download")
+async def download_report_export(job_id: str):
+    job = report_exports.jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    return FileResponse(report_exports.path(job), media_type=EXPORT_FORMATS[job["format"]], filename=job["filename"])
+
+@api_router.delete("/reports/exports/{job_id}")
+async def delete_report_export(job_id: str):
+    if not report_exports.remove(job_id):
+        raise HTTPException(status_code=404, detail="Export not found")
+    return {"message": "Export deleted"}
+
+# Analytics (served from the rollup collections, never from raw detections)
+def analytics_days(start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, str]:
+    """Inclusive local day range; defaults to the last 30 days."""
+    today = access_now().date()
+    try:
+        end = date.fromisoformat(end_date) if end_date else today
+        start = date.fromisoformat(start_date) if start_date else end - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date is after end_date")
+    return start.isoformat(), end.isoformat()
+
+def rollup_match(start_day: str, end_day: str, camera_id: Optional[str] = None) -> Dict[str, Any]:
+    match: Dict[str, Any] = {"day": {"$gte": start_day, "$lte": end_day}}
+    if camera_id:
+        match["camera_id"] = camera_id
+    return match
+
+def status_totals() -> Dict[str, Any]:
+    return {name: {"$sum": {"$cond": [{"$eq": ["$status", name]}, "$count", 0]}} for name in DetectionRollups.STATUSES}
+
+@api_router.get("/analytics/daily")
+async def get_analytics_daily(start_date: Optional[str] = None, end_date: Optional[str] = None, camera_id: Optional[str] = None):
+    start_day, end_day = analytics_days(start_date, end_date)
+    rows = await db.rollups_daily.aggregate([
+        {"$match": rollup_match(start_day, end_day, camera_id)},
+        {"$group": {"_id": "$day", "total": {"$sum": "$count"}, **status_totals()}},
+        {"$sort": {"_id": 1}},
+    ]).to_list(None)
+    return [{"day": row.pop("_id"), **row} for row in rows]
+
+@api_router.get("/analytics/peak-hours")
+async def get_analytics_peak_hours(start_date: Optional[str] = None, end_date: Optional[str] = None, camera_id: Optional[str] = None):
+    start_day, end_day = analytics_days(start_date, end_date)
+    tz = ACCESS_TZ or access_now().tzinfo
+    match: Dict[str, Any] = {"hour": {
+        "$gte": datetime.fromisoformat(start_day).replace(tzinfo=tz),
+        "$lt": datetime.fromisoformat(end_day).replace(tzinfo=tz) + timedelta(days=1),
+    }}
+    if camera_id:
+        match["camera_id"] = camera_id
+    rows = await db.rollups_hourly.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"$hour": {"date": "$hour", "timezone": access_tz_name()}}, "total": {"$sum": "$count"}, **status_totals()}},
+    ]).to_list(None)
+    by_hour = {row.pop("_id"): row for row in rows}
+    empty = {"total": 0, **{name: 0 for name in DetectionRollups.STATUSES}}
+    return [{"hour": hour, **by_hour.get(hour, empty)} for hour in range(24)]
+
+@api_router.get("/analytics/gates")
+async def get_analytics_gates(start_date: Optional[str] = None, end_date: Optional[str] = None):
+    start_day, end_day = analytics_days(start_date, end_date)
+    rows = await db.rollups_daily.aggregate([
+        {"$match": rollup_match(start_day, end_day)},
+        {"$group": {"_id": "$camera_id", "total": {"$sum": "$count"}, **status_totals()}},
+        {"$sort": {"total": -1}},
+    ]).to_list(None)
+    names = {camera.id: camera.name for camera in await reference_cache.cameras.items()}
+    return [{"camera_id": row["_id"], "camera_name": names.get(row["_id"]), **{k: v for k, v in row.items() if k != "_id"}}
+            for row in rows]
+
+@api_router.get("/analytics/repeat-unknown")
+async def get_analytics_repeat_unknown(start_date: Optional[str] = None, end_date: Optional[str] = None,
+                                       min_visits: int = 3, limit: int = 100):
+    start_day, end_day = analytics_days(start_date, end_date)
+    rows = await db.rollups_plates_daily.aggregate([
+        {"$match": {**rollup_match(start_day, end_day), "unknown": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$plate",
+            "visits": {"$sum": "$unknown"},
+            "days": {"$addToSet": "$day"},
+            "cameras": {"$addToSet": "$camera_id"},
+            "first_seen": {"$min": "$first_seen"},
+            "last_seen": {"$max": "$last_seen"},
+        }},
+        {"$match": {"visits": {"$gte": max(1, min_visits)}}},
+        {"$set": {"days": {"$size": "$days"}}},
+        {"$sort": {"visits": -1, "last_seen": -1}},
+        {"$limit": max(1, min(limit, 1000))},
+    ]).to_list(None)
+    return [{"plate": row.pop("_id"), **row} for row in rows]
+
+@api_router.get("/analytics/apartments")
+async def get_analytics_apartments(start_date: Optional[str] = None, end_date: Optional[str] = None):
+    start_day, end_day = analytics_days(start_date, end_date)
+    rows = await db.rollups_plates_daily.aggregate([
+        {"$match": {**rollup_match(start_day, end_day), "apartment": {"$nin": [None, ""]}}},
+        {"$group": {
+            "_id": "$apartment",
+            "total": {"$sum": "$count"},
+            **{name: {"$sum": {"$ifNull": [f"${name}", 0]}} for name in DetectionRollups.STATUSES},
+            "plates": {"$addToSet": "$plate"},
+            "last_seen": {"$max": "$last_seen"},
+        }},
+        {"$set": {"plates": {"$size": "$plates"}}},
+        {"$sort": {"total": -1}},
+    ]).to_list(None)
+    return [{"apartment": row.pop("_id"), **row} for row in rows]
+
+@api_router.post("/analytics/rebuild", status_code=202)
+async def rebuild_analytics(start_date: Optional[str] = None, end_date: Optional[str] = None):
+    start_day, end_day = analytics_days(start_date, end_date)
+    if detection_rollups.rebuilding:
+        raise HTTPException(status_code=409, detail="A rebuild is already running")
+
+    async def rebuild():
+        try:
+            await detection_rollups.rebuild(start_day, end_day)
+        except Exception as e:
+            detection_rollups.last_error = str(e)
+            logger.error(f"Rollup rebuild failed: {e}")
+
+    detection_rollups.rebuilding = {"start": start_day, "end": end_day}
+    detection_rollups.rebuild_task = asyncio.create_task(rebuild())
+    return {"start_date": start_day, "end_date": end_day, "status": "running"}
+
+@api_router.get("/analytics/status")
+async def get_analytics_status():
+    return detection_rollups.status()
 
 # Settings
 @api_router.get("/settings", response_model=Settings)
-async def get_settings():
-    settings = await db.settings.find_one({"id": "system_settings"}, {"_id": 0})
-    if not settings:
-        settings = Settings().model_dump()
-        await db.settings.insert_one(settings)
-    return settings
+async def get_settings(request: Request):
+    # Defaults are served until the first PUT stores them
+    return await cached_response(request, reference_cache.settings)
 
 @api_router.put("/settings", response_model=Settings)
 async def update_settings(updates: SettingsUpdate):
@@ -746,58 +4473,115 @@ async def update_settings(updates: SettingsUpdate):
         upsert=True
     )
     
+    reference_cache.settings.invalidate()
     updated = await db.settings.find_one({"id": "system_settings"}, {"_id": 0})
     return updated
 
 # System
 @api_router.get("/system/status")
-async def get_system_status():
-    cpu_percent = psutil.cpu_percent(interval=1)
-    memory = psutil.virtual_memory()
-    
-    # Check GPU availability
-    gpu_available = False
-    gpu_info = "N/A"
-    try:
-        import torch
-        gpu_available = torch.cuda.is_available()
-        if gpu_available:
-            gpu_info = torch.cuda.get_device_name(0)
-    except:
-        pass
-    
-    return {
-        "cpu_percent": cpu_percent,
-        "memory_percent": memory.percent,
-        "memory_used_gb": round(memory.used / (1024**3), 2),
-        "memory_total_gb": round(memory.total / (1024**3), 2),
-        "gpu_available": gpu_available,
-        "gpu_info": gpu_info,
-        "active_cameras": len(active_cameras)
-    }
+async def get_system_status(history: int = 0):
+    return system_sampler.status(history=max(0, min(history, system_sampler.history.maxlen)))
+
+@api_router.get("/cluster/status")
+async def get_cluster_status():
+    status = cluster.status()
+    if CLUSTER_MODE:
+        status["nodes"] = await db.nodes.find({}).sort("_id", 1).to_list(1000)
+        status["leases"] = await db.camera_leases.find({}).sort("_id", 1).to_list(10000)
+    return status
+
+# Admin
+@api_router.get("/admin/event-loop")
+async def get_event_loop_report(history: int = 60):
+    return loop_monitor.snapshot(history=max(0, min(history, 240)))
+
+@api_router.put("/admin/event-loop/tracer")
+async def update_event_loop_tracer(update: LoopTracerUpdate):
+    if update.threshold_ms <= 0:
+        raise HTTPException(status_code=400, detail="threshold_ms must be positive")
+    if update.enabled:
+        loop_monitor.enable_tracer(update.threshold_ms / 1000)
+    else:
+        loop_monitor.disable_tracer()
+    return loop_monitor.snapshot(history=0)["tracer"]
+
+@api_router.get("/admin/sampling")
+async def get_sampling_status():
+    return sampling.status()
+
+@api_router.delete("/admin/event-loop/slow-callbacks")
+async def clear_slow_callbacks():
+    loop_monitor.slow_callbacks.clear()
+    return {"message": "Slow callback log cleared"}
 
 # WebSocket
 @api_router.websocket("/ws/detections")
-async def websocket_detections(websocket: WebSocket):
+async def websocket_detections(websocket: WebSocket, topics: str = "detections", since: Optional[int] = None,
+                               format: str = "json"):
+    """Event channel for dashboards.
+
+    ?topics=detections,stats,cameras,system picks the topics (default only
+    detections, the original behaviour); ?since=<seq> resumes after the
+    last event a client saw; ?format=compact|msgpack drops the embedded
+    JPEGs (msgpack as binary frames). Messages are {"seq", "topic", "type", "data"}.
+    """
     await websocket.accept()
-    websocket_clients.append(websocket)
+    fmt = format if format in EVENT_FORMATS else "json"
+    subscriber = event_hub.subscribe([topic for topic in topics.split(",") if topic in EVENT_TOPICS], since, fmt)
+    sender = asyncio.create_task(event_hub.pump(websocket, subscriber))
     try:
         while True:
-            data = await websocket.receive_text()
-            # Keep connection alive
+            event_hub.update_topics(subscriber, await websocket.receive_text())
     except WebSocketDisconnect:
-        websocket_clients.remove(websocket)
+        pass
+    finally:
+        event_hub.unsubscribe(subscriber)
+        sender.cancel()
 
 # Include router
-app.include_router(api_router)
+app.include_router(api_router, default_response_class=FastJSONResponse)
+
+# Prometheus scrape endpoint (kept outside /api like other infrastructure probes)
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    WS_SUBSCRIBERS.set(len(event_hub.subscribers))
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Access logging middleware
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '1.0'))
+ACCESS_LOG_SKIP = tuple(p for p in os.environ.get('ACCESS_LOG_SKIP', '/stream,/stats,/metrics').split(',') if p)
+ACCESS_LOG_SLOW_MS = float(os.environ.get('ACCESS_LOG_SLOW_MS', '1000'))
+
+HTTP_LATENCY = metrics.histogram("lpr_http_request_seconds", "HTTP request latency until response headers",
+                                 ("method", "route", "status"))
 
-# Request logging middleware
 @app.middleware("http")
 async def log_requests(request, call_next):
-    logger.info(f"📨 {request.method} {request.url.path}")
-    response = await call_next(request)
-    logger.info(f"✅ {request.method} {request.url.path} - Status: {response.status_code}")
-    return response
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - started
+        path = request.url.path
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", "unmatched")
+        HTTP_LATENCY.observe(duration, method=request.method, route=route_path, status=status_code)
+        # Errors and slow requests are always kept; the rest is filtered and sampled
+        keep = status_code >= 500 or duration * 1000 >= ACCESS_LOG_SLOW_MS
+        if not keep and not path.endswith(ACCESS_LOG_SKIP):
+            keep = ACCESS_LOG_SAMPLE_RATE >= 1 or random.random() < ACCESS_LOG_SAMPLE_RATE
+        if keep:
+            access_logger.info("request", extra={"access": {
+                "method": request.method,
+                "path": path,
+                "route": route_path,
+                "status": status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "client": request.client.host if request.client else None,
+            }})
 
 app.add_middleware(
     CORSMiddleware,
@@ -805,18 +4589,52 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 
-# Configure logging to show in console
+# Configure logging to show in console. Records are handed to a queue and
+# written by a listener thread, so request handlers never wait on console I/O.
+class AccessLogFormatter(logging.Formatter):
+    """One JSON object per line for the access log."""
+
+    def format(self, record):
+        entry = {"ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat()}
+        entry.update(getattr(record, "access", {}))
+        return json.dumps(entry, ensure_ascii=False)
+
+console_handler = logging.StreamHandler()  # Ensure logs go to console
+console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+access_handler = logging.StreamHandler()
+if os.environ.get('ACCESS_LOG_FILE'):
+    access_handler = logging.FileHandler(os.environ['ACCESS_LOG_FILE'], encoding='utf-8')
+access_handler.setFormatter(AccessLogFormatter())
+
+log_queue = queue.SimpleQueue()
+access_log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, console_handler, respect_handler_level=True)
+access_log_listener = logging.handlers.QueueListener(access_log_queue, access_handler)
+log_listener.start()
+access_log_listener.start()
+atexit.register(access_log_listener.stop)
+atexit.register(log_listener.stop)
+
+queue_handler = logging.handlers.QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()  # Ensure logs go to console
-    ]
+    handlers=[queue_handler]
 )
 logger = logging.getLogger(__name__)
 
+access_logger = logging.getLogger("access")
+access_logger.setLevel(logging.INFO)
+access_logger.propagate = False
+access_logger.addHandler(logging.handlers.QueueHandler(access_log_queue))
+
+# The structured access log above replaces uvicorn's per-request lines
+logging.getLogger("uvicorn.access").disabled = True
+
 # Log configuration
 logger.info("🔧 Logging sistemi yapılandırıldı")
 
@@ -8,7 +8,7 @@ import { toast } from "sonner";
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
-const CameraBox = ({ camera, position }) => {
+const CameraBox = ({ camera, position, liveStatus }) => {
   const [isActive, setIsActive] = useState(false);
   const [status, setStatus] = useState("stopped");
 
@@ -64,10 +64,13 @@ const CameraBox = ({ camera, position }) => {
     stopped: "border-zinc-800",
   };
 
+  // Live status pushed by the server wins while the camera is running here
+  const shownStatus = isActive && liveStatus ? liveStatus : status;
+
   return (
     <Card
       data-testid={`camera-box-${position}`}
-      className={`camera-box bg-zinc-900 border-2 ${statusColors[status]} transition-all duration-300 overflow-hidden`}
+      className={`camera-box bg-zinc-900 border-2 ${statusColors[shownStatus] || statusColors.monitoring} transition-all duration-300 overflow-hidden`}
     >
       <div className="aspect-video bg-zinc-950 relative flex items-center justify-center">
         {isActive ? (
@@ -121,7 +124,7 @@ const CameraBox = ({ camera, position }) => {
   );
 };
 
-const CameraGrid = ({ cameras }) => {
+const CameraGrid = ({ cameras, statuses = {} }) => {
   const [gridCameras, setGridCameras] = useState([]);
 
   useEffect(() => {
@@ -143,7 +146,7 @@ const CameraGrid = ({ cameras }) => {
       <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
         {gridCameras.map((camera, idx) =>
           camera ? (
-            <CameraBox key={camera.id} camera={camera} position={idx} />
+            <CameraBox key={camera.id} camera={camera} position={idx} liveStatus={statuses[camera.id]?.status} />
           ) : (
             <Card
               key={idx}
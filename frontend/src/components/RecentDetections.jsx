@@ -2,6 +2,8 @@ import { Card } from "@/components/ui/card";
 import { ScrollArea } from "@/components/ui/scroll-area";
 import { CheckCircle, XCircle, AlertCircle } from "lucide-react";
 
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+
 const RecentDetections = ({ detections }) => {
   const getStatusColor = (status) => {
     switch (status) {
@@ -51,10 +53,15 @@ const RecentDetections = ({ detections }) => {
                 className={`p-3 border ${getStatusColor(detection.status)} transition-all duration-300`}
               >
                 <div className="flex items-start gap-3">
-                  {detection.image_base64 && (
+                  {(detection.image_base64 || detection.thumbnail_url) && (
                     <img
-                      src={`data:image/jpeg;base64,${detection.image_base64}`}
+                      src={
+                        detection.image_base64
+                          ? `data:image/jpeg;base64,${detection.image_base64}`
+                          : `${BACKEND_URL}${detection.thumbnail_url}`
+                      }
                       alt="Detection"
+                      loading="lazy"
                       className="w-20 h-16 object-cover rounded border border-zinc-700"
                     />
                   )}
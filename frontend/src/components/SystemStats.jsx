@@ -1,36 +1,11 @@
-import { useState, useEffect } from "react";
-import axios from "axios";
 import { Card } from "@/components/ui/card";
 import { Cpu, HardDrive } from "lucide-react";
 
-const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
-const API = `${BACKEND_URL}/api`;
-
-const SystemStats = () => {
-  const [stats, setStats] = useState({
-    cpu_percent: 0,
-    memory_percent: 0,
-    memory_used_gb: 0,
-    memory_total_gb: 0,
-    gpu_available: false,
-    gpu_info: "N/A",
-    active_cameras: 0,
-  });
-
-  useEffect(() => {
-    const fetchStats = async () => {
-      try {
-        const response = await axios.get(`${API}/system/status`);
-        setStats(response.data);
-      } catch (error) {
-        console.error("Failed to fetch system stats:", error);
-      }
-    };
-
-    fetchStats();
-    const interval = setInterval(fetchStats, 3000);
-    return () => clearInterval(interval);
-  }, []);
+// Values arrive over the Dashboard's event WebSocket ("system" topic)
+const SystemStats = ({ stats = {} }) => {
+  const cpuPercent = stats.cpu_percent ?? 0;
+  const memoryUsed = stats.memory_used_gb ?? 0;
+  const memoryTotal = stats.memory_total_gb ?? 0;
 
   return (
     <div data-testid="system-stats" className="flex items-center gap-4">
@@ -39,7 +14,7 @@ const SystemStats = () => {
           <Cpu className="h-4 w-4 text-blue-400" />
           <div>
             <p className="text-xs text-zinc-500">CPU</p>
-            <p className="text-sm font-semibold">{stats.cpu_percent.toFixed(1)}%</p>
+            <p className="text-sm font-semibold">{cpuPercent.toFixed(1)}%</p>
           </div>
         </div>
       </Card>
@@ -50,7 +25,7 @@ const SystemStats = () => {
           <div>
             <p className="text-xs text-zinc-500">RAM</p>
             <p className="text-sm font-semibold">
-              {stats.memory_used_gb} / {stats.memory_total_gb} GB
+              {memoryUsed} / {memoryTotal} GB
             </p>
           </div>
         </div>
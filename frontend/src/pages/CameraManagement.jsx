@@ -24,6 +24,8 @@ const CameraManagement = () => {
     door_id: "",
     fps: 15,
     position: 0,
+    decoder: "auto",
+    substream_url: "",
   });
 
   useEffect(() => {
@@ -51,12 +53,13 @@ const CameraManagement = () => {
 
   const handleSubmit = async (e) => {
     e.preventDefault();
+    const payload = { ...formData, substream_url: formData.substream_url || null };
     try {
       if (editingCamera) {
-        await axios.put(`${API}/cameras/${editingCamera.id}`, formData);
+        await axios.put(`${API}/cameras/${editingCamera.id}`, payload);
         toast.success("Kamera güncellendi");
       } else {
-        await axios.post(`${API}/cameras`, formData);
+        await axios.post(`${API}/cameras`, payload);
         toast.success("Kamera eklendi");
       }
       fetchCameras();
@@ -81,6 +84,10 @@ const CameraManagement = () => {
   const handleEdit = (camera) => {
     setEditingCamera(camera);
     setFormData({
+      // Keep fields this form does not show (enabled, capture options) on update
+      ...camera,
+      substream_url: camera.substream_url ?? "",
+      decoder: camera.decoder ?? "auto",
       name: camera.name,
       type: camera.type,
       url: camera.url,
@@ -100,6 +107,8 @@ const CameraManagement = () => {
       door_id: "",
       fps: 15,
       position: 0,
+      decoder: "auto",
+      substream_url: "",
     });
   };
 
@@ -146,6 +155,7 @@ const CameraManagement = () => {
                       <SelectItem value="webcam">Webcam</SelectItem>
                       <SelectItem value="rtsp">RTSP</SelectItem>
                       <SelectItem value="http">HTTP</SelectItem>
+                      <SelectItem value="synthetic">Sentetik (yük testi)</SelectItem>
                     </SelectContent>
                   </Select>
                 </div>
@@ -174,11 +184,41 @@ const CameraManagement = () => {
                   value={formData.url}
                   onChange={(e) => setFormData({ ...formData, url: e.target.value })}
                   className="bg-zinc-800 border-zinc-700"
-                  placeholder="rtsp://192.168.1.100:554/stream"
+                  placeholder={formData.type === "synthetic"
+                    ? "synthetic://?plates=34ABC123,06XY4567&rate=6"
+                    : "rtsp://192.168.1.100:554/stream"}
                   required
                 />
               </div>
 
+              <div className="grid grid-cols-2 gap-4">
+                <div>
+                  <Label htmlFor="substreamUrl">Alt Akış URL (opsiyonel)</Label>
+                  <Input
+                    id="substreamUrl"
+                    data-testid="camera-substream-input"
+                    value={formData.substream_url}
+                    onChange={(e) => setFormData({ ...formData, substream_url: e.target.value })}
+                    className="bg-zinc-800 border-zinc-700"
+                    placeholder="rtsp://192.168.1.100:554/substream"
+                  />
+                </div>
+
+                <div>
+                  <Label htmlFor="decoder">Kod Çözücü</Label>
+                  <Select value={formData.decoder} onValueChange={(value) => setFormData({ ...formData, decoder: value })}>
+                    <SelectTrigger data-testid="decoder-select" className="bg-zinc-800 border-zinc-700">
+                      <SelectValue />
+                    </SelectTrigger>
+                    <SelectContent className="bg-zinc-800 border-zinc-700">
+                      <SelectItem value="auto">Otomatik</SelectItem>
+                      <SelectItem value="ffmpeg">FFmpeg</SelectItem>
+                      <SelectItem value="gstreamer">GStreamer</SelectItem>
+                    </SelectContent>
+                  </Select>
+                </div>
+              </div>
+
               <div className="grid grid-cols-2 gap-4">
                 <div>
                   <Label htmlFor="door">Bağlı Kapı</Label>
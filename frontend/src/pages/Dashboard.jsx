@@ -19,15 +19,8 @@ const Dashboard = () => {
   });
   const [recentDetections, setRecentDetections] = useState([]);
   const [cameras, setCameras] = useState([]);
-
-  const fetchStats = useCallback(async () => {
-    try {
-      const response = await axios.get(`${API}/detections/stats`);
-      setStats(response.data);
-    } catch (error) {
-      console.error("Failed to fetch stats:", error);
-    }
-  }, []);
+  const [cameraStatuses, setCameraStatuses] = useState({});
+  const [system, setSystem] = useState({});
 
   const fetchCameras = useCallback(async () => {
     try {
@@ -38,53 +31,99 @@ const Dashboard = () => {
     }
   }, []);
 
-  const fetchRecentDetections = useCallback(async () => {
-    try {
-      const response = await axios.get(`${API}/detections/recent`);
-      setRecentDetections(response.data);
-    } catch (error) {
-      console.error("Failed to fetch recent detections:", error);
-    }
-  }, []);
-
   useEffect(() => {
-    fetchStats();
     fetchCameras();
-    fetchRecentDetections();
 
-    // WebSocket connection for real-time updates
-    const wsUrl = `${BACKEND_URL.replace('https', 'wss').replace('http', 'ws')}/api/ws/detections`;
+    // One multiplexed WebSocket carries detections, stats, camera status and
+    // system metrics; after a drop it resumes from the last sequence seen
+    const wsBase = `${BACKEND_URL.replace('https', 'wss').replace('http', 'ws')}/api/ws/detections`;
     let ws;
+    let lastSeq = null;
+    let retry = 0;
+    let reconnectTimer;
+    let closed = false;
+
+    const handleEvent = (message) => {
+      const { type, data } = message;
+      switch (type) {
+        case "recent":
+          setRecentDetections(data.slice().reverse());
+          break;
+        case "detection":
+          setRecentDetections((prev) => [data, ...prev.slice(0, 19)]);
+          break;
+        case "stats":
+          setStats(data);
+          break;
+        case "stats_delta":
+          setStats((prev) => {
+            const next = { ...prev };
+            Object.entries(data).forEach(([key, value]) => {
+              next[key] = (next[key] || 0) + value;
+            });
+            return next;
+          });
+          break;
+        case "cameras":
+          setCameraStatuses(data);
+          break;
+        case "camera":
+          setCameraStatuses((prev) => ({ ...prev, [data.id]: data }));
+          break;
+        case "system":
+          setSystem((prev) => ({ ...prev, ...data }));
+          break;
+        default:
+          break;
+      }
+    };
 
-    try {
-      ws = new WebSocket(wsUrl);
+    const connect = () => {
+      // Compact events carry image URLs instead of base64 JPEGs
+      const params = new URLSearchParams({ topics: "detections,stats,cameras,system", format: "compact" });
+      if (lastSeq !== null) params.set("since", lastSeq);
+      try {
+        ws = new WebSocket(`${wsBase}?${params}`);
+      } catch (error) {
+        console.error("Failed to connect WebSocket:", error);
+        return;
+      }
+
+      ws.onopen = () => {
+        retry = 0;
+      };
 
       ws.onmessage = (event) => {
-        const data = JSON.parse(event.data);
-        if (data.type === "detection") {
-          setRecentDetections((prev) => [data.data, ...prev.slice(0, 19)]);
-          fetchStats();
+        const message = JSON.parse(event.data);
+        if (message.type === "resync") {
+          // Events were dropped on the server side; start over from a snapshot
+          lastSeq = null;
+          ws.close();
+          return;
         }
+        lastSeq = message.seq;
+        handleEvent(message);
       };
 
       ws.onerror = (error) => {
         console.error("WebSocket error:", error);
       };
-    } catch (error) {
-      console.error("Failed to connect WebSocket:", error);
-    }
 
-    // Polling fallback
-    const interval = setInterval(() => {
-      fetchStats();
-      fetchRecentDetections();
-    }, 5000);
+      ws.onclose = () => {
+        if (closed) return;
+        retry += 1;
+        reconnectTimer = setTimeout(connect, Math.min(30000, 1000 * 2 ** Math.min(retry, 5)));
+      };
+    };
+
+    connect();
 
     return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
       if (ws) ws.close();
-      clearInterval(interval);
     };
-  }, [fetchStats, fetchCameras, fetchRecentDetections]);
+  }, [fetchCameras]);
 
   return (
     <div data-testid="dashboard" className="p-6 space-y-6">
@@ -94,7 +133,7 @@ const Dashboard = () => {
           <h1 className="text-3xl font-bold">Ana Ekran</h1>
           <p className="text-zinc-400 mt-1">Plaka Tanıma İzleme Sistemi</p>
         </div>
-        <SystemStats />
+        <SystemStats stats={system} />
       </div>
 
       {/* Stats Cards */}
@@ -152,7 +191,7 @@ const Dashboard = () => {
       <div className="grid grid-cols-1 lg:grid-cols-3 gap-6">
         {/* Camera Grid */}
         <div className="lg:col-span-2">
-          <CameraGrid cameras={cameras} />
+          <CameraGrid cameras={cameras} statuses={cameraStatuses} />
         </div>
 
         {/* Recent Detections */}
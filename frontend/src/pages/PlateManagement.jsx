@@ -99,6 +99,9 @@ const PlateManagement = () => {
       plates: [...plate.plates, "", ""].slice(0, 3),
       valid_until: plate.valid_until,
       status: plate.status,
+      // Not editable here yet, but must survive an edit
+      door_ids: plate.door_ids ?? null,
+      schedule: plate.schedule ?? null,
     });
     setDialogOpen(true);
   };
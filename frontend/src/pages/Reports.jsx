@@ -18,6 +18,7 @@ const Reports = () => {
   const [startDate, setStartDate] = useState("");
   const [endDate, setEndDate] = useState("");
   const [loading, setLoading] = useState(false);
+  const [exportJob, setExportJob] = useState(null);
 
   useEffect(() => {
     const today = new Date();
@@ -50,11 +51,44 @@ const Reports = () => {
     }
   };
 
-  const exportToPDF = () => {
-    // In a real implementation, this would use a library like jsPDF
-    toast.info("PDF özelliği yakında eklenecek");
+  // Exports are built on the server as a background job; poll it, then download
+  useEffect(() => {
+    if (!exportJob || exportJob.status === "done" || exportJob.status === "failed") return;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API}/reports/exports/${exportJob.id}`);
+        setExportJob(response.data);
+        if (response.data.status === "done") {
+          window.location.href = `${API}/reports/exports/${exportJob.id}/download`;
+          toast.success("Rapor hazır");
+        } else if (response.data.status === "failed") {
+          toast.error("Rapor oluşturulamadı");
+        }
+      } catch (error) {
+        toast.error("Rapor durumu alınamadı");
+        setExportJob(null);
+      }
+    }, 1000);
+    return () => clearTimeout(timer);
+  }, [exportJob]);
+
+  const startExport = async (format) => {
+    try {
+      const response = await axios.post(`${API}/reports/exports`, {
+        format,
+        start_date: startDate,
+        end_date: endDate,
+        status: filterStatus !== "all" ? filterStatus : null,
+      });
+      setExportJob(response.data);
+      toast.info("Rapor hazırlanıyor");
+    } catch (error) {
+      toast.error(error.response?.data?.detail || "Rapor başlatılamadı");
+    }
   };
 
+  const exportRunning = exportJob && (exportJob.status === "queued" || exportJob.status === "running");
+
   const getStatusIcon = (status) => {
     switch (status) {
       case "allowed":
@@ -111,10 +145,25 @@ const Reports = () => {
           <h1 className="text-3xl font-bold">Raporlar</h1>
           <p className="text-zinc-400 mt-1">Tespit geçmişini görüntüleyin ve dışa aktarın</p>
         </div>
-        <Button data-testid="export-pdf-btn" onClick={exportToPDF} className="bg-emerald-600 hover:bg-emerald-700">
-          <Download className="h-4 w-4 mr-2" />
-          PDF İndir
-        </Button>
+        <div className="flex items-center gap-2">
+          {exportRunning && (
+            <span data-testid="export-progress" className="text-sm text-zinc-400">
+              %{Math.round((exportJob.progress || 0) * 100)}
+            </span>
+          )}
+          <Button data-testid="export-csv-btn" onClick={() => startExport("csv")} disabled={exportRunning} variant="outline">
+            <FileText className="h-4 w-4 mr-2" />
+            CSV
+          </Button>
+          <Button data-testid="export-xlsx-btn" onClick={() => startExport("xlsx")} disabled={exportRunning} variant="outline">
+            <FileText className="h-4 w-4 mr-2" />
+            Excel
+          </Button>
+          <Button data-testid="export-pdf-btn" onClick={() => startExport("pdf")} disabled={exportRunning} className="bg-emerald-600 hover:bg-emerald-700">
+            <Download className="h-4 w-4 mr-2" />
+            PDF İndir
+          </Button>
+        </div>
       </div>
 
       {/* Filters */}
@@ -0,0 +1,124 @@
+"""Shared fixtures for the backend unit tests.
+
+server.py is imported directly; its MongoDB handle is swapped for the small
+in-memory stand-in below, so the tests need no database. Only the query
+features the code under test uses are implemented.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# server.py reads these at import time; nothing connects until a query runs
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "lpr_test")
+
+import server  # noqa: E402
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        value = doc.get(key)
+        if isinstance(condition, dict):
+            if "$in" in condition:
+                values = value if isinstance(value, list) else [value]
+                if not any(v in condition["$in"] for v in values):
+                    return False
+            if "$lt" in condition and not (value is not None and value < condition["$lt"]):
+                return False
+        elif isinstance(value, list):
+            if condition not in value:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self.docs:
+                yield doc
+        return iterate()
+
+    async def to_list(self, length=None):
+        return list(self.docs[:length] if length else self.docs)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = []
+        self.unique = set()  # fields with a unique index
+        self.reject = None  # callable(doc) -> error dict or None, to simulate server-side rejections
+        self.attempts = []  # every document sent to insert_many, in order
+        self.indexes = {}
+
+    def find(self, query=None, projection=None):
+        return FakeCursor([dict(doc) for doc in self.docs if matches(doc, query or {})])
+
+    async def find_one(self, query=None, projection=None):
+        found = self.find(query).docs
+        return found[0] if found else None
+
+    async def create_index(self, keys, **options):
+        if options.get("unique") and isinstance(keys, str):
+            self.unique.add(keys)
+        self.indexes[options.get("name", str(keys))] = options
+
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    async def update_one(self, query, update, upsert=False):
+        for doc in self.docs:
+            if matches(doc, query):
+                doc.update(update.get("$set", {}))
+                return
+        if upsert:
+            self.docs.append({**query, **update.get("$set", {})})
+
+    async def insert_many(self, documents, ordered=True):
+        errors = []
+        inserted = 0
+        for index, doc in enumerate(documents):
+            self.attempts.append(doc)
+            error = self.reject(doc) if self.reject else None
+            if error is None and any(any(d.get(f) == doc.get(f) for d in self.docs) for f in self.unique):
+                error = {"code": 11000, "errmsg": "E11000 duplicate key error"}
+            if error is not None:
+                errors.append(dict(error, index=index))
+                if ordered:
+                    break
+                continue
+            self.docs.append(dict(doc))
+            inserted += 1
+        if errors:
+            raise server.BulkWriteError({"writeErrors": errors, "nInserted": inserted})
+        return type("InsertManyResult", (), {"inserted_ids": [doc.get("id") for doc in documents]})()
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def __getattr__(self, name):
+        return self[name]
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(server, "db", database)
+    return database
@@ -0,0 +1,99 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import server
+
+TZ = ZoneInfo("Europe/Istanbul")
+
+
+@pytest.fixture(autouse=True)
+def access_tz(monkeypatch):
+    monkeypatch.setattr(server, "ACCESS_TZ", TZ)
+
+
+def record(**overrides):
+    base = {
+        "id": "r1", "plates": ["34ABC123"], "status": "allowed", "valid_until": "2030-12-31",
+        "owner_name": "Sakin", "block_name": "A Blok", "apartment_number": "5",
+    }
+    base.update(overrides)
+    return base
+
+
+def at(*args):
+    return datetime(*args, tzinfo=TZ)
+
+
+def reason(policy, when, door_id=None):
+    return policy.evaluate("34ABC123", door_id, when)["reason"]
+
+
+def test_registered_plate_is_allowed_with_owner_info():
+    decision = server.AccessPolicy([record()]).evaluate("34ABC123", None, at(2024, 5, 1, 12, 0))
+    assert decision == {"status": "allowed", "reason": "ok",
+                        "owner_info": {"owner_name": "Sakin", "apartment": "A Blok - 5"}}
+
+
+def test_unknown_plate():
+    decision = server.AccessPolicy([record()]).evaluate("06XY999")
+    assert decision["status"] == "unknown"
+    assert decision["reason"] == "not_registered"
+
+
+def test_blocked_takes_precedence():
+    policy = server.AccessPolicy([record(status="blocked", valid_until="2000-01-01")])
+    assert reason(policy, at(2024, 5, 1, 12, 0)) == "blocked"
+
+
+def test_bare_valid_until_date_lasts_the_whole_day():
+    policy = server.AccessPolicy([record(valid_until="2024-05-01")])
+    assert reason(policy, at(2024, 5, 1, 23, 59)) == "ok"
+    assert reason(policy, at(2024, 5, 2, 0, 0)) == "expired"
+
+
+def test_door_restriction():
+    policy = server.AccessPolicy([record(door_ids=["door-1"])])
+    assert reason(policy, at(2024, 5, 1, 12, 0), "door-1") == "ok"
+    assert reason(policy, at(2024, 5, 1, 12, 0), "door-2") == "door_not_permitted"
+
+
+def test_schedule_window_edges():
+    # 2024-05-01 is a Wednesday (weekday 2)
+    policy = server.AccessPolicy([record(schedule=[{"days": [2], "start": "08:00", "end": "18:00"}])])
+    assert reason(policy, at(2024, 5, 1, 7, 59)) == "outside_schedule"
+    assert reason(policy, at(2024, 5, 1, 8, 0)) == "ok"
+    assert reason(policy, at(2024, 5, 1, 17, 59)) == "ok"
+    assert reason(policy, at(2024, 5, 1, 18, 0)) == "outside_schedule"
+    assert reason(policy, at(2024, 5, 2, 12, 0)) == "outside_schedule"
+
+
+def test_overnight_window_runs_into_the_next_day():
+    policy = server.AccessPolicy([record(schedule=[{"days": [0], "start": "22:00", "end": "06:00"}])])
+    assert reason(policy, at(2024, 4, 29, 23, 0)) == "ok"  # Monday night
+    assert reason(policy, at(2024, 4, 30, 5, 59)) == "ok"  # Tuesday morning
+    assert reason(policy, at(2024, 4, 30, 6, 0)) == "outside_schedule"
+    assert reason(policy, at(2024, 4, 29, 5, 0)) == "outside_schedule"  # Monday morning belongs to Sunday
+
+
+def test_sunday_night_window_wraps_to_monday():
+    policy = server.AccessPolicy([record(schedule=[{"days": [6], "start": "22:00", "end": "02:00"}])])
+    assert reason(policy, at(2024, 5, 5, 23, 30)) == "ok"  # Sunday
+    assert reason(policy, at(2024, 5, 6, 1, 0)) == "ok"  # Monday
+    assert reason(policy, at(2024, 5, 6, 2, 0)) == "outside_schedule"
+
+
+def test_time_is_evaluated_in_the_access_time_zone():
+    policy = server.AccessPolicy([record(schedule=[{"days": [2], "start": "08:00", "end": "09:00"}])])
+    # 05:30 UTC is 08:30 in Istanbul
+    assert reason(policy, datetime(2024, 5, 1, 5, 30, tzinfo=ZoneInfo("UTC"))) == "ok"
+
+
+def test_identical_schedules_share_one_mask():
+    schedule = [{"days": [0, 1], "start": "07:00", "end": "19:00"}]
+    policy = server.AccessPolicy([
+        record(id="r1", plates=["34ABC123"], schedule=schedule),
+        record(id="r2", plates=["06XY999"], schedule=[dict(schedule[0])]),
+    ])
+    assert policy.rules["34ABC123"]["schedule"] is policy.rules["06XY999"]["schedule"]
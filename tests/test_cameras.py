@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+import server
+
+CAMERA = {"name": "Giriş", "type": "rtsp", "url": "rtsp://10.0.0.5/stream", "door_id": "door-1"}
+
+
+@pytest.fixture
+def applied(monkeypatch):
+    calls = []
+
+    async def apply(camera):
+        calls.append(camera)
+    monkeypatch.setattr(server.camera_supervisor, "apply", apply)
+    monkeypatch.setattr(server, "CLUSTER_MODE", False)
+    return calls
+
+
+def test_update_without_enabled_keeps_a_stopped_camera_stopped(fake_db, applied):
+    fake_db.cameras.docs.append(dict(CAMERA, id="cam-1", enabled=False))
+
+    camera = asyncio.run(server.update_camera("cam-1", server.CameraUpdate(**dict(CAMERA, fps=10))))
+
+    assert camera.enabled is False
+    assert fake_db.cameras.docs[0]["enabled"] is False
+    assert fake_db.cameras.docs[0]["fps"] == 10
+    assert applied[0]["enabled"] is False
+
+
+def test_update_can_still_enable_explicitly(fake_db, applied):
+    fake_db.cameras.docs.append(dict(CAMERA, id="cam-1", enabled=False))
+
+    camera = asyncio.run(server.update_camera("cam-1", server.CameraUpdate(**dict(CAMERA, enabled=True))))
+
+    assert camera.enabled is True
+
+
+def test_update_of_unknown_camera_is_404(fake_db, applied):
+    with pytest.raises(server.HTTPException) as raised:
+        asyncio.run(server.update_camera("missing", server.CameraUpdate(**CAMERA)))
+    assert raised.value.status_code == 404
+    assert applied == []
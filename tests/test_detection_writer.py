@@ -0,0 +1,88 @@
+import asyncio
+
+import server
+
+
+def make_writer(tmp_path, **kwargs):
+    return server.DetectionWriter(spool_dir=tmp_path, batch_size=2, **kwargs)
+
+
+def spool(writer, docs):
+    writer._append_spool(docs)
+
+
+def docs(count, invalid=()):
+    return [{"id": f"d{i}", "plate": "34ABC123", **({"invalid": True} if i in invalid else {})} for i in range(count)]
+
+
+def stored_ids(collection):
+    return [doc["id"] for doc in collection.docs]
+
+
+def test_invalid_document_is_dead_lettered_and_valid_ones_written_once(tmp_path, fake_db):
+    detections = fake_db.detections
+    detections.unique = {"id"}
+    detections.reject = lambda doc: {"code": 121, "errmsg": "Document failed validation"} if doc.get("invalid") else None
+    writer = make_writer(tmp_path)
+    spool(writer, docs(5, invalid={2}))
+
+    async def scenario():
+        await writer._replay()
+        await writer._replay()  # nothing left to do
+    asyncio.run(scenario())
+
+    assert stored_ids(detections) == ["d0", "d1", "d3", "d4"]
+    assert [doc["id"] for doc in detections.attempts] == ["d0", "d1", "d2", "d3", "d4"]
+    assert not writer.spool_path.exists()
+    assert not writer.replay_path.exists()
+    assert not writer.replay_offset_path.exists()
+    dead = [server.json_util.loads(line) for line in writer.dead_letter_path.read_text().splitlines()]
+    assert [entry["doc"]["id"] for entry in dead] == ["d2"]
+    assert dead[0]["error"]["code"] == 121
+
+
+def test_replay_resumes_after_the_last_stored_batch(tmp_path, fake_db):
+    detections = fake_db.detections
+    detections.unique = {"id"}
+    outage = {"on": True}
+    # d3 hits a primary stepdown on the first pass, so the second batch fails retryably
+    detections.reject = lambda doc: {"code": 189, "errmsg": "primary stepped down"} if outage["on"] and doc["id"] == "d3" else None
+    writer = make_writer(tmp_path)
+    spool(writer, docs(6))
+
+    asyncio.run(writer._replay())
+    assert stored_ids(detections) == ["d0", "d1", "d2"]
+    assert writer.replay_path.exists()
+    assert writer.replay_offset_path.read_text() == "2"
+
+    outage["on"] = False
+    detections.attempts.clear()
+    asyncio.run(writer._replay())
+    # The first batch is not sent again; d2 is, and its duplicate key error is ignored
+    assert [doc["id"] for doc in detections.attempts] == ["d2", "d3", "d4", "d5"]
+    assert stored_ids(detections) == ["d0", "d1", "d2", "d3", "d4", "d5"]
+    assert not writer.replay_path.exists()
+    assert not writer.dead_letter_path.exists()
+
+
+def test_failed_flush_is_spooled_and_duplicates_are_ignored(tmp_path, fake_db):
+    detections = fake_db.detections
+    detections.unique = {"id"}
+    detections.docs.append({"id": "d0"})
+    writer = make_writer(tmp_path)
+
+    async def scenario():
+        return await writer._insert(docs(2))
+    assert asyncio.run(scenario()) == []
+    assert stored_ids(detections) == ["d0", "d1"]
+    assert writer.written == 1
+
+
+def test_time_series_replay_skips_stored_ids(tmp_path, fake_db):
+    detections = fake_db.detections  # no unique index, like a time-series collection
+    detections.docs.append({"id": "d1"})
+    writer = make_writer(tmp_path, dedupe_replay=True)
+    spool(writer, docs(3))
+
+    asyncio.run(writer._replay())
+    assert sorted(stored_ids(detections)) == ["d0", "d1", "d2"]
@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from starlette.requests import Request
+
+import server
+
+
+def upload(body: bytes, content_type: str = "application/x-ndjson") -> Request:
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    scope = {
+        "type": "http", "method": "POST", "path": "/api/plates/import", "query_string": b"",
+        "headers": [(b"content-type", content_type.encode())],
+    }
+    return Request(scope, receive)
+
+
+def plate_row(plate: str, **overrides):
+    row = {
+        "site_id": "site-1", "block_name": "A Blok", "apartment_number": "1", "owner_name": "Sakin",
+        "plates": [plate], "valid_until": "2030-12-31", "status": "allowed",
+    }
+    row.update(overrides)
+    return json.dumps(row)
+
+
+def run_import(body: str, dry_run: bool = False):
+    return asyncio.run(server.import_plates(upload(body.encode()), format="ndjson", dry_run=dry_run))
+
+
+def test_mixed_ndjson_reports_bad_rows_and_imports_the_rest(fake_db):
+    body = "\n".join([
+        plate_row("34ABC123"),
+        "[1]",
+        '"x"',
+        "null",
+        "{not json",
+        plate_row("not a plate"),
+        plate_row("34 abc 123"),  # same plate as row 1 once normalized
+        plate_row("06XY999"),
+    ])
+    result = run_import(body)
+
+    assert result["received"] == 8
+    assert result["inserted"] == 2
+    errors = {error["row"]: error["error"] for error in result["errors"]}
+    assert sorted(errors) == [2, 3, 4, 5, 6, 7]
+    assert errors[2] == "Expected a JSON object, got list"
+    assert errors[3] == "Expected a JSON object, got str"
+    assert errors[4] == "Expected a JSON object, got NoneType"
+    assert errors[5].startswith("Invalid JSON")
+    assert "already appears in row 1" in errors[7]
+    assert sorted(p for doc in fake_db.plates.docs for p in doc["plates"]) == ["06XY999", "34ABC123"]
+
+
+def test_plates_already_registered_are_rejected(fake_db):
+    fake_db.plates.docs.append({"id": "existing", "plates": ["34ABC123"]})
+    result = run_import(plate_row("34ABC123") + "\n" + plate_row("06XY999"))
+
+    assert result["inserted"] == 1
+    assert result["errors"] == [{"row": 1, "error": "Plate already registered: 34ABC123"}]
+
+
+def test_dry_run_validates_without_writing(fake_db):
+    result = run_import(plate_row("34ABC123") + "\n[]", dry_run=True)
+
+    assert result["inserted"] == 1
+    assert result["failed"] == 1
+    assert fake_db.plates.docs == []
@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("typed, expected", [
+    ("34ABC123", "34ABC123"),
+    ("34 abc 123", "34ABC123"),
+    ("34-ABC-123", "34ABC123"),
+    ("06xy999", "06XY999"),
+    ("34abc1234", "34ABC1234"),
+    ("", None),
+    ("ABCDEF", None),
+])
+def test_normalize_plate(typed, expected):
+    assert server.normalize_plate(typed) == expected
+
+
+def test_migration_normalizes_plates_and_drops_duplicates(fake_db):
+    fake_db.plates.docs.extend([
+        {"id": "first", "plates": ["34 abc 123", "34ABC123"], "created_at": "2024-01-01"},
+        {"id": "second", "plates": ["34-ABC-123", "06xy999"], "created_at": "2024-02-01"},
+        {"id": "odd", "plates": ["foreign 1"], "created_at": "2024-03-01"},
+    ])
+
+    asyncio.run(server.ensure_plate_index())
+
+    plates = {doc["id"]: doc["plates"] for doc in fake_db.plates.docs}
+    assert plates == {"first": ["34ABC123"], "second": ["06XY999"], "odd": ["FOREIGN1"]}
+    migration = fake_db.migrations.docs[0]
+    assert migration["id"] == server.PLATE_INDEX_MIGRATION
+    assert migration["conflicts"] == 1
+    assert fake_db.plates.indexes["plates_unique"]["unique"] is True
+
+
+def test_migration_runs_once(fake_db):
+    fake_db.migrations.docs.append({"id": server.PLATE_INDEX_MIGRATION})
+    fake_db.plates.docs.append({"id": "first", "plates": ["34 abc 123"]})
+
+    asyncio.run(server.ensure_plate_index())
+
+    assert fake_db.plates.docs[0]["plates"] == ["34 abc 123"]
+    assert "plates_unique" in fake_db.plates.indexes
+
@@ -0,0 +1,69 @@
+import asyncio
+
+from starlette.requests import Request
+
+import server
+
+
+def door(door_id):
+    return {"id": door_id, "name": f"Kapı {door_id}", "ip": "10.0.0.9", "endpoint": "/kapiac"}
+
+
+def request(etag=None):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/api/doors", "query_string": b"", "headers": headers})
+
+
+def test_reads_are_served_from_memory_until_invalidated(fake_db):
+    fake_db.doors.docs.append(door("d1"))
+    cache = server.CachedCollection("doors", server.Door, ttl=300)
+
+    async def scenario():
+        first = await cache.get()
+        fake_db.doors.docs.append(door("d2"))
+        cached = await cache.get()
+        cache.invalidate(broadcast=False)
+        reloaded = await cache.get()
+        return first, cached, reloaded
+    first, cached, reloaded = asyncio.run(scenario())
+
+    assert cached is first
+    assert [d.id for d in first.value] == ["d1"]
+    assert [d.id for d in reloaded.value] == ["d1", "d2"]
+    assert reloaded.etag != first.etag
+
+
+def test_load_overlapping_an_invalidation_is_not_kept(fake_db):
+    cache = server.CachedCollection("doors", server.Door, ttl=300)
+
+    async def fetch():
+        cache.invalidate(broadcast=False)  # a write lands while the load is in flight
+        return []
+    cache._fetch = fetch
+
+    entry = asyncio.run(cache.get())
+    assert entry.value == []
+    assert cache.entry is None
+
+
+def test_etag_revalidation_returns_304(fake_db):
+    fake_db.doors.docs.append(door("d1"))
+    cache = server.CachedCollection("doors", server.Door, ttl=300)
+
+    full = asyncio.run(server.cached_response(request(), cache))
+    etag = full.headers["etag"]
+    not_modified = asyncio.run(server.cached_response(request(etag), cache))
+    stale = asyncio.run(server.cached_response(request('"other"'), cache))
+
+    assert full.status_code == 200 and full.body.startswith(b"[")
+    assert not_modified.status_code == 304 and not_modified.body == b""
+    assert not_modified.headers["etag"] == etag
+    assert stale.status_code == 200
+
+
+def test_missing_settings_document_serves_defaults(fake_db):
+    cache = server.CachedDocument("settings", server.Settings, "system_settings")
+    settings = asyncio.run(cache.items())
+    assert settings.id == "system_settings"
+    assert settings.engine == server.Settings().engine
+    assert fake_db.settings.docs == []
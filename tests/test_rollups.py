@@ -0,0 +1,65 @@
+import asyncio
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import server
+
+
+@pytest.fixture(autouse=True)
+def access_tz(monkeypatch):
+    monkeypatch.setattr(server, "ACCESS_TZ", ZoneInfo("Europe/Istanbul"))
+
+
+def detection(hour, minute, status="allowed", plate="34ABC123", camera_id="cam"):
+    return {"timestamp": datetime(2024, 5, 1, hour, minute, tzinfo=timezone.utc), "camera_id": camera_id,
+            "status": status, "plate": plate, "owner_info": {"owner_name": "Sakin", "apartment": "A - 1"}}
+
+
+def test_counts_are_summed_per_hour_day_and_plate():
+    rollups = server.DetectionRollups()
+    rollups.add([detection(10, 5), detection(10, 40), detection(11, 0, status="blocked"), detection(22, 30)])
+
+    hour = datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    assert rollups.hourly[(hour, "cam", "allowed")] == 2
+    # 22:30 UTC is already 2 May in Istanbul
+    assert rollups.daily == {("2024-05-01", "cam", "allowed"): 2, ("2024-05-01", "cam", "blocked"): 1,
+                             ("2024-05-02", "cam", "allowed"): 1}
+    entry = rollups.plates[("2024-05-01", "34ABC123", "cam")]
+    assert (entry["count"], entry["allowed"], entry["blocked"]) == (3, 2, 1)
+    assert entry["first_seen"].hour == 10 and entry["last_seen"].hour == 11
+
+
+def test_naive_timestamps_from_the_spool_are_utc():
+    rollups = server.DetectionRollups()
+    doc = detection(22, 30)
+    doc["timestamp"] = doc["timestamp"].replace(tzinfo=None)
+    rollups.add([doc])
+    assert ("2024-05-02", "cam", "allowed") in rollups.daily
+
+
+def test_operations_use_the_same_ids_as_rebuild():
+    rollups = server.DetectionRollups()
+    rollups.add([detection(10, 5)])
+    operations = rollups._operations(rollups.hourly, rollups.daily, rollups.plates)
+    daily = operations["rollups_daily"][0]._filter
+    plates = operations["rollups_plates_daily"][0]._doc
+    assert daily == {"_id": {"d": "2024-05-01", "c": "cam", "s": "allowed"}}
+    assert plates["$inc"] == {"count": 1, "allowed": 1}
+    assert plates["$set"] == {"owner_name": "Sakin", "apartment": "A - 1"}
+
+
+def test_failed_flush_keeps_the_increments(fake_db):
+    async def fail(operations, ordered=True):
+        raise server.PyMongoError("not primary")
+    fake_db.rollups_hourly.bulk_write = fail
+
+    rollups = server.DetectionRollups()
+    rollups.add([detection(10, 5)])
+    asyncio.run(rollups.flush())
+    rollups.add([detection(10, 6)])
+
+    assert rollups.last_error == "not primary"
+    assert rollups.daily[("2024-05-01", "cam", "allowed")] == 2
+    assert rollups.plates[("2024-05-01", "34ABC123", "cam")]["count"] == 2
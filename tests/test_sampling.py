@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+import camera_workers
+import server
+
+
+@pytest.fixture
+def controller():
+    sampling = server.SamplingController()
+    sampling.inference_seconds = 0.25  # one worker manages 4/s, 3.2/s with headroom
+    return sampling
+
+
+def rates(controller):
+    return {camera_id: 1.0 / state["inference_interval"] for camera_id, state in controller.cameras.items()}
+
+
+def test_busy_gate_gets_the_budget_and_idle_gate_the_minimum(controller):
+    controller.register("busy", {"fps": 15})
+    controller.register("idle", {"fps": 15})
+    controller.observe("busy", 1.0)
+    controller.observe("idle", 0.0)
+
+    controller.rebalance()
+
+    allotted = rates(controller)
+    assert allotted["idle"] == pytest.approx(server.SAMPLING_MIN_INFERENCE_FPS)
+    assert allotted["busy"] > 10 * allotted["idle"]
+    assert allotted["busy"] <= controller.capacity()
+    assert 1.0 / controller.cameras["idle"]["capture_interval"] == min(15, server.SAMPLING_IDLE_FPS)
+    assert 1.0 / controller.cameras["busy"]["capture_interval"] == 15
+
+
+def test_plate_in_view_holds_a_quiet_camera_busy(controller):
+    controller.register("cam", {"fps": 15})
+    controller.observe("cam", 0.0, plate_in_view=True)
+    controller.rebalance()
+    assert rates(controller)["cam"] > server.SAMPLING_MIN_INFERENCE_FPS
+
+
+def test_cpu_pressure_backs_off_and_recovers_slowly(controller):
+    controller.register("cam", {"fps": 15})
+    controller.cpu_percent = server.SAMPLING_CPU_BUDGET + 10
+    controller.rebalance()
+    assert controller.factor == pytest.approx(0.8)
+
+    controller.cpu_percent = 0
+    controller.rebalance()
+    assert controller.factor == pytest.approx(0.85)
+
+
+def test_backlog_backs_off(controller):
+    controller.register("cam", {"fps": 15})
+    controller.observe("cam", 1.0, backlog=controller.workers + 1)
+    controller.rebalance()
+    assert controller.factor < 1.0
+
+
+def test_controls_array_follows_the_schedule(controller):
+    controls = [0.0, 0.0]
+    controller.register("cam", {"fps": 10}, controls)
+    assert controls[0] == pytest.approx(0.1)
+    controller.observe("cam", 0.0)
+    controller.rebalance()
+    assert controls[1] == pytest.approx(1.0 / server.SAMPLING_MIN_INFERENCE_FPS)
+
+
+def test_should_infer_respects_the_deadline(controller):
+    controller.register("cam", {"fps": 15})
+    assert controller.should_infer("cam")
+    assert not controller.should_infer("cam")
+    assert not controller.should_infer("unknown")
+
+
+def test_skipped_frames_do_not_move_the_inference_average(controller):
+    controller.register("cam", {"fps": 15})
+    controller.observe("cam", 0.5, inference_seconds=None)
+    assert controller.inference_seconds == 0.25
+    controller.observe("cam", 0.5, inference_seconds=0.35)
+    assert controller.inference_seconds == pytest.approx(0.26)
+
+
+def test_unregister_forgets_the_camera(controller):
+    controller.register("cam", {"fps": 15})
+    controller.unregister("cam")
+    assert controller.cameras == {}
+    assert controller.status()["cameras"] == {}
+
+
+def test_deadline_keeps_a_fixed_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(camera_workers.time, "monotonic", lambda: now[0])
+    deadline = camera_workers.Deadline()
+    now[0] += 0.03  # work took 30 ms of a 100 ms period
+    assert deadline.advance(0.1) == pytest.approx(0.07)
+    now[0] = 100.5  # fell far behind: skip the missed slots instead of bursting
+    assert deadline.advance(0.1) == 0.0
+    assert deadline.advance(0.1) == pytest.approx(0.1)
+
+
+def test_activity_from_frame_difference():
+    still = np.zeros((480, 640, 3), np.uint8)
+    activity, previous = camera_workers.measure_activity(still, None)
+    assert activity == 0.0
+    assert camera_workers.measure_activity(still, previous)[0] == 0.0
+    moved = still.copy()
+    moved[100:300, 200:400] = 255
+    assert camera_workers.measure_activity(moved, previous)[0] == 1.0
+
+
+class StubEngine(server.PlateRecognitionEngine):
+    def __init__(self):
+        super().__init__()
+        self.initialized = True
+        self.now = 1000.0
+        self.clock = lambda: self.now
+
+    def locate_plate(self, frame):
+        return None
+
+
+def test_detect_trace_covers_inference_only():
+    engine = StubEngine()
+    trace = {}
+    assert engine.detect(object(), "cam", trace) is None
+    assert set(trace) == {"locate", "inference"}
+    assert trace["inference"] >= trace["locate"]
+
+
+def test_detect_trace_is_empty_during_cooldown():
+    engine = StubEngine()
+    engine.last_detection_time = engine.now - engine.detection_cooldown / 2
+    trace = {}
+    assert engine.detect(object(), "cam", trace) is None
+    assert trace == {}
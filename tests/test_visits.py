@@ -0,0 +1,112 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+import server
+
+ALLOWED = {"status": "allowed", "reason": "ok", "owner_info": {"owner_name": "Sakin", "apartment": "A - 1"}}
+UNKNOWN = {"status": "unknown", "reason": "not_registered", "owner_info": None}
+
+
+class Writer:
+    def __init__(self):
+        self.docs = []
+
+    def submit(self, doc):
+        self.docs.append(doc)
+
+
+@pytest.fixture
+def tracker():
+    return server.VisitTracker(Writer(), window=30)
+
+
+def test_repeated_reads_merge_into_one_visit(tracker):
+    visit, transition = tracker.observe("cam", "34ABC123", ALLOWED, 0.8, "img1", "det1")
+    assert transition == "opened"
+    merged, transition = tracker.observe("cam", "34ABC123", ALLOWED, 0.9, "img2", "det2")
+    assert transition is None
+    assert merged is visit
+    assert visit["recognitions"] == 2
+    # A better snapshot from a merged read is kept on the visit itself
+    assert visit["best_image_base64"] == "img2"
+    assert visit["best_detection_id"] is None
+
+
+def test_lower_confidence_read_keeps_the_best_snapshot(tracker):
+    visit, _ = tracker.observe("cam", "34ABC123", ALLOWED, 0.9, "img1", "det1")
+    tracker.observe("cam", "34ABC123", ALLOWED, 0.5, "img2", "det2")
+    assert visit["best_image_base64"] == "img1"
+    assert visit["best_detection_id"] == "det1"
+
+
+def test_status_change_is_a_transition(tracker):
+    tracker.observe("cam", "34ABC123", UNKNOWN, 0.8, None, "det1")
+    visit, transition = tracker.observe("cam", "34ABC123", ALLOWED, 0.8, None, "det2")
+    assert transition == "status_changed"
+    assert visit["status"] == "allowed"
+    assert visit["owner_info"] == ALLOWED["owner_info"]
+
+
+def test_cameras_and_plates_are_separate_visits(tracker):
+    tracker.observe("cam-1", "34ABC123", ALLOWED, 0.8, None, "det1")
+    assert tracker.observe("cam-2", "34ABC123", ALLOWED, 0.8, None, "det2")[1] == "opened"
+    assert tracker.observe("cam-1", "06XY999", ALLOWED, 0.8, None, "det3")[1] == "opened"
+    assert len(tracker.open) == 3
+
+
+def test_read_after_the_window_closes_the_old_visit(tracker):
+    first, _ = tracker.observe("cam", "34ABC123", ALLOWED, 0.8, "img", "det1")
+    first["last_seen"] -= timedelta(seconds=31)
+
+    second, transition = tracker.observe("cam", "34ABC123", ALLOWED, 0.8, None, "det2")
+
+    assert transition == "opened"
+    assert second["id"] != first["id"]
+    saved = tracker.writer.docs
+    assert [doc["id"] for doc in saved] == [first["id"]]
+    assert saved[0]["state"] == "closed"
+    assert saved[0]["revision"] == 1
+    # The snapshot lives in detection det1, so it is not copied into the visit
+    assert "best_image_base64" not in saved[0]
+
+
+def test_find_returns_open_visits_only(tracker):
+    visit, _ = tracker.observe("cam", "34ABC123", ALLOWED, 0.8, None, "det1")
+    assert tracker.find(visit["id"]) is visit
+    tracker.close(("cam", "34ABC123"))
+    assert tracker.find(visit["id"]) is None
+
+
+def test_payload_is_json_safe(tracker):
+    visit, _ = tracker.observe("cam", "34ABC123", ALLOWED, 0.8, "img", "det1")
+    payload = server.visit_payload(visit)
+    assert "best_image_base64" not in payload
+    assert isinstance(payload["first_seen"], str)
+    assert payload["image_url"] == f"/api/visits/{visit['id']}/image"
+
+
+def test_failed_door_open_is_retried_on_the_next_read(monkeypatch, tracker):
+    outcomes = [False, True]
+    triggered = []
+
+    async def trigger_door(camera_id):
+        triggered.append(camera_id)
+        return outcomes.pop(0)
+    monkeypatch.setattr(server, "trigger_door", trigger_door)
+    monkeypatch.setattr(server, "visit_tracker", tracker)
+    monkeypatch.setattr(server, "detection_writer", Writer())
+
+    async def read():
+        detected = {"plate": "34ABC123", "decision": ALLOWED, "confidence": 0.8, "image_base64": None}
+        return await server.publish_detection("cam", {"detections": 0}, detected)
+
+    async def scenario():
+        for _ in range(3):
+            assert await read() == "allowed"
+    asyncio.run(scenario())
+
+    # Opened on the merged second read; the third read does not trigger again
+    assert triggered == ["cam", "cam"]
+    assert tracker.open[("cam", "34ABC123")]["door_opened"] is True